@@ -0,0 +1,195 @@
+import time
+import uuid
+import asyncio
+import logging
+from contextlib import contextmanager
+import grpc
+import torch
+import model_pb2
+import model_pb2_grpc
+import wire
+from grpc_client import (GRPC_OPTIONS, KEEPALIVE_OPTIONS, CHANNEL_IDLE_TIMEOUT, STREAM_THRESHOLD, RETRYABLE_CODES,
+                         backoff_delay, EncodedUpload)
+
+logger = logging.getLogger(__name__)
+
+
+def create_channel(address, use_ssl=False, ssl_cert=None):
+    """Open a grpc.aio channel to a peer, secured with ssl_cert if use_ssl is set"""
+    if use_ssl and ssl_cert:
+        with open(ssl_cert, 'rb') as f:
+            credentials = grpc.ssl_channel_credentials(f.read())
+        return grpc.aio.secure_channel(address, credentials, options=GRPC_OPTIONS + KEEPALIVE_OPTIONS)
+    return grpc.aio.insecure_channel(address, options=GRPC_OPTIONS + KEEPALIVE_OPTIONS)
+
+
+class _AsyncPooledChannel:
+    def __init__(self, channel):
+        self.channel = channel
+        self.stub = model_pb2_grpc.FLPeerStub(channel)
+        # SendModel taking already serialized ModelWeights bytes
+        self.send_serialized = channel.unary_unary('/fl.FLPeer/SendModel', request_serializer=None,
+                                                   response_deserializer=model_pb2.Ack.FromString)
+        self.active = 0  # RPCs in flight
+        self.last_used = time.monotonic()
+
+
+class AsyncChannelPool:
+    """
+    grpc_client.ChannelPool for grpc.aio: one long-lived channel per
+    (address, credentials) on the running event loop. Channels with no RPC
+    in flight for idle_timeout seconds are closed.
+    """
+    def __init__(self, idle_timeout=CHANNEL_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._channels = {}
+
+    @contextmanager
+    def checkout(self, address, use_ssl=False, ssl_cert=None):
+        """The pooled channel entry for address, counted as in use for the duration of the with block"""
+        self._evict_idle()
+        key = (address, ssl_cert if use_ssl else None)
+        entry = self._channels.get(key)
+        if entry is None:
+            entry = self._channels[key] = _AsyncPooledChannel(create_channel(address, use_ssl, ssl_cert))
+        entry.active += 1
+        try:
+            yield entry
+        finally:
+            entry.active -= 1
+            entry.last_used = time.monotonic()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, entry in list(self._channels.items()):
+            if entry.active == 0 and now - entry.last_used > self.idle_timeout:
+                logger.info(f"Closing idle channel to {key[0]}")
+                asyncio.ensure_future(entry.channel.close(grace=None))
+                del self._channels[key]
+
+    def states(self):
+        """{address: grpc.ChannelConnectivity} of every pooled channel"""
+        return {key[0]: entry.channel.get_state() for key, entry in self._channels.items()}
+
+    async def close(self):
+        for entry in self._channels.values():
+            await entry.channel.close()
+        self._channels.clear()
+
+
+# One pool per event loop run; created by the first call on the loop
+_pools = {}
+
+
+def channel_pool():
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        _pools.clear()  # Channels of a finished loop cannot be used on a new one
+        _pools[loop] = AsyncChannelPool()
+    return _pools[loop]
+
+
+async def health_check(address, node_id="", timeout=2, use_ssl=False, ssl_cert=None):
+    """Round-trip time to a peer in seconds, or None if it did not answer"""
+    start = time.perf_counter()
+    try:
+        with channel_pool().checkout(address, use_ssl, ssl_cert) as entry:
+            await entry.stub.HealthCheck(model_pb2.HealthCheckRequest(peer_id=node_id), timeout=timeout)
+        return time.perf_counter() - start
+    except grpc.RpcError:
+        return None
+
+
+async def send_model_stream(state_dict, address="localhost:50051", round_num=1, chunk_size=wire.CHUNK_SIZE,
+                            timeout=300, max_resumes=3, base_delay=1.0, use_ssl=False, ssl_cert=None, node_id=None,
+                            executor=None):
+    """
+    Coroutine version of grpc_client.send_model_stream. A state_dict is encoded
+    into an EncodedUpload on executor, so encoding and hashing never block the event loop.
+    """
+    upload_id = f"{node_id or 'node'}-{uuid.uuid4().hex}"
+    upload = state_dict
+    if not isinstance(upload, EncodedUpload):
+        upload = await asyncio.get_running_loop().run_in_executor(executor, EncodedUpload, state_dict, chunk_size)
+    with channel_pool().checkout(address, use_ssl, ssl_cert) as entry:
+        start = 0
+        for attempt in range(max_resumes + 1):
+            if attempt > 0:
+                await asyncio.sleep(backoff_delay(attempt - 1, base_delay))
+            try:
+                status = await entry.stub.SendModelStream(upload.messages(upload_id, round_num, start, node_id),
+                                                          timeout=timeout)
+                logger.info(f"Model streamed to {address} (Node: {node_id}): {status.message}")
+                return status.complete
+            except grpc.RpcError as rpc_error:
+                logger.warning(f"Upload to {address} interrupted at attempt {attempt + 1} (Node: {node_id}): "
+                               f"{rpc_error.code()}: {rpc_error.details()}")
+            try:
+                status = await entry.stub.GetUploadStatus(model_pb2.UploadStatusRequest(upload_id=upload_id),
+                                                          timeout=10)
+            except grpc.RpcError:
+                continue  # Peer unreachable: retry from the last known position
+            if status.complete:
+                return True
+            start = status.next_chunk
+        logger.error(f"Failed to stream model to {address} after {max_resumes + 1} attempts (Node: {node_id})")
+        return False
+
+
+async def _send_with_backoff(request, address, timeout, max_attempts, base_delay, use_ssl, ssl_cert):
+    outcome = {'address': address, 'success': False, 'attempts': 0, 'seconds': 0.0, 'message': '', 'error': None}
+    start = time.perf_counter()
+    for attempt in range(max_attempts):
+        if attempt > 0:
+            await asyncio.sleep(backoff_delay(attempt - 1, base_delay))
+        outcome['attempts'] = attempt + 1
+        try:
+            # Fail fast, as grpc_client._send_with_backoff: a refused peer costs the backoff, not the timeout
+            with channel_pool().checkout(address, use_ssl, ssl_cert) as entry:
+                response = await entry.send_serialized(request, timeout=timeout)
+            outcome.update(success=True, message=response.message, error=None)
+            break
+        except grpc.RpcError as rpc_error:
+            outcome['error'] = f"{rpc_error.code()}: {rpc_error.details()}"
+            if rpc_error.code() not in RETRYABLE_CODES:
+                break
+    outcome['seconds'] = time.perf_counter() - start
+    return outcome
+
+
+async def _stream_to_peer(upload, address, round_num, timeout, max_attempts, base_delay, use_ssl, ssl_cert, node_id):
+    start = time.perf_counter()
+    success = await send_model_stream(upload, address, round_num=round_num, timeout=timeout,
+                                      max_resumes=max_attempts - 1, base_delay=base_delay, use_ssl=use_ssl,
+                                      ssl_cert=ssl_cert, node_id=node_id)
+    return {'address': address, 'success': success, 'attempts': None, 'seconds': time.perf_counter() - start,
+            'message': 'streamed' if success else '', 'error': None if success else "Upload failed"}
+
+
+async def send_model_to_peers(state_dict, addresses, round_num=1, timeout=30, max_attempts=3, base_delay=1.0,
+                              use_ssl=False, ssl_cert=None, node_id=None, executor=None):
+    """
+    Coroutine version of grpc_client.send_model_to_peers: the update is
+    serialized once (on executor) and every send is a task on the event loop.
+    Yields:
+        One outcome dict per peer as its send finishes
+    """
+    if not addresses:
+        return
+    if sum(v.numel() * v.element_size() for v in state_dict.values() if torch.is_tensor(v)) > STREAM_THRESHOLD:
+        upload = await asyncio.get_running_loop().run_in_executor(executor, EncodedUpload, state_dict)
+        tasks = [_stream_to_peer(upload, addr, round_num, timeout, max_attempts, base_delay, use_ssl, ssl_cert,
+                                 node_id) for addr in addresses]
+    else:
+        weights = await asyncio.get_running_loop().run_in_executor(executor, wire.encode, state_dict)
+        request = model_pb2.ModelWeights(round=round_num, weights=weights,
+                                         format=model_pb2.TENSORS_V1).SerializeToString()
+        tasks = [_send_with_backoff(request, addr, timeout, max_attempts, base_delay, use_ssl, ssl_cert)
+                 for addr in addresses]
+    for next_done in asyncio.as_completed(tasks):
+        outcome = await next_done
+        if outcome['success']:
+            logger.info(f"Model sent to {outcome['address']} (Node: {node_id}) in {outcome['seconds']:.2f}s")
+        else:
+            logger.error(f"Failed to send model to {outcome['address']} (Node: {node_id}): {outcome['error']}")
+        yield outcome
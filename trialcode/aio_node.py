@@ -0,0 +1,118 @@
+import time
+import asyncio
+import argparse
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from tqdm import tqdm
+from grpc_server import received_models, set_current_round, set_local_evaluator
+from aio_server import start_server
+from aio_client import send_model_to_peers, channel_pool
+from fedavg import fed_avg
+from main import load_peers, get_own_ip, summarize_weights_full, state_dict_checksum, NODE_ID
+
+logger = logging.getLogger(__name__)
+
+
+async def run_round(trainer, compute, peer_addresses, own_address, global_model=None, round_num=1, epochs=3,
+                    max_retries=3, retry_delay=3):
+    """Train on the compute executor, then fan the update out to all peers. Returns local weights, successful sends"""
+    loop = asyncio.get_running_loop()
+    train_start = time.perf_counter()
+    local_weights = await loop.run_in_executor(
+        compute, partial(trainer.fit, epochs=epochs, global_state=global_model, round_num=round_num))
+    tqdm.write(f"[ROUND] Local training took {time.perf_counter() - train_start:.2f}s | "
+               f"Checksum: {state_dict_checksum(local_weights)}")
+    peers = [addr for addr in peer_addresses if addr != own_address]
+    successful_sends = 0
+    send_start = time.perf_counter()
+    async for outcome in send_model_to_peers(local_weights, peers, round_num=round_num, max_attempts=max_retries,
+                                             base_delay=retry_delay, node_id=NODE_ID, executor=compute):
+        if outcome['success']:
+            successful_sends += 1
+            tqdm.write(f"[SEND] Model sent to {outcome['address']} ({outcome['seconds']:.2f}s): {outcome['message']}")
+        else:
+            tqdm.write(f"[SEND] Failed to send model to {outcome['address']}: {outcome['error']}")
+    tqdm.write(f"[SEND] Send phase took {time.perf_counter() - send_start:.2f}s")
+    return local_weights, successful_sends
+
+
+async def run_node(rounds=10, port=50051, epochs=3, peer_timeout=300, trainer_args=None):
+    """
+    A federated node as coroutines on one event loop: the grpc.aio server,
+    the sends to peers and the round loop share it, and the loop awaits peer
+    models instead of polling. Training, evaluation and aggregation run on a
+    single-threaded compute executor (one torch job at a time, so the
+    Trainer's state is never touched concurrently); the server's decoding and
+    evaluation of peers' requests run on the loop's default executor.
+    """
+    loop = asyncio.get_running_loop()
+    compute = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compute")
+    server, servicer = await start_server(port)
+    tqdm.write(f"[INFO] grpc.aio server listening on port {port}")
+    try:
+        peer_addresses = load_peers()
+        own_address = f"{get_own_ip()}:{port}"
+        tqdm.write(f"[INFO] Own address: {own_address}")
+        tqdm.write(f"[INFO] All peers: {peer_addresses}")
+        from train import Trainer
+        from evaluation import LocalEvaluator
+        trainer = await loop.run_in_executor(compute, partial(Trainer, **(trainer_args or {})))
+        evaluator = LocalEvaluator.from_trainer(trainer)
+        set_local_evaluator(evaluator)  # Serves peers' Evaluate requests
+        total_peers = len([addr for addr in peer_addresses if addr != own_address])
+        min_required_peers = max(1, total_peers // 2)  # At least 50% of peers
+        global_model = None
+        for round_num in range(1, rounds + 1):
+            set_current_round(round_num)
+            received_models.clear()
+            tqdm.write(f"\n=== Federated Learning Round {round_num} ===")
+            if global_model is not None:
+                acc, prec, rec, f1 = await loop.run_in_executor(compute, evaluator.metrics, global_model)
+                tqdm.write(f"[EVAL][Global Model] Accuracy: {acc:.4f} | Precision: {prec:.4f} | Recall: {rec:.4f} | F1: {f1:.4f}")
+            local_model, successful_sends = await run_round(trainer, compute, peer_addresses, own_address,
+                                                            global_model, round_num, epochs)
+            if total_peers > 0 and successful_sends < min_required_peers:
+                tqdm.write(f"[ERROR] Failed to reach minimum required peers ({successful_sends}/{min_required_peers}); retrying next round")
+                await asyncio.sleep(60)
+                continue
+            if total_peers > 0:
+                tqdm.write(f"[INFO] Waiting for peer models (minimum {min_required_peers} required)")
+                try:
+                    await servicer.wait_for_models(min_required_peers, timeout=peer_timeout)
+                except asyncio.TimeoutError:
+                    tqdm.write(f"[TIMEOUT] {len(received_models)}/{min_required_peers} peer models after {peer_timeout}s; "
+                               f"aggregating what arrived")
+            all_models = [local_model] + list(received_models)
+            global_model = await loop.run_in_executor(compute, fed_avg, all_models)
+            await loop.run_in_executor(compute, torch.save, global_model, f'global_model_round_{round_num}.pt')
+            stats = summarize_weights_full(global_model)
+            tqdm.write(f"[ROUND] FedAvg complete with {len(all_models)} models | " + ", ".join(
+                [f"{k}: mean={v['mean']:.4f}, std={v['std']:.4f}" for k, v in stats.items() if 'weight' in k]))
+            tqdm.write(f"[ROUND SUMMARY] Sent models to {successful_sends}/{total_peers} peers, received "
+                       f"{len(all_models) - 1} models | Global model checksum: {state_dict_checksum(global_model)}")
+        return global_model
+    finally:
+        await channel_pool().close()
+        await server.stop(grace=5)
+        compute.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a federated node on an asyncio (grpc.aio) runtime")
+    parser.add_argument("--rounds", type=int, default=10, help="Number of federated learning rounds")
+    parser.add_argument("--port", type=int, default=50051, help="Port of this node's gRPC server")
+    parser.add_argument("--epochs", type=int, default=3, help="Local epochs per round")
+    parser.add_argument("--peer-timeout", type=float, default=300, help="Seconds to wait for peer models per round")
+    parser.add_argument("--machine-id", type=int, default=0, help="Index of this node's data partition")
+    parser.add_argument("--total-machines", type=int, default=4, help="Number of data partitions")
+    parser.add_argument("--shard-dir", default=None, help="Directory of shards written by partition.py")
+    parser.add_argument("--sparse", action='store_true', help="Feed one-hot features to the model in sparse form")
+    args = parser.parse_args()
+    trainer_args = dict(machine_id=args.machine_id, total_machines=args.total_machines, shard_dir=args.shard_dir,
+                        sparse=args.sparse)
+    try:
+        asyncio.run(run_node(args.rounds, args.port, args.epochs, args.peer_timeout, trainer_args))
+    except KeyboardInterrupt:
+        tqdm.write("[INFO] Node stopped.")
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import grpc
+import model_pb2
+import model_pb2_grpc
+import grpc_server
+from grpc_server import (FLPeerServicer, SERVER_OPTIONS, UploadRejected, get_upload, add_chunk, reject_upload,
+                         received_models)
+
+logger = logging.getLogger(__name__)
+
+
+class _CapturedContext:
+    """
+    Stands in for a grpc.aio context while a synchronous handler runs on an
+    executor thread; the status it sets is applied on the event loop afterwards.
+    """
+    def __init__(self, context):
+        self._peer = context.peer()
+        self.code = None
+        self.details = None
+
+    def peer(self):
+        return self._peer
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def apply(self, context):
+        if self.code is not None:
+            context.set_code(self.code)
+        if self.details is not None:
+            context.set_details(self.details)
+
+
+class AsyncFLPeerServicer(model_pb2_grpc.FLPeerServicer):
+    """
+    FLPeer on grpc.aio. RPCs are coroutines on one event loop, so an idle or
+    slow peer connection costs no thread. Decoding, checksums, debug saves and
+    evaluation run the handlers of grpc_server.FLPeerServicer on an executor;
+    received models land in grpc_server.received_models as with the threaded
+    server, and wait_for_models lets the round loop await them.
+    Args:
+        executor: Executor for the CPU-bound work, None for the loop's default
+    """
+    def __init__(self, executor=None):
+        self.executor = executor
+        self._sync = FLPeerServicer()
+        self._arrivals = asyncio.Condition()
+
+    async def _run(self, handler, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, handler, *args)
+
+    async def _run_handler(self, handler, request, context):
+        captured = _CapturedContext(context)
+        response = await self._run(handler, request, captured)
+        captured.apply(context)
+        return response
+
+    async def _notify(self):
+        async with self._arrivals:
+            self._arrivals.notify_all()
+
+    async def wait_for_models(self, count, timeout=None):
+        """Wait until at least count models have been received this round; raises asyncio.TimeoutError"""
+        async with self._arrivals:
+            await asyncio.wait_for(self._arrivals.wait_for(lambda: len(received_models) >= count), timeout)
+
+    async def SendModel(self, request, context):
+        response = await self._run_handler(self._sync.SendModel, request, context)
+        await self._notify()
+        return response
+
+    async def SendModelStream(self, request_iterator, context):
+        """As FLPeerServicer.SendModelStream; chunks are hashed and appended on the executor"""
+        peer_addr = context.peer()
+        upload_id, upload = None, None
+        try:
+            async for chunk in request_iterator:
+                if upload_id is None:
+                    upload_id = chunk.upload_id
+                    if chunk.round != grpc_server.current_round:
+                        logger.info(f"Ignored upload from {peer_addr} for round {chunk.round} (current round: {grpc_server.current_round})")
+                        return model_pb2.UploadStatus(upload_id=upload_id, message="Ignored: wrong round")
+                    upload = get_upload(upload_id, chunk.format, peer_addr)
+                    if upload is None:
+                        return model_pb2.UploadStatus(upload_id=upload_id, complete=True, message="Already received")
+                if chunk.HasField('manifest'):
+                    captured = _CapturedContext(context)
+                    status = await self._run(self._sync._complete_upload, upload_id, upload, chunk.manifest,
+                                             peer_addr, captured)
+                    captured.apply(context)
+                    await self._notify()
+                    return status
+                if not await self._run(add_chunk, upload, chunk):
+                    context.set_code(grpc.StatusCode.DATA_LOSS)
+                    context.set_details(f"Chunk {chunk.index} rejected, expected chunk {upload.next_chunk} with a matching hash")
+                    return model_pb2.UploadStatus(upload_id=upload_id, next_chunk=upload.next_chunk)
+            context.set_code(grpc.StatusCode.ABORTED)
+            context.set_details("Stream ended before the manifest")
+            return model_pb2.UploadStatus(upload_id=upload_id or "", next_chunk=upload.next_chunk if upload else 0)
+        except UploadRejected as e:
+            return reject_upload(upload_id, upload, e, peer_addr, context)
+        except asyncio.CancelledError:
+            # Sender went away; the verified chunks are kept for it to resume
+            logger.warning(f"Upload {upload_id} from {peer_addr} interrupted after {upload.next_chunk if upload else 0} chunks")
+            raise
+
+    async def GetUploadStatus(self, request, context):
+        return self._sync.GetUploadStatus(request, context)
+
+    async def HealthCheck(self, request, context):
+        return self._sync.HealthCheck(request, context)
+
+    async def GetStats(self, request, context):
+        return self._sync.GetStats(request, context)
+
+    async def Evaluate(self, request, context):
+        return await self._run_handler(self._sync.Evaluate, request, context)
+
+
+async def start_server(port=50051, ssl_key=None, ssl_cert=None, executor=None):
+    """
+    Start the grpc.aio FLPeer server on the running event loop
+    Args:
+        port: Port number to listen on
+        ssl_key: Path to SSL private key file
+        ssl_cert: Path to SSL certificate file
+        executor: Executor for the handlers' CPU-bound work
+    Returns:
+        grpc.aio.Server, AsyncFLPeerServicer
+    """
+    server = grpc.aio.server(options=SERVER_OPTIONS)
+    servicer = AsyncFLPeerServicer(executor)
+    model_pb2_grpc.add_FLPeerServicer_to_server(servicer, server)
+    if ssl_key and ssl_cert:
+        with open(ssl_key, 'rb') as f:
+            private_key = f.read()
+        with open(ssl_cert, 'rb') as f:
+            certificate_chain = f.read()
+        credentials = grpc.ssl_server_credentials([(private_key, certificate_chain)])
+        server.add_secure_port(f'[::]:{port}', credentials)
+        logger.info(f"Starting secure grpc.aio server on port {port}")
+    else:
+        server.add_insecure_port(f'[::]:{port}')
+        logger.warning(f"Starting insecure grpc.aio server on port {port}")
+    await server.start()
+    return server, servicer
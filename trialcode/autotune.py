@@ -0,0 +1,128 @@
+import os
+import copy
+import time
+import logging
+import numpy as np
+import torch
+from torch.utils.data import TensorDataset
+from data import MemmapBatchLoader
+from model import get_optimizer
+from privacy import RDPAccountant
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZES = (32, 64, 128, 256, 512, 1024)
+SAMPLE_ROWS = 8192  # Training rows timed per (batch size, threads) candidate
+HEADROOM = 0.85     # Share of the round budget given to local training; the rest covers sending and waiting
+
+
+def default_thread_counts():
+    cores = os.cpu_count() or 1
+    return sorted({1, cores} | {2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores})
+
+
+def _subset_loader(loader, num_rows, batch_size):
+    """Copy of a BatchLoader restricted to its first num_rows rows, at batch_size."""
+    loader = copy.copy(loader)
+    if isinstance(loader, MemmapBatchLoader):
+        loader.rows = loader.rows[:num_rows]
+        loader.dataset = loader.rows
+    else:
+        loader.tensors = tuple(t[:num_rows] for t in loader.tensors)
+        loader.dataset = TensorDataset(*loader.tensors)
+    loader.batch_size = batch_size
+    loader.drop_last = False
+    return loader
+
+
+def _scratch_trainer(trainer):
+    """Shallow copy of trainer with its own model and optimizer, so timing leaves the real one untouched."""
+    scratch = copy.copy(trainer)
+    scratch.model = copy.deepcopy(trainer.model)
+    scratch.optimizer = get_optimizer(scratch.model, lr=trainer.optimizer.param_groups[0]['lr'])
+    if trainer.dp is not None:
+        scratch.dp = copy.copy(trainer.dp)
+        scratch.dp.accountant = RDPAccountant()  # Timing steps are not real privacy spending
+    return scratch
+
+
+def measure_throughput(trainer, batch_sizes=BATCH_SIZES, thread_counts=None, sample_rows=SAMPLE_ROWS, repeats=2):
+    """
+    Training samples/sec of this node for each (batch size, torch threads),
+    timed with the trainer's own step (loss, DP-SGD, penalties) on a slice of
+    its training data.
+    Returns:
+        {(batch_size, threads): samples_per_sec}
+    """
+    thread_counts = thread_counts or default_thread_counts()
+    original_threads = torch.get_num_threads()
+    scratch = _scratch_trainer(trainer)
+    num_rows = min(sample_rows, len(trainer.train_loader.dataset))
+    results = {}
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                scratch.train_loader = _subset_loader(trainer.train_loader, num_rows, batch_size)
+                scratch.train_epoch()  # Warm-up
+                best = float('inf')
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    scratch.train_epoch()
+                    best = min(best, time.perf_counter() - start)
+                results[(batch_size, threads)] = num_rows / best
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+
+def choose_config(throughput, num_samples, round_budget, eval_seconds=0.0, max_epochs=20):
+    """
+    Pick the (batch size, threads, epochs) that trains the most epochs within
+    HEADROOM * round_budget seconds, counting one evaluation per epoch. Ties
+    go to the smaller batch size (more optimizer steps per epoch). At least one
+    epoch is always scheduled, even if it overruns the budget.
+    Returns:
+        dict with batch_size, threads, epochs, samples_per_sec, epoch_seconds, round_seconds
+    """
+    best = None
+    for (batch_size, threads), samples_per_sec in throughput.items():
+        epoch_seconds = num_samples / samples_per_sec + eval_seconds
+        epochs = int(min(max_epochs, max(1, np.floor(HEADROOM * round_budget / epoch_seconds))))
+        candidate = {
+            'batch_size': batch_size,
+            'threads': threads,
+            'epochs': epochs,
+            'samples_per_sec': samples_per_sec,
+            'epoch_seconds': epoch_seconds,
+            'round_seconds': epochs * epoch_seconds,
+        }
+        if candidate['round_seconds'] <= HEADROOM * round_budget:
+            key = (True, epochs, -batch_size)
+        else:  # Not even one epoch fits: take the fastest
+            key = (False, -epoch_seconds)
+        if best is None or key > best[0]:
+            best = (key, candidate)
+    return best[1]
+
+
+def autotune(trainer, round_budget, batch_sizes=BATCH_SIZES, thread_counts=None, max_epochs=20):
+    """
+    Measure this node and apply the chosen batch size and thread count to trainer.
+    Returns:
+        The chosen configuration (see choose_config); pass its 'epochs' to Trainer.fit
+    """
+    throughput = measure_throughput(trainer, batch_sizes, thread_counts)
+    start = time.perf_counter()
+    trainer.evaluate()
+    eval_seconds = time.perf_counter() - start
+    config = choose_config(throughput, len(trainer.train_loader.dataset), round_budget, eval_seconds, max_epochs)
+    trainer.configure(batch_size=config['batch_size'], threads=config['threads'])
+    if config['round_seconds'] > round_budget:
+        logger.warning(f"One epoch takes {config['epoch_seconds']:.2f}s, over the {round_budget}s round budget")
+    return config
+
+
+def format_config(config):
+    return (f"batch_size={config['batch_size']} threads={config['threads']} epochs={config['epochs']} "
+            f"({config['samples_per_sec']:,.0f} samples/s, ~{config['round_seconds']:.1f}s local training)")
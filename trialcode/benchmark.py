@@ -0,0 +1,326 @@
+import time
+import pickle
+import argparse
+import torch
+from torch.utils.data import TensorDataset, DataLoader
+from tabulate import tabulate
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from data import BatchLoader
+from model import SimpleBinaryClassifier, OneHotFeatures, get_loss, get_optimizer
+from train import evaluate, evaluate_curves
+from solvers import lbfgs_solve, newton_solve
+from privacy import DPSGD
+import wire
+
+# Roughly the shape of the encoded adults.csv
+DEFAULT_SAMPLES = 100000
+DEFAULT_DIM = 104
+
+
+def synthetic_tensors(num_samples=DEFAULT_SAMPLES, input_dim=DEFAULT_DIM, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    X = torch.randn(num_samples, input_dim, generator=g)
+    y = (torch.rand(num_samples, 1, generator=g) > 0.75).float()
+    return X, y
+
+
+def time_best(fn, repeats=3):
+    """Best wall time of several runs, in seconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def iterate_epoch(loader):
+    for xb, yb in loader:
+        pass
+
+
+def train_epoch(loader, input_dim):
+    model = SimpleBinaryClassifier(input_dim)
+    criterion = get_loss()
+    optimizer = get_optimizer(model)
+    for xb, yb in loader:
+        optimizer.zero_grad()
+        loss = criterion(model(xb), yb)
+        loss.backward()
+        optimizer.step()
+
+
+def bench_loader(batch_sizes=(32, 64, 128, 256, 512, 1024, 2048, 4096), num_samples=DEFAULT_SAMPLES,
+                 input_dim=DEFAULT_DIM, repeats=3):
+    """Samples/sec of DataLoader(TensorDataset) vs BatchLoader, iterating only and training one epoch."""
+    X, y = synthetic_tensors(num_samples, input_dim)
+    rows = []
+    for batch_size in batch_sizes:
+        loaders = {
+            'DataLoader': DataLoader(TensorDataset(X, y), batch_size=batch_size, shuffle=True),
+            'BatchLoader': BatchLoader(X, y, batch_size=batch_size, shuffle=True, seed=0),
+        }
+        iterate = {name: num_samples / time_best(lambda: iterate_epoch(l), repeats) for name, l in loaders.items()}
+        train = {name: num_samples / time_best(lambda: train_epoch(l, input_dim), repeats) for name, l in loaders.items()}
+        rows.append([
+            batch_size,
+            f"{iterate['DataLoader']:,.0f}", f"{iterate['BatchLoader']:,.0f}",
+            f"{iterate['BatchLoader'] / iterate['DataLoader']:.1f}x",
+            f"{train['DataLoader']:,.0f}", f"{train['BatchLoader']:,.0f}",
+            f"{train['BatchLoader'] / train['DataLoader']:.1f}x",
+        ])
+    print(f"\n=== Loader throughput (samples/sec, {num_samples} x {input_dim}) ===")
+    print(tabulate(rows, headers=['Batch', 'DataLoader iter', 'BatchLoader iter', 'Speedup',
+                                  'DataLoader train', 'BatchLoader train', 'Speedup'], tablefmt='grid'))
+    return rows
+
+
+def synthetic_one_hot(num_samples=DEFAULT_SAMPLES, num_dense=5, field_sizes=(7, 16, 7, 14, 6, 5, 2, 41), seed=0):
+    """OneHotFeatures with the adults.csv field layout (or a wider one) and random labels."""
+    g = torch.Generator().manual_seed(seed)
+    dense = torch.randn(num_samples, num_dense, generator=g)
+    offsets = torch.tensor(field_sizes).cumsum(0) - torch.tensor(field_sizes) + num_dense
+    codes = torch.stack([torch.randint(size, (num_samples,), generator=g) for size in field_sizes], dim=1)
+    X = OneHotFeatures(dense, codes + offsets, num_dense + sum(field_sizes))
+    y = (torch.rand(num_samples, 1, generator=g) > 0.75).float()
+    return X, y
+
+
+def bench_sparse(cardinality_scales=(1, 10, 100), batch_size=1024, num_samples=DEFAULT_SAMPLES, repeats=3):
+    """Training samples/sec with dense vs OneHotFeatures inputs as categorical cardinality grows."""
+    rows = []
+    for scale in cardinality_scales:
+        field_sizes = tuple(size * scale for size in (7, 16, 7, 14, 6, 5, 2, 41))
+        X_sparse, y = synthetic_one_hot(num_samples, field_sizes=field_sizes)
+        X_dense = X_sparse.to_dense()
+        input_dim = X_dense.shape[1]
+        dense = num_samples / time_best(
+            lambda: train_epoch(BatchLoader(X_dense, y, batch_size=batch_size, shuffle=True, seed=0), input_dim), repeats)
+        sparse = num_samples / time_best(
+            lambda: train_epoch(BatchLoader(X_sparse, y, batch_size=batch_size, shuffle=True, seed=0), input_dim), repeats)
+        dense_mb = X_dense.element_size() * X_dense.nelement() / 2**20
+        sparse_mb = (X_sparse.dense.element_size() * X_sparse.dense.nelement()
+                     + X_sparse.indices.element_size() * X_sparse.indices.nelement()) / 2**20
+        rows.append([input_dim, f"{dense_mb:.0f}", f"{sparse_mb:.0f}",
+                     f"{dense:,.0f}", f"{sparse:,.0f}", f"{sparse / dense:.1f}x"])
+    print(f"\n=== Dense vs sparse one-hot training (samples/sec, batch {batch_size}) ===")
+    print(tabulate(rows, headers=['Features', 'Dense MB', 'Sparse MB', 'Dense', 'Sparse', 'Speedup'],
+                   tablefmt='grid'))
+    return rows
+
+
+def sklearn_evaluate(model, test_loader):
+    """The previous train.evaluate: per-sample Python lists and sklearn metrics (baseline)."""
+    model.eval()
+    all_preds, all_labels = [], []
+    with torch.no_grad():
+        for xb, yb in test_loader:
+            all_preds.extend((model(xb) > 0.5).float().cpu().numpy())
+            all_labels.extend(yb.cpu().numpy())
+    all_preds = [int(p[0]) for p in all_preds]
+    all_labels = [int(l[0]) for l in all_labels]
+    return (accuracy_score(all_labels, all_preds), precision_score(all_labels, all_preds, zero_division=0),
+            recall_score(all_labels, all_preds, zero_division=0), f1_score(all_labels, all_preds, zero_division=0))
+
+
+def bench_eval(test_sizes=(10000, 100000, 1000000), batch_size=64, input_dim=DEFAULT_DIM, repeats=3):
+    """Evaluation time of the list + sklearn path vs the tensor confusion-matrix evaluator."""
+    model = SimpleBinaryClassifier(input_dim)
+    rows = []
+    for num_samples in test_sizes:
+        X, y = synthetic_tensors(num_samples, input_dim)
+        loader = BatchLoader(X, y, batch_size=batch_size)
+        legacy = time_best(lambda: sklearn_evaluate(model, loader), repeats)
+        tensor = time_best(lambda: evaluate(model, loader), repeats)
+        rows.append([num_samples, f"{legacy * 1000:,.1f}", f"{tensor * 1000:,.1f}", f"{legacy / tensor:.1f}x"])
+    print(f"\n=== Evaluation time (ms, test loader batch {batch_size}) ===")
+    print(tabulate(rows, headers=['Samples', 'sklearn', 'Tensor', 'Speedup'], tablefmt='grid'))
+    return rows
+
+
+def bench_sweep(test_sizes=(10000, 100000, 1000000), num_thresholds=99, input_dim=DEFAULT_DIM, repeats=3):
+    """Model selection over thresholds: re-evaluating per threshold vs one sort-based or histogram sweep."""
+    model = SimpleBinaryClassifier(input_dim)
+    thresholds = [(i + 1) / (num_thresholds + 1) for i in range(num_thresholds)]
+    rows = []
+    for num_samples in test_sizes:
+        X, y = synthetic_tensors(num_samples, input_dim)
+        loader = BatchLoader(X, y, batch_size=64)
+        rerun = time_best(lambda: [evaluate(model, loader, t) for t in thresholds], repeats)
+        exact = time_best(lambda: evaluate_curves(model, loader), repeats)
+        binned = time_best(lambda: evaluate_curves(model, loader, bins=1000), repeats)
+        rows.append([num_samples, f"{rerun * 1000:,.1f}", f"{exact * 1000:,.1f}", f"{binned * 1000:,.1f}",
+                     f"{rerun / exact:.1f}x"])
+    print(f"\n=== Threshold sweep time (ms, {num_thresholds} re-evaluations vs one pass) ===")
+    print(tabulate(rows, headers=['Samples', 'Re-evaluate', 'Sort sweep', 'Histogram', 'Speedup'], tablefmt='grid'))
+    return rows
+
+
+def synthetic_logistic(num_samples=DEFAULT_SAMPLES, input_dim=DEFAULT_DIM, seed=0):
+    """Features with labels drawn from a planted logistic model, so the local optimum is well defined."""
+    g = torch.Generator().manual_seed(seed)
+    X = torch.randn(num_samples, input_dim, generator=g)
+    w = torch.randn(input_dim, generator=g) / input_dim ** 0.5
+    y = (torch.rand(num_samples, generator=g) < torch.sigmoid(X @ w)).float().view(-1, 1)
+    return X, y
+
+
+def bench_solver(sample_sizes=(10000, 100000), input_dim=DEFAULT_DIM, epochs=3, batch_size=64, repeats=3):
+    """CPU time and final training loss of minibatch Adam epochs vs full-batch L-BFGS and Newton."""
+    rows = []
+    for num_samples in sample_sizes:
+        X, y = synthetic_logistic(num_samples, input_dim)
+        criterion = get_loss()
+
+        def adam():
+            model = SimpleBinaryClassifier(input_dim)
+            optimizer = get_optimizer(model)
+            loader = BatchLoader(X, y, batch_size=batch_size, shuffle=True, seed=0)
+            for _ in range(epochs):
+                for xb, yb in loader:
+                    optimizer.zero_grad()
+                    criterion(model(xb), yb).backward()
+                    optimizer.step()
+            return model
+
+        def full_batch(solve):
+            model = SimpleBinaryClassifier(input_dim)
+            solve(model, X, y)
+            return model
+
+        for name, run in (('Adam', adam), ('L-BFGS', lambda: full_batch(lbfgs_solve)),
+                          ('Newton', lambda: full_batch(newton_solve))):
+            seconds = time_best(run, repeats)
+            model = run()
+            with torch.no_grad():
+                loss = criterion(model(X), y).item()
+            rows.append([num_samples, name, f"{seconds * 1000:,.0f}", f"{loss:.5f}"])
+    print(f"\n=== Local solver (ms and final train BCE, Adam = {epochs} epochs at batch {batch_size}) ===")
+    print(tabulate(rows, headers=['Samples', 'Solver', 'Time', 'Loss'], tablefmt='grid'))
+    return rows
+
+
+def bench_parallel(worker_counts=None, num_samples=400000, input_dim=DEFAULT_DIM, batch_size=1024):
+    """Epoch time of data-parallel local training (parallel.DataParallelTrainer) on a synthetic shard."""
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from train import Trainer
+    from parallel import DataParallelTrainer
+    from partition import write_shards
+    from data import Preprocessor, PREPROCESSOR_FILE
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    X, y = synthetic_logistic(num_samples, input_dim)
+    work_dir = tempfile.mkdtemp()
+    try:
+        # A one-shard set with a preprocessor whose input_dim matches the synthetic features
+        write_shards(X.numpy(), y.view(-1).numpy(), [np.arange(num_samples)], work_dir,
+                     [f"x{i}" for i in range(input_dim)])
+        Preprocessor({}, np.zeros(input_dim), np.ones(input_dim), [f"x{i}" for i in range(input_dim)], []).save(
+            os.path.join(work_dir, PREPROCESSOR_FILE))
+        trainer_args = dict(machine_id=0, total_machines=1, batch_size=batch_size, shard_dir=work_dir,
+                            save_dir=os.path.join(work_dir, 'models'))
+        rows, baseline = [], None
+        for workers in worker_counts:
+            trainer = DataParallelTrainer(workers=workers, **trainer_args) if workers > 1 else Trainer(**trainer_args)
+            trainer.start_round(round_num=1)
+            trainer.train_epoch()  # Warm-up
+            seconds = time_best(trainer.train_epoch, 3)
+            if workers > 1:
+                trainer.close()
+            baseline = baseline or seconds
+            rows.append([workers, f"{seconds * 1000:,.0f}", f"{baseline / seconds:.1f}x"])
+    finally:
+        shutil.rmtree(work_dir)
+    print(f"\n=== Data-parallel epoch time (ms, {num_samples} x {input_dim}, batch {batch_size}, {cores} cores) ===")
+    print(tabulate(rows, headers=['Workers', 'Epoch', 'Speedup'], tablefmt='grid'))
+    return rows
+
+
+def dp_epoch(loader, input_dim, mode, dp):
+    """One training epoch: non-private, DP-SGD in closed form, or DP-SGD with a per-sample loop (naive)."""
+    model = SimpleBinaryClassifier(input_dim)
+    criterion = get_loss()
+    optimizer = get_optimizer(model)
+    sample_rate = loader.batch_size / len(loader.dataset)
+    for xb, yb in loader:
+        optimizer.zero_grad()
+        if mode == 'plain':
+            criterion(model(xb), yb).backward()
+        elif mode == 'dp':
+            dp.backward(model, xb, yb, sample_rate)
+        else:
+            total = [torch.zeros_like(p) for p in model.parameters()]
+            for i in range(len(xb)):
+                grads = torch.autograd.grad(criterion(model(xb[i:i + 1]), yb[i:i + 1]), list(model.parameters()))
+                norm = torch.sqrt(sum(g.pow(2).sum() for g in grads))
+                scale = min(1.0, dp.max_grad_norm / (norm.item() + 1e-6))
+                for t, g in zip(total, grads):
+                    t.add_(g * scale)
+            for p, t in zip(model.parameters(), total):
+                p.grad = (t + torch.randn_like(t) * dp.noise_multiplier * dp.max_grad_norm) / len(xb)
+        optimizer.step()
+
+
+def bench_dp(batch_sizes=(64, 256, 1024), num_samples=DEFAULT_SAMPLES, input_dim=DEFAULT_DIM, naive_samples=5000,
+             repeats=3):
+    """Training samples/sec without DP, with vectorized DP-SGD, and with a per-sample DP-SGD loop."""
+    X, y = synthetic_tensors(num_samples, input_dim)
+    X_naive, y_naive = X[:naive_samples], y[:naive_samples]  # The loop is too slow for the full set
+    dp = DPSGD(noise_multiplier=1.0, max_grad_norm=1.0)
+    rows = []
+    for batch_size in batch_sizes:
+        loader = BatchLoader(X, y, batch_size=batch_size, shuffle=True, seed=0)
+        naive_loader = BatchLoader(X_naive, y_naive, batch_size=batch_size, shuffle=True, seed=0)
+        plain = num_samples / time_best(lambda: dp_epoch(loader, input_dim, 'plain', dp), repeats)
+        vectorized = num_samples / time_best(lambda: dp_epoch(loader, input_dim, 'dp', dp), repeats)
+        naive = naive_samples / time_best(lambda: dp_epoch(naive_loader, input_dim, 'naive', dp), 1)
+        rows.append([batch_size, f"{plain:,.0f}", f"{vectorized:,.0f}", f"{naive:,.0f}",
+                     f"{plain / vectorized:.2f}x", f"{plain / naive:.0f}x"])
+    print(f"\n=== DP-SGD training throughput (samples/sec, {num_samples} x {input_dim}) ===")
+    print(tabulate(rows, headers=['Batch', 'Non-private', 'DP vectorized', 'DP per-sample loop',
+                                  'Vectorized overhead', 'Loop overhead'], tablefmt='grid'))
+    return rows
+
+
+def bench_wire(param_counts=(DEFAULT_DIM + 1, 1000000, 25000000), repeats=3):
+    """Serialize/deserialize throughput of a model state_dict with pickle and with the tensor wire format."""
+    rows = []
+    for num_params in param_counts:
+        state_dict = {'output_layer.weight': torch.randn(1, num_params - 1), 'output_layer.bias': torch.randn(1)}
+        megabytes = num_params * 4 / 1e6
+        row = [f"{num_params:,}"]
+        for encode, decode in ((pickle.dumps, pickle.loads), (wire.encode, wire.decode)):
+            data = encode(state_dict)
+            row += [f"{len(data) / 1024:,.1f}", f"{megabytes / time_best(lambda: encode(state_dict), repeats):,.0f}",
+                    f"{megabytes / time_best(lambda: decode(data), repeats):,.0f}"]
+        rows.append(row)
+    print("\n=== Model serialization throughput (MB/s of float32 weights) ===")
+    print(tabulate(rows, headers=['Params', 'Pickle KB', 'Pickle encode', 'Pickle decode', 'Wire KB',
+                                  'Wire encode', 'Wire decode'], tablefmt='grid'))
+    return rows
+
+
+BENCHMARKS = {
+    'loader': bench_loader,
+    'sparse': bench_sparse,
+    'eval': bench_eval,
+    'sweep': bench_sweep,
+    'solver': bench_solver,
+    'parallel': bench_parallel,
+    'dp': bench_dp,
+    'wire': bench_wire,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the local training pipeline")
+    parser.add_argument("benchmarks", nargs='*',
+                        help=f"Benchmarks to run, any of: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.benchmarks or list(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+import torch
+from data import BatchLoader, machine_rows, _split_indices
+
+UCI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'datasets', 'UCI_cleanedData.csv')
+
+# Bit weights of np.packbits' default big-endian bit order
+_SHIFTS = torch.arange(7, -1, -1, dtype=torch.uint8)
+
+
+def pack_bool_csv(path=UCI_PATH, *, label_column, drop_columns=(), chunksize=100000):
+    """
+    Read a one-hot True/False CSV (e.g. datasets/UCI_cleanedData.csv) straight into bitsets.
+    Each chunk is parsed as bool and packed with np.packbits, so features are
+    never materialized as float and are stored at 1 bit per feature.
+    Args:
+        path: CSV whose first column is the row index and all others are True/False
+        label_column: Boolean column used as the label (removed from the features)
+        drop_columns: Further columns to leave out. Include the label's one-hot siblings
+            (e.g. 'Sex_ Female' for 'Sex_ Male'), which otherwise give the label away
+        chunksize: Rows parsed per chunk
+    Returns:
+        packed (uint8 array, N x ceil(D/8)), labels (float32 array), feature_names
+    """
+    columns = list(pd.read_csv(path, index_col=0, nrows=0).columns)
+    if label_column not in columns:
+        raise ValueError(f"label_column must be one of the columns of {path}: {columns}")
+    feature_names = [c for c in columns if c != label_column and c not in drop_columns]
+    packed, labels = [], []
+    dtypes = {c: bool for c in feature_names + [label_column]}
+    for chunk in pd.read_csv(path, index_col=0, chunksize=chunksize, dtype=dtypes,
+                             usecols=lambda c: c not in drop_columns):
+        packed.append(np.packbits(chunk[feature_names].to_numpy(dtype=bool), axis=1))
+        labels.append(chunk[label_column].to_numpy(dtype=np.float32))
+    return np.concatenate(packed), np.concatenate(labels), feature_names
+
+
+def unpack_bits(packed, num_features):
+    """Unpack uint8 bitset rows (torch tensor) into a float32 0/1 feature matrix."""
+    bits = (packed.unsqueeze(-1) >> _SHIFTS) & 1
+    return bits.flatten(1)[:, :num_features].float()
+
+
+class PackedBatchLoader(BatchLoader):
+    """
+    BatchLoader over bit-packed features; rows are unpacked to float32 one batch at a time.
+    Args:
+        packed: uint8 tensor of packed feature rows
+        y: Label tensor (N, 1)
+        num_features: Number of features before packing
+        batch_size, shuffle, drop_last, seed: As for BatchLoader
+    """
+    def __init__(self, packed, y, num_features, batch_size=32, shuffle=False, drop_last=False, seed=None):
+        super().__init__(packed, y, batch_size=batch_size, shuffle=shuffle, drop_last=drop_last, seed=seed)
+        self.num_features = num_features
+
+    def _slice(self, start, stop):
+        packed, y = super()._slice(start, stop)
+        return unpack_bits(packed, self.num_features), y
+
+    def _take(self, idx):
+        packed, y = super()._take(idx)
+        return unpack_bits(packed, self.num_features), y
+
+
+def get_packed_data_loaders(path=UCI_PATH, *, label_column, drop_columns=(), machine_id=0, total_machines=4,
+                            batch_size=32, seed=42, shuffle_seed=None, drop_last=False):
+    """
+    Like data.get_data_loaders, for boolean one-hot datasets kept bit-packed in memory.
+    Returns:
+        train_loader, test_loader (PackedBatchLoader)
+    """
+    packed, labels, feature_names = pack_bool_csv(path, label_column=label_column, drop_columns=drop_columns)
+
+    # Split data based on machine ID, exactly as the dense loaders do
+    start_idx, end_idx = machine_rows(len(packed), machine_id, total_machines)
+    packed, labels = packed[start_idx:end_idx], labels[start_idx:end_idx]
+
+    train_idx, test_idx = _split_indices(len(packed), seed)
+    packed, labels = torch.from_numpy(packed), torch.from_numpy(labels).view(-1, 1)
+    train_idx, test_idx = torch.from_numpy(train_idx), torch.from_numpy(test_idx)
+    train_loader = PackedBatchLoader(packed[train_idx], labels[train_idx], len(feature_names),
+                                     batch_size=batch_size, shuffle=True, drop_last=drop_last, seed=shuffle_seed)
+    test_loader = PackedBatchLoader(packed[test_idx], labels[test_idx], len(feature_names),
+                                    batch_size=batch_size, shuffle=False)
+    return train_loader, test_loader
@@ -1,24 +1,81 @@
+import os
+import json
+import hashlib
 import pandas as pd
 import numpy as np
 from sklearn import preprocessing
 from sklearn.model_selection import train_test_split
 import torch
-from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import TensorDataset
+from model import OneHotFeatures
 
+DATA_URL = "https://raw.githubusercontent.com/aliakbarbadri/mlp-classifier-adult-dataset/master/adults.csv"
+DEFAULT_CACHE_DIR = ".data_cache"
+CACHE_VERSION = 2  # Bump whenever the preprocessing below changes its output
+SHARD_MANIFEST = "manifest.json"
+PREPROCESSOR_FILE = "preprocessor.json"
 
-def load_and_preprocess_data(path="adults.csv", machine_id=0, total_machines=4):
-    # ----------------------------
-    # Load the dataset
-    # ----------------------------
-    header = ['age', 'workclass', 'fnlwgt', 'education', 'education-num', 'marital-status',
-              'occupation', 'relationship', 'race', 'sex', 'capital-gain',
-              'capital-loss', 'hours-per-week', 'native-country', 'salary']
+HEADER = ['age', 'workclass', 'fnlwgt', 'education', 'education-num', 'marital-status',
+          'occupation', 'relationship', 'race', 'sex', 'capital-gain',
+          'capital-loss', 'hours-per-week', 'native-country', 'salary']
+CATEGORICAL_COLUMNS = ['workclass', 'education', 'marital-status',
+                       'occupation', 'relationship', 'race', 'sex', 'native-country']
+NORMALIZE_COLUMNS = ['age', 'fnlwgt', 'capital-gain', 'capital-loss', 'hours-per-week']
+
+# (path, size, mtime) -> sha256, so a file is hashed at most once per process
+_file_digests = {}
+
+
+def _file_digest(path):
+    """Return the sha256 of a local file, or of the path itself if it cannot be read."""
     try:
-        df = pd.read_csv(path, index_col=False, skipinitialspace=True, header=None, names=header)
+        stat = os.stat(path)
+    except OSError:
+        # Missing file: the data comes from DATA_URL, so key on the source name
+        return hashlib.sha256(f"{path}|{DATA_URL}".encode()).hexdigest()
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        m = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                m.update(block)
+        _file_digests[key] = m.hexdigest()
+    return _file_digests[key]
+
+
+def _cache_path(cache_dir, path, machine_id, total_machines, seed, sparse=False, preprocessor=None):
+    """Cache file for one (source file, preprocessing parameters) combination."""
+    m = hashlib.sha256()
+    m.update(_file_digest(path).encode())
+    m.update(repr((CACHE_VERSION, HEADER, CATEGORICAL_COLUMNS, NORMALIZE_COLUMNS,
+                   machine_id, total_machines, seed, sparse,
+                   preprocessor.digest() if preprocessor is not None else None)).encode())
+    return os.path.join(cache_dir, f"{m.hexdigest()[:24]}.npz")
+
+
+def _to_tensors(arrays):
+    """Tensors from the arrays saved by load_and_preprocess_data (dense X_* or sparse dense_*/indices_*)."""
+    tensors = []
+    for split in ('train', 'test'):
+        if f'X_{split}' in arrays:
+            X = torch.from_numpy(arrays[f'X_{split}'])
+        else:
+            X = OneHotFeatures(torch.from_numpy(arrays[f'dense_{split}']),
+                               torch.from_numpy(arrays[f'indices_{split}']), int(arrays['num_features']))
+        tensors += [X, torch.from_numpy(arrays[f'y_{split}']).view(-1, 1)]
+    return tuple(tensors)
+
+
+def read_csv(path="adults.csv", **kwargs):
+    """Read the adults.csv format, falling back to DATA_URL if path cannot be read."""
+    try:
+        return pd.read_csv(path, index_col=False, skipinitialspace=True, header=None, names=HEADER, **kwargs)
     except:
-        url = "https://raw.githubusercontent.com/aliakbarbadri/mlp-classifier-adult-dataset/master/adults.csv"
-        df = pd.read_csv(url, index_col=False, skipinitialspace=True, header=None, names=header)
+        return pd.read_csv(DATA_URL, index_col=False, skipinitialspace=True, header=None, names=HEADER, **kwargs)
+
 
+def clean_frame(df):
+    """Drop incomplete rows and unused columns and map the label to 0/1."""
     # ----------------------------
     # Clean missing values
     # ----------------------------
@@ -34,51 +91,428 @@ def load_and_preprocess_data(path="adults.csv", machine_id=0, total_machines=4):
     # Convert label to int (salary)
     # ----------------------------
     df['salary'] = df['salary'].map({'>50K': 1, '<=50K': 0}).astype(int)
+    return df
 
-    # ----------------------------
-    # One-hot encode categorical features
-    # ----------------------------
-    categorical_columns = ['workclass', 'education', 'marital-status',
-                           'occupation', 'relationship', 'race', 'sex', 'native-country']
-    df = pd.get_dummies(df, columns=categorical_columns)
 
-    # ----------------------------
-    # Normalize numerical features
-    # ----------------------------
-    normalize_columns = ['age', 'fnlwgt', 'capital-gain', 'capital-loss', 'hours-per-week']
-    scaler = preprocessing.StandardScaler()
-    df[normalize_columns] = scaler.fit_transform(df[normalize_columns])
+class Preprocessor:
+    """
+    Fitted feature encoding: category vocabulary, scaler statistics and column order.
+    Fit once, save as JSON next to the checkpoints, and reuse it to transform
+    training data or raw records for inference with an identical layout.
+    The layout matches pd.get_dummies: scaled numeric columns first, then one
+    column per (categorical column, category) with categories sorted.
+    Args:
+        vocabulary: Dict of categorical column -> list of categories
+        mean: Per-column mean of numeric_columns
+        scale: Per-column standard deviation of numeric_columns (StandardScaler.scale_)
+        numeric_columns: Columns to standardize
+        categorical_columns: Columns to one-hot encode
+        federation: Digest of the peer set whose merged statistics this was
+            built from (see fedstats.py), None for a local fit
+    """
+    VERSION = 1
+
+    def __init__(self, vocabulary, mean, scale, numeric_columns=NORMALIZE_COLUMNS,
+                 categorical_columns=CATEGORICAL_COLUMNS, federation=None):
+        self.federation = federation
+        self.numeric_columns = list(numeric_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.vocabulary = {col: list(vocabulary[col]) for col in self.categorical_columns}
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.feature_names = list(self.numeric_columns)
+        self.offsets = []
+        for col in self.categorical_columns:
+            self.offsets.append(len(self.feature_names))
+            self.feature_names += [f"{col}_{value}" for value in self.vocabulary[col]]
+
+    @property
+    def input_dim(self):
+        return len(self.feature_names)
+
+    @classmethod
+    def from_scaler(cls, vocabulary, scaler, **kwargs):
+        """Build from a fitted (or partial_fit) StandardScaler."""
+        return cls(vocabulary, scaler.mean_, scaler.scale_, **kwargs)
+
+    @classmethod
+    def fit(cls, df, numeric_columns=NORMALIZE_COLUMNS, categorical_columns=CATEGORICAL_COLUMNS):
+        """Fit on a cleaned DataFrame (see clean_frame)."""
+        scaler = preprocessing.StandardScaler().fit(df[list(numeric_columns)])
+        vocabulary = {col: sorted(df[col].unique()) for col in categorical_columns}
+        return cls.from_scaler(vocabulary, scaler, numeric_columns=numeric_columns,
+                               categorical_columns=categorical_columns)
+
+    def _frame(self, records):
+        """DataFrame from a DataFrame, a list of dicts, or a list of rows in adults.csv column order."""
+        if isinstance(records, pd.DataFrame):
+            df = records
+        elif records and isinstance(records[0], dict):
+            df = pd.DataFrame(list(records))
+        else:
+            rows = [list(r) for r in records]
+            df = pd.DataFrame(rows, columns=HEADER[:len(rows[0])] if rows else HEADER)
+        for col in self.categorical_columns:
+            if df[col].dtype == object:
+                df[col] = df[col].str.strip()
+        return df
+
+    def codes(self, df):
+        """Per-field category codes (N, num_fields); -1 for categories not in the vocabulary."""
+        codes = np.empty((len(df), len(self.categorical_columns)), dtype=np.int64)
+        for i, col in enumerate(self.categorical_columns):
+            codes[:, i] = pd.Categorical(df[col], categories=self.vocabulary[col]).codes
+        return codes
+
+    def scaled(self, df):
+        X = (df[self.numeric_columns].to_numpy(dtype=np.float64) - self.mean) / self.scale
+        return X.astype(np.float32)
+
+    def transform(self, records):
+        """
+        Dense float32 feature matrix for records (see _frame). Unknown
+        categories leave all columns of their field at zero.
+        """
+        df = self._frame(records)
+        X = np.zeros((len(df), self.input_dim), dtype=np.float32)
+        X[:, :len(self.numeric_columns)] = self.scaled(df)
+        codes = self.codes(df)
+        rows, fields = np.nonzero(codes >= 0)
+        X[rows, np.asarray(self.offsets)[fields] + codes[rows, fields]] = 1.0
+        return X
+
+    def transform_sparse(self, records):
+        """
+        (dense, indices) arrays for OneHotFeatures: scaled numeric columns and the
+        active column of each categorical field.
+        """
+        df = self._frame(records)
+        codes = self.codes(df)
+        if (codes < 0).any():
+            raise ValueError("Records contain categories unknown to the preprocessor; use transform() instead")
+        return self.scaled(df), codes + np.asarray(self.offsets)
+
+    def to_dict(self):
+        d = {
+            'version': self.VERSION,
+            'numeric_columns': self.numeric_columns,
+            'categorical_columns': self.categorical_columns,
+            'vocabulary': self.vocabulary,
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'feature_names': self.feature_names,
+        }
+        if self.federation is not None:
+            d['federation'] = self.federation
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('version') != cls.VERSION:
+            raise ValueError(f"Unsupported preprocessor version {d.get('version')}")
+        return cls(d['vocabulary'], d['mean'], d['scale'], d['numeric_columns'], d['categorical_columns'],
+                   federation=d.get('federation'))
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def digest(self):
+        """Short hash of the fitted state, used in cache keys."""
+        return hashlib.sha256(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def fit_preprocessor(path="adults.csv"):
+    """Fit a Preprocessor on the full dataset, as encode_dataset does."""
+    return Preprocessor.fit(clean_frame(read_csv(path)))
 
-    # Split data based on machine ID
-    total_samples = len(df)
+
+def load_or_fit_preprocessor(save_dir="models", path="adults.csv", shard_dir=None):
+    """
+    Load save_dir/preprocessor.json. On first use it is taken from shard_dir
+    (written by partition.py) or fitted on path, and saved to save_dir.
+    """
+    preprocessor_path = os.path.join(save_dir, PREPROCESSOR_FILE)
+    if os.path.exists(preprocessor_path):
+        return Preprocessor.load(preprocessor_path)
+    if shard_dir is not None and os.path.exists(os.path.join(shard_dir, PREPROCESSOR_FILE)):
+        preprocessor = Preprocessor.load(os.path.join(shard_dir, PREPROCESSOR_FILE))
+    else:
+        preprocessor = fit_preprocessor(path)
+    os.makedirs(save_dir, exist_ok=True)
+    preprocessor.save(preprocessor_path)
+    return preprocessor
+
+
+def machine_rows(total_samples, machine_id=0, total_machines=1):
+    """Contiguous (start, end) row range of machine_id, the last machine taking the remainder."""
     samples_per_machine = total_samples // total_machines
     start_idx = machine_id * samples_per_machine
     end_idx = start_idx + samples_per_machine if machine_id < total_machines - 1 else total_samples
-    
-    df = df.iloc[start_idx:end_idx]
+    return start_idx, end_idx
+
+
+def count_lines(path):
+    """Number of lines in a local file, counted without parsing it."""
+    count, last = 0, b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count += block.count(b'\n')
+            last = block[-1:]
+    return count + (last != b'\n')
+
+
+def read_machine_rows(path="adults.csv", machine_id=0, total_machines=1):
+    """
+    This machine's contiguous part of the raw CSV, split over the file's lines
+    (see machine_rows). Only that range is parsed, with skiprows/nrows; when
+    path cannot be read the DATA_URL copy is read whole and sliced the same way.
+    """
+    try:
+        total_lines = count_lines(path)
+    except OSError:
+        df = read_csv(path)
+        start_idx, end_idx = machine_rows(len(df), machine_id, total_machines)
+        return df.iloc[start_idx:end_idx]
+    start_idx, end_idx = machine_rows(total_lines, machine_id, total_machines)
+    # The last machine reads to the end, so trailing blank lines cannot cut its part short
+    nrows = end_idx - start_idx if machine_id < total_machines - 1 else None
+    return read_csv(path, skiprows=start_idx, nrows=nrows)
+
+
+def local_frame(path="adults.csv", machine_id=0, total_machines=1):
+    """This machine's rows of the cleaned dataset, before encoding; the rest of the file is never parsed."""
+    return clean_frame(read_machine_rows(path, machine_id, total_machines))
+
+
+def encode_dataset(path="adults.csv", preprocessor=None, machine_id=0, total_machines=1):
+    """
+    Load and encode the dataset, or one machine's contiguous part of it.
+    Args:
+        path: CSV file in the adults.csv format (downloaded if missing)
+        preprocessor: Fitted Preprocessor, fitted on the whole file if None
+        machine_id, total_machines: Which part to encode (default: everything); with a
+            preprocessor only that part of the file is read (see read_machine_rows)
+    Returns:
+        X (float32 array), y (float32 array), feature_names (list of str)
+    """
+    if preprocessor is None:
+        preprocessor = fit_preprocessor(path)
+    df = local_frame(path, machine_id, total_machines)
+    return preprocessor.transform(df), df['salary'].values.astype(np.float32), preprocessor.feature_names
+
+
+def encode_dataset_sparse(path="adults.csv", preprocessor=None, machine_id=0, total_machines=1):
+    """
+    Encode the dataset (or one machine's part) without materializing the one-hot columns.
+    Column order and values match encode_dataset: feature j of the dense
+    matrix is dense[:, j] for the first len(NORMALIZE_COLUMNS) columns, and
+    otherwise 1 exactly where j appears in that row of indices.
+    Returns:
+        dense (float32 array), indices (int64 array, one column per categorical
+        field), y (float32 array), feature_names (list of str)
+    """
+    if preprocessor is None:
+        preprocessor = fit_preprocessor(path)
+    df = local_frame(path, machine_id, total_machines)
+    dense, indices = preprocessor.transform_sparse(df)
+    return dense, indices, df['salary'].values.astype(np.float32), preprocessor.feature_names
+
+
+def load_shard(shard_dir, machine_id=0, total_machines=None):
+    """
+    Memory-map one node's shard written by partition.py.
+    Args:
+        shard_dir: Directory holding the shard files and manifest.json
+        machine_id: Index of the shard to map
+        total_machines: Expected number of shards, checked against the manifest if given
+    Returns:
+        X, y read-only memory-mapped arrays
+    """
+    with open(os.path.join(shard_dir, SHARD_MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    num_shards = manifest['num_shards']
+    if total_machines is not None and total_machines != num_shards:
+        raise ValueError(f"{shard_dir} holds {num_shards} shards, expected {total_machines}")
+    if not 0 <= machine_id < num_shards:
+        raise ValueError(f"machine_id {machine_id} out of range for {num_shards} shards")
+    shard = manifest['shards'][machine_id]
+    X = np.load(os.path.join(shard_dir, shard['features']), mmap_mode='r')
+    y = np.load(os.path.join(shard_dir, shard['labels']), mmap_mode='r')
+    return X, y
+
+
+def _split_indices(num_samples, seed):
+    """Row indices of the 80/20 train/test split."""
+    return train_test_split(np.arange(num_samples), test_size=0.2, shuffle=True, random_state=seed)
+
+
+def load_and_preprocess_data(path="adults.csv", machine_id=0, total_machines=4, seed=42,
+                             cache_dir=DEFAULT_CACHE_DIR, shard_dir=None, sparse=False, preprocessor=None):
+    """
+    Load, encode and split this machine's part of the dataset.
+    Args:
+        path: CSV file in the adults.csv format (downloaded if missing)
+        machine_id: Index of this machine
+        total_machines: Number of machines the dataset is split across
+        seed: Seed for the train/test split
+        cache_dir: Directory for cached encoded arrays, None to disable caching
+        shard_dir: Directory of pre-partitioned shards; when set, only this
+            machine's shard is read and path/cache_dir are ignored
+        sparse: Return features as OneHotFeatures instead of dense tensors
+        preprocessor: Fitted Preprocessor to encode with instead of refitting on path
+    Returns:
+        X_train, y_train, X_test, y_test tensors
+    """
+    if sparse and shard_dir is not None:
+        raise ValueError("sparse features are built from the CSV and cannot be combined with shard_dir")
+    cache_file = None
+    if cache_dir and shard_dir is None:
+        cache_file = _cache_path(cache_dir, path, machine_id, total_machines, seed, sparse, preprocessor)
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as cached:
+                return _to_tensors(cached)
+
+    if shard_dir is not None:
+        X, y = load_shard(shard_dir, machine_id, total_machines)
+        features = {'X': X}
+    elif sparse:
+        # Only this machine's rows are encoded; the preprocessor is fitted on all rows if not given
+        dense, indices, y, feature_names = encode_dataset_sparse(path, preprocessor, machine_id, total_machines)
+        features = {'dense': dense, 'indices': indices}
+    else:
+        X, y, feature_names = encode_dataset(path, preprocessor, machine_id, total_machines)
+        features = {'X': X}
 
     # ----------------------------
     # Split into train/test
     # ----------------------------
-    X = df.drop('salary', axis=1).values.astype(np.float32)
-    y = df['salary'].values.astype(np.float32)
+    train_idx, test_idx = _split_indices(len(y), seed)
+    arrays = {}
+    for name, a in list(features.items()) + [('y', y)]:
+        arrays[f'{name}_train'] = np.ascontiguousarray(a[train_idx])
+        arrays[f'{name}_test'] = np.ascontiguousarray(a[test_idx])
+    if sparse:
+        arrays['num_features'] = np.array(len(feature_names))
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=True)
+    if cache_file:
+        # Write to a temp file first so a concurrent reader never sees a partial cache
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, cache_file)
 
-    # Convert to PyTorch tensors
-    X_train_tensor = torch.tensor(X_train)
-    y_train_tensor = torch.tensor(y_train).view(-1, 1)
-    X_test_tensor = torch.tensor(X_test)
-    y_test_tensor = torch.tensor(y_test).view(-1, 1)
+    return _to_tensors(arrays)
 
-    return X_train_tensor, y_train_tensor, X_test_tensor, y_test_tensor
 
+class BatchLoader:
+    """
+    Drop-in replacement for DataLoader(TensorDataset(...)) over in-memory tensors.
+    Draws one permutation per epoch and yields whole batches with index_select
+    (or contiguous slice views when not shuffling) instead of indexing and
+    collating one sample at a time.
+    Args:
+        *tensors: Tensors sharing the first dimension
+        batch_size: Samples per batch
+        shuffle: Reshuffle every epoch
+        drop_last: Skip the final incomplete batch
+        seed: Seed for the shuffle order, None to use the global torch RNG
+    """
+    def __init__(self, *tensors, batch_size=32, shuffle=False, drop_last=False, seed=None):
+        self.tensors = tensors
+        self.dataset = TensorDataset(*tensors)  # keeps len(loader.dataset) working
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.set_seed(seed)
 
-def get_data_loaders(path="adults.csv", machine_id=0, total_machines=4, batch_size=32):
-    X_train, y_train, X_test, y_test = load_and_preprocess_data(path, machine_id, total_machines)
-    train_dataset = TensorDataset(X_train, y_train)
-    test_dataset = TensorDataset(X_test, y_test)
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
-    return train_loader, test_loader
+    def set_seed(self, seed):
+        """Restart the shuffle order from seed, e.g. once per federated round."""
+        self.generator = None if seed is None else torch.Generator().manual_seed(seed)
+
+    def __len__(self):
+        n = len(self.dataset)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def _slice(self, start, stop):
+        return tuple(t[start:stop] for t in self.tensors)
+
+    def _take(self, idx):
+        return tuple(t.index_select(0, idx) for t in self.tensors)
 
+    def __iter__(self):
+        n = len(self.dataset)
+        stop = n - n % self.batch_size if self.drop_last else n
+        if not self.shuffle:
+            for start in range(0, stop, self.batch_size):
+                yield self._slice(start, start + self.batch_size)
+            return
+        perm = torch.randperm(n, generator=self.generator)
+        for start in range(0, stop, self.batch_size):
+            yield self._take(perm[start:start + self.batch_size])
+
+
+class MemmapBatchLoader(BatchLoader):
+    """
+    BatchLoader over selected rows of memory-mapped arrays (see load_shard).
+    Only the current batch is read into memory, so a shard larger than RAM
+    can still be trained on.
+    Args:
+        X, y: Feature and label arrays, typically np.memmap
+        rows: Row indices of X/y that make up this loader's dataset
+        batch_size, shuffle, drop_last, seed: As for BatchLoader
+    """
+    def __init__(self, X, y, rows, batch_size=32, shuffle=False, drop_last=False, seed=None):
+        self.X = X
+        self.y = y
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.dataset = self.rows  # keeps len(loader.dataset) working
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.set_seed(seed)
+
+    def _gather(self, rows):
+        # Sorted reads touch each page of the memmap at most once per batch
+        rows = np.sort(rows)
+        return (torch.from_numpy(np.ascontiguousarray(self.X[rows], dtype=np.float32)),
+                torch.from_numpy(np.ascontiguousarray(self.y[rows], dtype=np.float32)).view(-1, 1))
+
+    def _slice(self, start, stop):
+        return self._gather(self.rows[start:stop])
+
+    def _take(self, idx):
+        return self._gather(self.rows[idx.numpy()])
+
+
+def get_data_loaders(path="adults.csv", machine_id=0, total_machines=4, batch_size=32, seed=42,
+                     cache_dir=DEFAULT_CACHE_DIR, shard_dir=None, shuffle_seed=None, drop_last=False,
+                     in_memory=True, sparse=False, preprocessor=None, incremental=False, incremental_update=True,
+                     save_dir=None):
+    if incremental:
+        # The local CSV is an append-only feed: encode only the rows added since the last call
+        from incremental import get_incremental_data_loaders
+        return get_incremental_data_loaders(path, batch_size=batch_size, seed=seed, cache_dir=cache_dir,
+                                            preprocessor=preprocessor, shuffle_seed=shuffle_seed,
+                                            drop_last=drop_last, update=incremental_update, save_dir=save_dir)
+    if shard_dir is not None and not in_memory:
+        # Stream batches straight from the memory-mapped shard
+        X, y = load_shard(shard_dir, machine_id, total_machines)
+        train_idx, test_idx = _split_indices(len(X), seed)
+        train_loader = MemmapBatchLoader(X, y, train_idx, batch_size=batch_size, shuffle=True,
+                                         drop_last=drop_last, seed=shuffle_seed)
+        test_loader = MemmapBatchLoader(X, y, np.sort(test_idx), batch_size=batch_size, shuffle=False)
+        return train_loader, test_loader
+    X_train, y_train, X_test, y_test = load_and_preprocess_data(path, machine_id, total_machines, seed,
+                                                                cache_dir, shard_dir, sparse, preprocessor)
+    train_loader = BatchLoader(X_train, y_train, batch_size=batch_size, shuffle=True,
+                               drop_last=drop_last, seed=shuffle_seed)
+    test_loader = BatchLoader(X_test, y_test, batch_size=batch_size, shuffle=False)
+    return train_loader, test_loader
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import torch
+from model import SimpleBinaryClassifier, metrics_from_counts
+from train import confusion_matrix, evaluate_curves
+
+logger = logging.getLogger(__name__)
+
+
+def model_checksum(state_dict):
+    """sha256 of a state_dict's tensors in key order; equal weights give equal checksums on every node."""
+    m = hashlib.sha256()
+    for k in sorted(state_dict.keys()):
+        v = state_dict[k]
+        if torch.is_tensor(v):
+            m.update(k.encode())
+            m.update(v.detach().cpu().numpy().tobytes())
+    return m.hexdigest()
+
+
+class LocalEvaluator:
+    """
+    This node's test set, held in memory for the life of the process, with
+    results memoized by model checksum so a model is evaluated at most once.
+    Thread-safe: the gRPC server's Evaluate handler and the round loop share it.
+    Args:
+        test_loader: Loader over the node's test split (e.g. Trainer.test_loader)
+        input_dim: Model input dimension
+        cache_size: Number of models whose results are kept
+    """
+    def __init__(self, test_loader, input_dim, cache_size=64):
+        self.test_loader = test_loader
+        self.model = SimpleBinaryClassifier(input_dim)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = None  # Checksum of the weights currently in self.model
+
+    @classmethod
+    def from_trainer(cls, trainer, cache_size=64):
+        return cls(trainer.test_loader, trainer.input_dim, cache_size)
+
+    def refresh(self, test_loader):
+        """Switch to a new test set (e.g. after incremental updates), dropping results computed on the old one."""
+        with self._lock:
+            if test_loader is not self.test_loader:
+                self.test_loader = test_loader
+                self._cache.clear()
+
+    @property
+    def num_samples(self):
+        return len(self.test_loader.dataset)
+
+    def cached(self, checksum):
+        return checksum in self._cache
+
+    def _entry(self, state_dict, checksum):
+        """Cached results of a model, loading it into the evaluation model on a miss. Caller holds the lock."""
+        checksum = checksum or model_checksum(state_dict)
+        if checksum in self._cache:
+            self._cache.move_to_end(checksum)
+            return self._cache[checksum]
+        if state_dict is None:
+            raise KeyError(f"No cached evaluation for model {checksum[:12]}")
+        self._load(state_dict, checksum)
+        entry = {'counts': confusion_matrix(self.model, self.test_loader), 'curves': None}
+        self._cache[checksum] = entry
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    def _load(self, state_dict, checksum):
+        if self._loaded != checksum:
+            self.model.load_state_dict(state_dict)
+            self._loaded = checksum
+
+    def counts(self, state_dict=None, checksum=None):
+        """
+        Confusion counts [tp, fp, fn, tn] at threshold 0.5. state_dict may be
+        omitted when a result for checksum is already cached.
+        """
+        with self._lock:
+            return self._entry(state_dict, checksum)['counts'].clone()
+
+    def metrics(self, state_dict=None, checksum=None):
+        """accuracy, precision, recall, f1"""
+        return metrics_from_counts(self.counts(state_dict, checksum))
+
+    def curves(self, state_dict, checksum=None, bins=None):
+        """Threshold sweep (see train.evaluate_curves), memoized with the counts."""
+        checksum = checksum or model_checksum(state_dict)
+        with self._lock:
+            entry = self._entry(state_dict, checksum)
+            if entry['curves'] is None or entry['curves'][0] != bins:
+                self._load(state_dict, checksum)
+                entry['curves'] = (bins, evaluate_curves(self.model, self.test_loader, bins))
+            return entry['curves'][1]
+
+
+def federated_counts(evaluator, state_dict, peer_addresses, own_address, node_id="", timeout=30):
+    """
+    Confusion counts of a model summed over this node's and every reachable
+    peer's test split (peers evaluate it with the Evaluate RPC; no data moves).
+    Returns:
+        counts tensor [tp, fp, fn, tn], {node: counts} for every node that answered
+    """
+    from grpc_client import request_evaluation
+    checksum = model_checksum(state_dict)
+    per_node = {own_address: evaluator.counts(state_dict, checksum)}
+    for addr in peer_addresses:
+        if addr == own_address:
+            continue
+        response = request_evaluation(state_dict, addr, checksum=checksum, timeout=timeout, node_id=node_id)
+        if response is None:
+            continue
+        per_node[addr] = torch.tensor([response.true_positive, response.false_positive,
+                                       response.false_negative, response.true_negative])
+    return torch.stack(list(per_node.values())).sum(0), per_node
@@ -0,0 +1,120 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+import model_pb2
+from data import Preprocessor, local_frame, PREPROCESSOR_FILE, NORMALIZE_COLUMNS, CATEGORICAL_COLUMNS
+from grpc_client import fetch_stats
+from grpc_server import set_local_stats
+
+logger = logging.getLogger(__name__)
+
+
+def local_feature_stats(df, node_id="", numeric_columns=NORMALIZE_COLUMNS, categorical_columns=CATEGORICAL_COLUMNS):
+    """
+    Sufficient statistics of a cleaned DataFrame: row count, per-column
+    sum and sum of squares, and per-category counts. No rows leave the node.
+    Returns:
+        model_pb2.FeatureStats
+    """
+    values = df[list(numeric_columns)].to_numpy(dtype=np.float64)
+    stats = model_pb2.FeatureStats(
+        node_id=node_id,
+        count=len(df),
+        numeric_columns=list(numeric_columns),
+        sum=values.sum(axis=0).tolist(),
+        sum_sq=(values ** 2).sum(axis=0).tolist(),
+    )
+    for col in categorical_columns:
+        for value, count in df[col].value_counts().items():
+            stats.categories.add(column=col, value=str(value), count=int(count))
+    return stats
+
+
+def federation_digest(peer_addresses, own_address):
+    """Short hash identifying the set of nodes taking part in a stats round."""
+    members = sorted(set(peer_addresses) | {own_address})
+    return hashlib.sha256("\n".join(members).encode()).hexdigest()[:16]
+
+
+def merge_feature_stats(stats_list, categorical_columns=CATEGORICAL_COLUMNS, federation=None):
+    """
+    Combine FeatureStats from all nodes into the Preprocessor a centralized
+    StandardScaler + get_dummies fit on the union of their data would give.
+    federation is recorded on the result (see federation_digest).
+    """
+    numeric_columns = list(stats_list[0].numeric_columns)
+    for stats in stats_list:
+        if list(stats.numeric_columns) != numeric_columns:
+            raise ValueError(f"Node {stats.node_id} reports numeric columns {list(stats.numeric_columns)}, "
+                             f"expected {numeric_columns}")
+    count = sum(stats.count for stats in stats_list)
+    if count == 0:
+        raise ValueError("No rows in any node's statistics")
+    total = np.sum([stats.sum for stats in stats_list], axis=0)
+    total_sq = np.sum([stats.sum_sq for stats in stats_list], axis=0)
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0.0))
+    scale = np.where(std == 0, 1.0, std)  # Same zero-variance handling as StandardScaler
+    vocabulary = {col: set() for col in categorical_columns}
+    for stats in stats_list:
+        for entry in stats.categories:
+            if entry.column in vocabulary and entry.count > 0:
+                vocabulary[entry.column].add(entry.value)
+    vocabulary = {col: sorted(values) for col, values in vocabulary.items()}
+    return Preprocessor(vocabulary, mean, scale, numeric_columns, categorical_columns, federation=federation)
+
+
+def run_stats_round(peer_addresses, own_address, path="adults.csv", machine_id=0, total_machines=4,
+                    save_dir="models", node_id="", timeout=300, retry_delay=3):
+    """
+    Pre-training round: share this node's feature statistics and build the
+    global preprocessor from every node's. The result is saved as
+    save_dir/preprocessor.json, and reused without a new round if that file
+    was built by a round over the same peer set. Local statistics are
+    published either way, so peers still running their round can fetch them.
+    Args:
+        peer_addresses: All peer addresses (host:port), may include own_address
+        own_address: This node's address, skipped when fetching
+        path, machine_id, total_machines: This node's local data
+        save_dir: Where the preprocessor is cached
+        node_id: Node identifier for logging
+        timeout: Seconds to wait for all peers to report
+        retry_delay: Seconds between polls of peers that are not ready
+    Returns:
+        The global Preprocessor
+    """
+    local_stats = local_feature_stats(local_frame(path, machine_id, total_machines), node_id)
+    set_local_stats(local_stats)
+
+    federation = federation_digest(peer_addresses, own_address)
+    preprocessor_path = os.path.join(save_dir, PREPROCESSOR_FILE)
+    if os.path.exists(preprocessor_path):
+        cached = Preprocessor.load(preprocessor_path)
+        if cached.federation == federation:
+            logger.info(f"Using cached global preprocessor {preprocessor_path}")
+            return cached
+        # A local fit (or a round over other peers) must not stand in for this round's result
+        logger.info(f"Ignoring {preprocessor_path}: not built by a stats round over these peers")
+    pending = [addr for addr in peer_addresses if addr != own_address]
+    collected = [local_stats]
+    start_time = time.time()
+    while pending:
+        for addr in list(pending):
+            stats = fetch_stats(addr, node_id=node_id)
+            if stats is not None:
+                collected.append(stats)
+                pending.remove(addr)
+                logger.info(f"Received feature statistics from {addr} ({stats.count} rows)")
+        if pending:
+            if time.time() - start_time > timeout:
+                raise TimeoutError(f"Timeout waiting for feature statistics from {pending} after {timeout}s")
+            time.sleep(retry_delay)
+
+    preprocessor = merge_feature_stats(collected, federation=federation)
+    os.makedirs(save_dir, exist_ok=True)
+    preprocessor.save(preprocessor_path)
+    logger.info(f"Built global preprocessor from {len(collected)} nodes "
+                f"({sum(s.count for s in collected)} rows, {preprocessor.input_dim} features)")
+    return preprocessor
@@ -1,12 +1,123 @@
 import grpc
 import model_pb2
 import model_pb2_grpc
-import pickle
+import uuid
+import time
+import random
+import atexit
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import torch
 import logging
+import wire
 
 logger = logging.getLogger(__name__)
 
+GRPC_OPTIONS = [
+    ('grpc.max_send_message_length', 100 * 1024 * 1024),
+    ('grpc.max_receive_message_length', 100 * 1024 * 1024),
+]
+
+# Keep pooled connections alive between rounds and notice dead peers; the server permits these pings
+KEEPALIVE_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30 * 1000),
+    ('grpc.keepalive_timeout_ms', 10 * 1000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.max_reconnect_backoff_ms', 5 * 1000),  # Reconnect to a peer that comes back within seconds
+]
+
+CHANNEL_IDLE_TIMEOUT = 600  # Seconds a pooled channel may go unused before it is closed
+
+# Models whose tensors are larger than this are sent with SendModelStream instead of one SendModel message
+STREAM_THRESHOLD = 16 * 1024 * 1024
+
+def create_channel(address, use_ssl=False, ssl_cert=None):
+    """Open a channel to a peer, secured with ssl_cert if use_ssl is set"""
+    if use_ssl and ssl_cert:
+        with open(ssl_cert, 'rb') as f:
+            credentials = grpc.ssl_channel_credentials(f.read())
+        return grpc.secure_channel(address, credentials, options=GRPC_OPTIONS + KEEPALIVE_OPTIONS)
+    return grpc.insecure_channel(address, options=GRPC_OPTIONS + KEEPALIVE_OPTIONS)
+
+class _PooledChannel:
+    def __init__(self, channel):
+        self.channel = channel
+        self.stub = model_pb2_grpc.FLPeerStub(channel)
+        # SendModel taking an already serialized ModelWeights, so a fan-out serializes the update once
+        self.send_serialized = channel.unary_unary('/fl.FLPeer/SendModel', request_serializer=None,
+                                                   response_deserializer=model_pb2.Ack.FromString)
+        self.state = grpc.ChannelConnectivity.IDLE
+        self.active = 0  # RPCs in flight
+        self.last_used = time.monotonic()
+        channel.subscribe(self._on_state)
+
+    def _on_state(self, state):
+        self.state = state
+
+    def close(self):
+        self.channel.unsubscribe(self._on_state)
+        self.channel.close()
+
+class ChannelPool:
+    """
+    Process-wide long-lived channels, one per (address, credentials), so
+    connection and TLS setup is paid once per peer instead of once per RPC.
+    Channels keep their connection alive with keepalive pings and reconnect
+    on their own; each one's connectivity state is tracked. Channels with no
+    RPC in flight for idle_timeout seconds are closed.
+    """
+    def __init__(self, idle_timeout=CHANNEL_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stub(self, address, use_ssl=False, ssl_cert=None):
+        """FLPeerStub on the pooled channel to address, held for the duration of the with block"""
+        with self.checkout(address, use_ssl, ssl_cert) as entry:
+            yield entry.stub
+
+    @contextmanager
+    def checkout(self, address, use_ssl=False, ssl_cert=None):
+        key = (address, ssl_cert if use_ssl else None)
+        with self._lock:
+            self._evict_idle()
+            entry = self._channels.get(key)
+            if entry is None:
+                entry = self._channels[key] = _PooledChannel(create_channel(address, use_ssl, ssl_cert))
+            entry.active += 1
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.active -= 1
+                entry.last_used = time.monotonic()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, entry in list(self._channels.items()):
+            if entry.active == 0 and now - entry.last_used > self.idle_timeout:
+                logger.info(f"Closing idle channel to {key[0]}")
+                entry.close()
+                del self._channels[key]
+
+    def states(self):
+        """{address: grpc.ChannelConnectivity} of every pooled channel"""
+        with self._lock:
+            return {key[0]: entry.state for key, entry in self._channels.items()}
+
+    def close(self):
+        with self._lock:
+            for entry in self._channels.values():
+                entry.close()
+            self._channels.clear()
+
+channel_pool = ChannelPool()
+atexit.register(channel_pool.close)
+
 def send_model(state_dict, address="localhost:50051", round_num=1, timeout=30, use_ssl=False, ssl_cert=None, node_id=None):
     """
     Send model weights to a peer
@@ -21,36 +132,242 @@ def send_model(state_dict, address="localhost:50051", round_num=1, timeout=30, u
     Returns:
         bool: True if successful, False otherwise
     """
+    if sum(v.numel() * v.element_size() for v in state_dict.values() if torch.is_tensor(v)) > STREAM_THRESHOLD:
+        return send_model_stream(state_dict, address, round_num=round_num, use_ssl=use_ssl, ssl_cert=ssl_cert,
+                                 node_id=node_id)
     try:
-        # Create channel with proper security and increased message size
-        grpc_options = [
-            ('grpc.max_send_message_length', 100 * 1024 * 1024),
-            ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-        ]
-        if use_ssl and ssl_cert:
-            with open(ssl_cert, 'rb') as f:
-                credentials = grpc.ssl_channel_credentials(f.read())
-            channel = grpc.secure_channel(address, credentials, options=grpc_options)
-        else:
-            channel = grpc.insecure_channel(address, options=grpc_options)
+        # Pooled channel with proper security and increased message size
+        with channel_pool.stub(address, use_ssl, ssl_cert) as stub:
+            try:
+                # Serialize and send model; fails fast if the peer refuses connections
+                serialized = wire.encode(state_dict)
+                response = stub.SendModel(
+                    model_pb2.ModelWeights(round=round_num, weights=serialized, format=model_pb2.TENSORS_V1),
+                    timeout=timeout
+                )
+                logger.info(f"Model sent successfully to {address} (Node: {node_id}): {response.message}")
+                return True
+            except grpc.RpcError as rpc_error:
+                logger.error(f"RPC error when sending to {address} (Node: {node_id}): {rpc_error.code()}: {rpc_error.details()}")
+                return False
+    except Exception as e:
+        logger.error(f"Failed to send model to {address} (Node: {node_id}): {str(e)}")
+        return False
 
-        # Create stub with timeout
-        stub = model_pb2_grpc.FLPeerStub(channel)
-        try:
-            # Serialize and send model
-            serialized = pickle.dumps(state_dict)
-            response = stub.SendModel(
-                model_pb2.ModelWeights(round=round_num, weights=serialized),
-                timeout=timeout
-            )
-            logger.info(f"Model sent successfully to {address} (Node: {node_id}): {response.message}")
-            return True
-        except grpc.RpcError as rpc_error:
-            logger.error(f"RPC error when sending to {address} (Node: {node_id}): {rpc_error.code()}: {rpc_error.details()}")
+class EncodedUpload:
+    """
+    A model encoded once for SendModelStream: its chunks, each chunk's sha256
+    and the manifest. One instance is reused for every peer and every resume,
+    so the model is encoded and hashed a single time per fan-out.
+    Args:
+        state_dict: PyTorch model state dictionary
+        chunk_size: Bytes per chunk
+    """
+    def __init__(self, state_dict, chunk_size=wire.CHUNK_SIZE):
+        self.chunks = list(wire.encode_chunks(state_dict, chunk_size))
+        self.hashes = [hashlib.sha256(data).hexdigest() for data in self.chunks]
+        total_hash = hashlib.sha256()
+        for data in self.chunks:
+            total_hash.update(data)
+        self.manifest = model_pb2.UploadManifest(num_chunks=len(self.chunks),
+                                                 total_bytes=sum(len(data) for data in self.chunks),
+                                                 sha256=total_hash.hexdigest())
+
+    def messages(self, upload_id, round_num, start=0, node_id=None):
+        """ModelChunk messages from chunk start on, then the manifest"""
+        for index in range(start, len(self.chunks)):
+            yield model_pb2.ModelChunk(upload_id=upload_id, round=round_num, format=model_pb2.TENSORS_V1, index=index,
+                                       data=self.chunks[index], sha256=self.hashes[index], peer_id=node_id or "")
+        yield model_pb2.ModelChunk(upload_id=upload_id, round=round_num, format=model_pb2.TENSORS_V1,
+                                   index=len(self.chunks), manifest=self.manifest, peer_id=node_id or "")
+
+def send_model_stream(state_dict, address="localhost:50051", round_num=1, chunk_size=wire.CHUNK_SIZE, timeout=300,
+                      max_resumes=3, base_delay=1.0, use_ssl=False, ssl_cert=None, node_id=None):
+    """
+    Send model weights to a peer as a stream of hashed chunks (SendModelStream).
+    The message size limits do not apply. If the stream breaks, the upload
+    resumes after a backoff (see backoff_delay) from the first chunk the peer
+    has not verified, up to max_resumes times.
+    Args:
+        state_dict: PyTorch model state dictionary, or an EncodedUpload of one to reuse
+        chunk_size: Bytes per chunk (ignored for an EncodedUpload)
+        timeout: Timeout in seconds of each attempt
+        base_delay: Backoff before the first resume, in seconds; doubles per resume
+        Others as for send_model
+    Returns:
+        bool: True if the peer accepted the model, False otherwise
+    """
+    upload_id = f"{node_id or 'node'}-{uuid.uuid4().hex}"
+    try:
+        upload = state_dict if isinstance(state_dict, EncodedUpload) else EncodedUpload(state_dict, chunk_size)
+        with channel_pool.stub(address, use_ssl, ssl_cert) as stub:
+            start = 0
+            for attempt in range(max_resumes + 1):
+                if attempt > 0:
+                    time.sleep(backoff_delay(attempt - 1, base_delay))
+                try:
+                    status = stub.SendModelStream(upload.messages(upload_id, round_num, start, node_id),
+                                                  timeout=timeout)
+                    logger.info(f"Model streamed to {address} (Node: {node_id}): {status.message}")
+                    return status.complete
+                except grpc.RpcError as rpc_error:
+                    logger.warning(f"Upload to {address} interrupted at attempt {attempt + 1} (Node: {node_id}): "
+                                   f"{rpc_error.code()}: {rpc_error.details()}")
+                try:
+                    status = stub.GetUploadStatus(model_pb2.UploadStatusRequest(upload_id=upload_id), timeout=10)
+                except grpc.RpcError:
+                    continue  # Peer unreachable: retry from the last known position
+                if status.complete:
+                    return True
+                start = status.next_chunk
+                logger.info(f"Resuming upload to {address} from chunk {start} (Node: {node_id})")
+            logger.error(f"Failed to stream model to {address} after {max_resumes + 1} attempts (Node: {node_id})")
             return False
-        finally:
-            channel.close()
     except Exception as e:
-        logger.error(f"Failed to send model to {address} (Node: {node_id}): {str(e)}")
+        logger.error(f"Failed to stream model to {address} (Node: {node_id}): {str(e)}")
         return False
 
+# Status codes after which a send is retried; anything else (e.g. INVALID_ARGUMENT) will fail again.
+# DEADLINE_EXCEEDED is not among them: the peer may still have queued the model, and SendModel is not idempotent
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.ABORTED)
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=10.0):
+    """Exponential backoff with jitter: uniform in [d/2, d] for d = base_delay * 2**attempt, capped at max_delay"""
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+def _send_with_backoff(request, address, timeout, max_attempts, base_delay, use_ssl, ssl_cert):
+    outcome = {'address': address, 'success': False, 'attempts': 0, 'seconds': 0.0, 'message': '', 'error': None}
+    start = time.perf_counter()
+    for attempt in range(max_attempts):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt - 1, base_delay))
+        outcome['attempts'] = attempt + 1
+        try:
+            # Fail fast (no wait_for_ready): a peer that refuses connections costs the backoff, not the timeout
+            with channel_pool.checkout(address, use_ssl, ssl_cert) as entry:
+                response = entry.send_serialized(request, timeout=timeout)
+            outcome.update(success=True, message=response.message, error=None)
+            break
+        except grpc.RpcError as rpc_error:
+            outcome['error'] = f"{rpc_error.code()}: {rpc_error.details()}"
+            if rpc_error.code() not in RETRYABLE_CODES:
+                break
+        except Exception as e:
+            outcome['error'] = str(e)
+            break
+    outcome['seconds'] = time.perf_counter() - start
+    return outcome
+
+def _stream_to_peer(upload, address, round_num, timeout, max_attempts, base_delay, use_ssl, ssl_cert, node_id):
+    start = time.perf_counter()
+    success = send_model_stream(upload, address, round_num=round_num, timeout=timeout, max_resumes=max_attempts - 1,
+                                base_delay=base_delay, use_ssl=use_ssl, ssl_cert=ssl_cert, node_id=node_id)
+    return {'address': address, 'success': success, 'attempts': None, 'seconds': time.perf_counter() - start,
+            'message': 'streamed' if success else '', 'error': None if success else "Upload failed"}
+
+def send_model_to_peers(state_dict, addresses, round_num=1, timeout=30, max_attempts=3, base_delay=1.0,
+                        use_ssl=False, ssl_cert=None, node_id=None, max_workers=32):
+    """
+    Send the same model to several peers at once. The update is serialized
+    once into a ModelWeights message whose bytes every send reuses; sends run
+    concurrently on pooled channels, each retrying retryable failures with
+    jittered exponential backoff (see backoff_delay), so the send phase takes
+    about as long as the slowest peer rather than the sum over peers.
+    Models above STREAM_THRESHOLD are encoded once into an EncodedUpload and
+    streamed to each peer instead (send_model_stream), resuming with the same
+    backoff; timeout then applies to each streaming attempt.
+    Args:
+        addresses: Peer gRPC addresses (host:port)
+        max_attempts: Attempts per peer
+        base_delay: Backoff before the second attempt, in seconds; doubles per attempt
+        max_workers: Most sends in flight at once
+        Others as for send_model
+    Yields:
+        One dict per peer as its send finishes: address, success, attempts
+        (None for streamed uploads), seconds, message (the peer's Ack) and error
+    """
+    if not addresses:
+        return
+    streamed = sum(v.numel() * v.element_size() for v in state_dict.values() if torch.is_tensor(v)) > STREAM_THRESHOLD
+    if streamed:
+        upload = EncodedUpload(state_dict)
+    else:
+        request = model_pb2.ModelWeights(round=round_num, weights=wire.encode(state_dict),
+                                         format=model_pb2.TENSORS_V1).SerializeToString()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(addresses))) as executor:
+        if streamed:
+            futures = [executor.submit(_stream_to_peer, upload, addr, round_num, timeout, max_attempts, base_delay,
+                                       use_ssl, ssl_cert, node_id) for addr in addresses]
+        else:
+            futures = [executor.submit(_send_with_backoff, request, addr, timeout, max_attempts, base_delay, use_ssl,
+                                       ssl_cert) for addr in addresses]
+        for future in as_completed(futures):
+            outcome = future.result()
+            if outcome['success']:
+                logger.info(f"Model sent to {outcome['address']} (Node: {node_id}) in {outcome['seconds']:.2f}s")
+            else:
+                logger.error(f"Failed to send model to {outcome['address']} (Node: {node_id}): {outcome['error']}")
+            yield outcome
+
+def fetch_stats(address="localhost:50051", timeout=10, use_ssl=False, ssl_cert=None, node_id=None):
+    """
+    Fetch a peer's feature statistics
+    Args:
+        address: gRPC server address (host:port)
+        timeout: Timeout in seconds
+        use_ssl: Whether to use SSL/TLS
+        ssl_cert: Path to SSL certificate file
+        node_id: Node identifier, sent as the requesting peer
+    Returns:
+        model_pb2.FeatureStats, or None if the peer is unreachable or not ready
+    """
+    try:
+        with channel_pool.stub(address, use_ssl, ssl_cert) as stub:
+            try:
+                return stub.GetStats(model_pb2.StatsRequest(peer_id=node_id or ""), timeout=timeout)
+            except grpc.RpcError as rpc_error:
+                logger.warning(f"Could not fetch stats from {address} (Node: {node_id}): {rpc_error.code()}: {rpc_error.details()}")
+                return None
+    except Exception as e:
+        logger.error(f"Failed to fetch stats from {address} (Node: {node_id}): {str(e)}")
+        return None
+
+def request_evaluation(state_dict, address="localhost:50051", checksum=None, timeout=30, use_ssl=False, ssl_cert=None,
+                       node_id=None):
+    """
+    Ask a peer to score a model on its test split. Only the checksum is sent
+    at first; the weights follow if the peer has no cached result for it.
+    Args:
+        state_dict: PyTorch model state dictionary
+        address: gRPC server address (host:port)
+        checksum: evaluation.model_checksum of state_dict, computed if None
+        timeout: Timeout in seconds
+        use_ssl: Whether to use SSL/TLS
+        ssl_cert: Path to SSL certificate file
+        node_id: Node identifier, sent as the requesting peer
+    Returns:
+        model_pb2.EvaluateResponse with the peer's confusion counts, or None on failure
+    """
+    try:
+        if checksum is None:
+            from evaluation import model_checksum
+            checksum = model_checksum(state_dict)
+        with channel_pool.stub(address, use_ssl, ssl_cert) as stub:
+            try:
+                try:
+                    return stub.Evaluate(model_pb2.EvaluateRequest(peer_id=node_id or "", checksum=checksum),
+                                         timeout=timeout)
+                except grpc.RpcError as rpc_error:
+                    if rpc_error.code() not in (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.FAILED_PRECONDITION):
+                        raise
+                # The peer has not scored this model yet
+                request = model_pb2.EvaluateRequest(peer_id=node_id or "", checksum=checksum,
+                                                    weights=wire.encode(state_dict), format=model_pb2.TENSORS_V1)
+                return stub.Evaluate(request, timeout=timeout)
+            except grpc.RpcError as rpc_error:
+                logger.warning(f"Could not get evaluation from {address} (Node: {node_id}): {rpc_error.code()}: {rpc_error.details()}")
+                return None
+    except Exception as e:
+        logger.error(f"Failed to request evaluation from {address} (Node: {node_id}): {str(e)}")
+        return None
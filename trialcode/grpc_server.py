@@ -10,6 +10,9 @@ from queue import Queue
 import ssl
 import datetime
 import hashlib
+import time
+from collections import OrderedDict
+import wire
 
 # Configure logging
 logging.basicConfig(
@@ -25,47 +28,171 @@ model_lock = threading.Lock()
 # Global current round
 current_round = 1
 
+# Unpickling runs arbitrary code from the sender, so pickled weights from older peers are refused by default
+ACCEPT_PICKLE = False
+
 SAVE_MODEL_DEBUG = True  # Toggle to save received models for inspection
 NODE_ID = 'NodeB'  # Set this to a unique identifier for each node (e.g., from host_config.yaml)
 
+SERVER_OPTIONS = [
+    ('grpc.max_send_message_length', 100 * 1024 * 1024),
+    ('grpc.max_receive_message_length', 100 * 1024 * 1024),
+    # Accept the keepalive pings of peers' pooled channels (grpc_client.KEEPALIVE_OPTIONS)
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_recv_ping_interval_without_data_ms', 10 * 1000),
+]
+
+# SendModelStream uploads in progress by upload_id, and the chunk counts of recently completed ones
+uploads = {}
+completed_uploads = OrderedDict()
+upload_lock = threading.Lock()
+UPLOAD_TTL = 600  # Seconds an interrupted upload is kept for its sender to resume
+MAX_COMPLETED_UPLOADS = 1024
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024  # Largest model SendModelStream buffers, the same cap as a SendModel message
+MAX_UPLOADS_PER_PEER = 4  # Unfinished uploads buffered at once for one peer host
+
+# This node's feature statistics, served to peers by GetStats (see fedstats.py)
+local_stats = None
+
+# This node's evaluation.LocalEvaluator, used by Evaluate
+local_evaluator = None
+
 def set_current_round(r):
     global current_round
     current_round = r
 
+def set_local_stats(stats):
+    global local_stats
+    local_stats = stats
+
+def set_local_evaluator(evaluator):
+    global local_evaluator
+    local_evaluator = evaluator
+
+def decode_weights(weights, weights_format):
+    """state_dict from the weights bytes of a ModelWeights, EvaluateRequest or upload, according to its format tag"""
+    if weights_format == model_pb2.TENSORS_V1:
+        return wire.decode(weights)
+    if weights_format == model_pb2.PICKLE and ACCEPT_PICKLE:
+        return pickle.loads(weights)
+    raise ValueError(f"Weights format {model_pb2.WeightsFormat.Name(weights_format)} not accepted")
+
+def accept_model(state_dict, peer_addr, now):
+    """Queue a received model for aggregation, log it, and save it in debug mode"""
+    # Thread-safe append to received models
+    with model_lock:
+        received_models.append(state_dict)
+        count = len(received_models)
+
+    # Model size and checksum
+    model_size = sum(v.numel() for v in state_dict.values() if torch.is_tensor(v)) * 4 / 1024
+    checksum = hashlib.sha256()
+    for k in sorted(state_dict.keys()):
+        v = state_dict[k]
+        if torch.is_tensor(v):
+            checksum.update(v.cpu().numpy().tobytes())
+    checksum_str = checksum.hexdigest()[:12]
+    logger.info(f"Received model weights from {peer_addr} (total received: {count}) | Size: {model_size:.2f} KB | Checksum: {checksum_str} | Node: {NODE_ID}")
+    print(f"[SERVER][{now}] Received model from {peer_addr} (total received: {count}) | Size: {model_size:.2f} KB | Checksum: {checksum_str} | Node: {NODE_ID}")
+    if SAVE_MODEL_DEBUG:
+        fname = f"received_model_{NODE_ID}_from_{peer_addr.replace(':', '_')}_round{current_round}_idx{count}.pt"
+        torch.save(state_dict, fname)
+        print(f"[SERVER][DEBUG] Saved received model to {fname}")
+    return count
+
+class UploadRejected(Exception):
+    """An upload refused before it is buffered further; code is the grpc.StatusCode to return"""
+    def __init__(self, code, details):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+def peer_host(peer_addr):
+    """Host part of a context.peer() string such as 'ipv4:10.0.0.2:53124', without the ephemeral port"""
+    return peer_addr.rsplit(':', 1)[0]
+
+class _Upload:
+    """Verified prefix of a SendModelStream upload"""
+    def __init__(self, weights_format, peer):
+        self.format = weights_format
+        self.peer = peer
+        self.data = bytearray()
+        self.hasher = hashlib.sha256()
+        self.next_chunk = 0
+        self.lock = threading.Lock()  # A resumed stream may overlap the handler of the interrupted one
+        self.updated = time.monotonic()
+
+def get_upload(upload_id, weights_format, peer):
+    """
+    The upload to continue, a new one, or None if upload_id already completed.
+    Raises UploadRejected if peer already has MAX_UPLOADS_PER_PEER unfinished uploads
+    """
+    host = peer_host(peer)
+    with upload_lock:
+        now = time.monotonic()
+        for stale in [k for k, u in uploads.items() if now - u.updated > UPLOAD_TTL]:
+            logger.info(f"Dropped stale upload {stale}")
+            del uploads[stale]
+        if upload_id in completed_uploads:
+            return None
+        if upload_id not in uploads:
+            if sum(u.peer == host for u in uploads.values()) >= MAX_UPLOADS_PER_PEER:
+                raise UploadRejected(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                     f"{MAX_UPLOADS_PER_PEER} uploads from {host} already in progress")
+            uploads[upload_id] = _Upload(weights_format, host)
+        return uploads[upload_id]
+
+def add_chunk(upload, chunk):
+    """
+    Verify and append the next chunk of an upload; chunks it already holds are skipped. False if rejected.
+    Raises UploadRejected if the upload would grow past MAX_UPLOAD_BYTES
+    """
+    with upload.lock:
+        if chunk.index < upload.next_chunk:
+            return True
+        if chunk.index > upload.next_chunk or hashlib.sha256(chunk.data).hexdigest() != chunk.sha256:
+            return False
+        if len(upload.data) + len(chunk.data) > MAX_UPLOAD_BYTES:
+            raise UploadRejected(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                 f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+        upload.data += chunk.data
+        upload.hasher.update(chunk.data)
+        upload.next_chunk += 1
+        upload.updated = time.monotonic()
+        return True
+
+def _finish_upload(upload_id, upload, num_chunks):
+    with upload_lock:
+        uploads.pop(upload_id, None)
+        if num_chunks is not None:
+            completed_uploads[upload_id] = num_chunks
+            if len(completed_uploads) > MAX_COMPLETED_UPLOADS:
+                completed_uploads.popitem(last=False)
+
+def reject_upload(upload_id, upload, error, peer_addr, context):
+    """Drop an upload refused with UploadRejected and report the error's status code"""
+    if upload is not None:
+        _finish_upload(upload_id, upload, None)
+    logger.warning(f"Rejected upload {upload_id} from {peer_addr}: {error.details}")
+    context.set_code(error.code)
+    context.set_details(error.details)
+    return model_pb2.UploadStatus(upload_id=upload_id or "", message=f"Error: {error.details}")
+
 class FLPeerServicer(model_pb2_grpc.FLPeerServicer):
     def SendModel(self, request, context):
         peer_addr = context.peer()
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         if hasattr(request, 'round') and request.round != current_round:
             logger.info(f"Ignored model from {peer_addr} for round {request.round} (current round: {current_round})")
             print(f"[SERVER][{now}] Ignored model from {peer_addr} for round {request.round} (current round: {current_round}) | Node: {NODE_ID}")
             return model_pb2.Ack(message="Ignored: wrong round")
         try:
             # Deserialize model weights
-            state_dict = pickle.loads(request.weights)
-            
-            # Thread-safe append to received models
-            with model_lock:
-                received_models.append(state_dict)
-                count = len(received_models)
-            
-            # Model size and checksum
-            model_size = sum(v.numel() for v in state_dict.values() if torch.is_tensor(v)) * 4 / 1024
-            checksum = hashlib.sha256()
-            for k in sorted(state_dict.keys()):
-                v = state_dict[k]
-                if torch.is_tensor(v):
-                    checksum.update(v.cpu().numpy().tobytes())
-            checksum_str = checksum.hexdigest()[:12]
-            logger.info(f"Received model weights from {peer_addr} (total received: {count}) | Size: {model_size:.2f} KB | Checksum: {checksum_str} | Node: {NODE_ID}")
-            print(f"[SERVER][{now}] Received model from {peer_addr} (total received: {count}) | Size: {model_size:.2f} KB | Checksum: {checksum_str} | Node: {NODE_ID}")
-            if SAVE_MODEL_DEBUG:
-                fname = f"received_model_{NODE_ID}_from_{peer_addr.replace(':', '_')}_round{current_round}_idx{count}.pt"
-                torch.save(state_dict, fname)
-                print(f"[SERVER][DEBUG] Saved received model to {fname}")
+            state_dict = decode_weights(request.weights, request.format)
+            accept_model(state_dict, peer_addr, now)
             return model_pb2.Ack(message="Model received successfully")
             
-        except pickle.UnpicklingError as e:
+        except (ValueError, pickle.UnpicklingError) as e:
             logger.error(f"Failed to deserialize model from {context.peer()}: {str(e)}")
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details("Invalid model format")
@@ -77,6 +204,86 @@ class FLPeerServicer(model_pb2_grpc.FLPeerServicer):
             context.set_details(str(e))
             return model_pb2.Ack(message=f"Error: {str(e)}")
 
+    def SendModelStream(self, request_iterator, context):
+        """
+        Receive a model as hashed chunks. Each chunk is verified and appended
+        in index order; chunks the receiver already holds (resent after a
+        resume) are skipped. The upload is decoded once the manifest matches.
+        """
+        peer_addr = context.peer()
+        upload_id, upload = None, None
+        try:
+            for chunk in request_iterator:
+                if upload_id is None:
+                    upload_id = chunk.upload_id
+                    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    if chunk.round != current_round:
+                        logger.info(f"Ignored upload from {peer_addr} for round {chunk.round} (current round: {current_round})")
+                        print(f"[SERVER][{now}] Ignored upload from {peer_addr} for round {chunk.round} (current round: {current_round}) | Node: {NODE_ID}")
+                        return model_pb2.UploadStatus(upload_id=upload_id, message="Ignored: wrong round")
+                    upload = get_upload(upload_id, chunk.format, peer_addr)
+                    if upload is None:
+                        return model_pb2.UploadStatus(upload_id=upload_id, next_chunk=completed_uploads.get(upload_id, 0),
+                                                      complete=True, message="Already received")
+                if chunk.HasField('manifest'):
+                    return self._complete_upload(upload_id, upload, chunk.manifest, peer_addr, context)
+                if not add_chunk(upload, chunk):
+                    # The sender resumes from next_chunk (see GetUploadStatus)
+                    context.set_code(grpc.StatusCode.DATA_LOSS)
+                    context.set_details(f"Chunk {chunk.index} rejected, expected chunk {upload.next_chunk} with a matching hash")
+                    return model_pb2.UploadStatus(upload_id=upload_id, next_chunk=upload.next_chunk)
+            context.set_code(grpc.StatusCode.ABORTED)
+            context.set_details("Stream ended before the manifest")
+            return model_pb2.UploadStatus(upload_id=upload_id or "", next_chunk=upload.next_chunk if upload else 0)
+        except UploadRejected as e:
+            return reject_upload(upload_id, upload, e, peer_addr, context)
+        except grpc.RpcError:
+            # Sender went away; the verified chunks are kept for it to resume
+            logger.warning(f"Upload {upload_id} from {peer_addr} interrupted after {upload.next_chunk if upload else 0} chunks")
+            return model_pb2.UploadStatus(upload_id=upload_id or "", next_chunk=upload.next_chunk if upload else 0)
+        except Exception as e:
+            logger.error(f"Error receiving upload from {peer_addr}: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return model_pb2.UploadStatus(upload_id=upload_id or "", message=f"Error: {str(e)}")
+
+    def _complete_upload(self, upload_id, upload, manifest, peer_addr, context):
+        if manifest.total_bytes > MAX_UPLOAD_BYTES:
+            return reject_upload(upload_id, upload, UploadRejected(
+                grpc.StatusCode.INVALID_ARGUMENT, f"Declared size {manifest.total_bytes} exceeds the "
+                                                  f"{MAX_UPLOAD_BYTES} byte limit"), peer_addr, context)
+        with upload.lock:
+            if (manifest.num_chunks != upload.next_chunk or manifest.total_bytes != len(upload.data)
+                    or manifest.sha256 != upload.hasher.hexdigest()):
+                _finish_upload(upload_id, upload, None)  # Inconsistent with what was sent, start over
+                context.set_code(grpc.StatusCode.DATA_LOSS)
+                context.set_details("Upload does not match its manifest")
+                return model_pb2.UploadStatus(upload_id=upload_id, message="Error: manifest mismatch")
+            try:
+                state_dict = decode_weights(upload.data, upload.format)
+            except (ValueError, pickle.UnpicklingError) as e:
+                _finish_upload(upload_id, upload, None)
+                logger.error(f"Failed to deserialize upload from {peer_addr}: {str(e)}")
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details("Invalid model format")
+                return model_pb2.UploadStatus(upload_id=upload_id, message="Error: Invalid model format")
+            _finish_upload(upload_id, upload, upload.next_chunk)
+        accept_model(state_dict, peer_addr, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        return model_pb2.UploadStatus(upload_id=upload_id, next_chunk=manifest.num_chunks, complete=True,
+                                      message="Model received successfully")
+
+    def GetUploadStatus(self, request, context):
+        """Where an interrupted upload should resume"""
+        with upload_lock:
+            if request.upload_id in completed_uploads:
+                return model_pb2.UploadStatus(upload_id=request.upload_id, complete=True,
+                                              next_chunk=completed_uploads[request.upload_id])
+            upload = uploads.get(request.upload_id)
+        if upload is None:
+            return model_pb2.UploadStatus(upload_id=request.upload_id, message="Unknown upload")
+        with upload.lock:
+            return model_pb2.UploadStatus(upload_id=request.upload_id, next_chunk=upload.next_chunk)
+
     def HealthCheck(self, request, context):
         """Handle health check requests"""
         try:
@@ -94,6 +301,57 @@ class FLPeerServicer(model_pb2_grpc.FLPeerServicer):
                 timestamp=datetime.datetime.now().isoformat()
             )
 
+    def GetStats(self, request, context):
+        """Serve this node's feature statistics for the federated normalization round"""
+        if local_stats is None:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details("Feature statistics not computed yet")
+            return model_pb2.FeatureStats()
+        logger.info(f"Sent feature statistics to {request.peer_id or context.peer()} | Node: {NODE_ID}")
+        return local_stats
+
+    def Evaluate(self, request, context):
+        """Score a model on this node's test split; results are memoized by checksum"""
+        evaluator = local_evaluator
+        if evaluator is None:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details("Evaluator not ready")
+            return model_pb2.EvaluateResponse()
+        try:
+            from evaluation import model_checksum
+            if request.checksum and not request.weights:
+                # Checksum-only request: answer from the cache or ask for the weights
+                try:
+                    checksum, counts = request.checksum, evaluator.counts(checksum=request.checksum)
+                except KeyError:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details("No cached evaluation for this checksum, send the weights")
+                    return model_pb2.EvaluateResponse()
+            elif request.checksum and evaluator.cached(request.checksum):
+                checksum, counts = request.checksum, evaluator.counts(checksum=request.checksum)
+            else:
+                state_dict = decode_weights(request.weights, request.format)
+                checksum = model_checksum(state_dict)
+                if request.checksum and request.checksum != checksum:
+                    context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                    context.set_details("Checksum does not match weights")
+                    return model_pb2.EvaluateResponse()
+                counts = evaluator.counts(state_dict, checksum)
+            tp, fp, fn, tn = (int(c) for c in counts)
+            logger.info(f"Evaluated model {checksum[:12]} for {request.peer_id or context.peer()} | Node: {NODE_ID}")
+            return model_pb2.EvaluateResponse(node_id=NODE_ID, checksum=checksum, true_positive=tp,
+                                              false_positive=fp, false_negative=fn, true_negative=tn)
+        except (ValueError, pickle.UnpicklingError) as e:
+            logger.error(f"Failed to deserialize model from {context.peer()}: {str(e)}")
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("Invalid model format")
+            return model_pb2.EvaluateResponse()
+        except Exception as e:
+            logger.error(f"Error evaluating model for {context.peer()}: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return model_pb2.EvaluateResponse()
+
 def serve(port=50051, ssl_key=None, ssl_cert=None):
     """
     Start the gRPC server
@@ -103,11 +361,7 @@ def serve(port=50051, ssl_key=None, ssl_cert=None):
         ssl_cert: Path to SSL certificate file
     """
     try:
-        grpc_options = [
-            ('grpc.max_send_message_length', 100 * 1024 * 1024),
-            ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-        ]
-        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=grpc_options)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=SERVER_OPTIONS)
         model_pb2_grpc.add_FLPeerServicer_to_server(FLPeerServicer(), server)
         
         if ssl_key and ssl_cert:
@@ -0,0 +1,250 @@
+import io
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from data import (HEADER, DEFAULT_CACHE_DIR, PREPROCESSOR_FILE, Preprocessor, MemmapBatchLoader, clean_frame,
+                  load_or_fit_preprocessor)
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "state.json"
+BLOCK_SIZE = 64 * 1024 * 1024  # Bytes of CSV parsed at a time
+
+
+def layout_digest(preprocessor):
+    """
+    Short hash of a preprocessor's column layout and vocabulary. Its mean/scale
+    are left out: the stored rows are scaled with the dataset's own statistics.
+    """
+    layout = [preprocessor.numeric_columns, preprocessor.categorical_columns, preprocessor.vocabulary]
+    return hashlib.sha256(json.dumps(layout, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def merge_moments(count, mean, m2, batch):
+    """
+    Merge a batch into running (count, mean, M2) column statistics
+    (Welford / Chan et al. parallel update). Variance is M2 / count.
+    """
+    n_b = len(batch)
+    if n_b == 0:
+        return count, mean, m2
+    mean_b = batch.mean(axis=0)
+    m2_b = ((batch - mean_b) ** 2).sum(axis=0)
+    total = count + n_b
+    delta = mean_b - mean
+    mean = mean + delta * n_b / total
+    m2 = m2 + m2_b + delta ** 2 * count * n_b / total
+    return total, mean, m2
+
+
+class IncrementalDataset:
+    """
+    Encoded copy of an append-only CSV that is brought up to date by encoding
+    only the bytes appended since the last update().
+    Rows live in flat binary files in state_dir: raw numeric columns, encoded
+    features and labels. Running column statistics are kept with Welford
+    updates; the numeric feature columns of existing rows are re-standardized
+    only when the running mean/std drift more than `tolerance` (relative to
+    the std in use) from the statistics they were encoded with. encoder()
+    gives the Preprocessor that reproduces the stored encoding for new records.
+    Args:
+        path: CSV file in the adults.csv format that only ever grows
+        state_dir: Directory for the encoded rows and state.json
+        preprocessor: Fitted Preprocessor supplying the category vocabulary and column order;
+            its mean/scale are not used
+        tolerance: Allowed drift before all rows are re-standardized
+    """
+    def __init__(self, path, state_dir, preprocessor, tolerance=0.01):
+        self.path = path
+        self.state_dir = state_dir
+        self.preprocessor = preprocessor
+        self.tolerance = tolerance
+        self.num_numeric = len(preprocessor.numeric_columns)
+        self.input_dim = preprocessor.input_dim
+        os.makedirs(state_dir, exist_ok=True)
+        self.state = self._load_state()
+
+    # ----------------------------
+    # State
+    # ----------------------------
+    def _fresh_state(self):
+        return {
+            'byte_offset': 0,
+            'num_rows': 0,
+            'input_dim': self.input_dim,
+            'preprocessor': layout_digest(self.preprocessor),
+            'count': 0,
+            'mean': [0.0] * self.num_numeric,
+            'm2': [0.0] * self.num_numeric,
+            'applied_mean': None,
+            'applied_scale': None,
+        }
+
+    def _load_state(self):
+        state_path = os.path.join(self.state_dir, STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if state['preprocessor'] == layout_digest(self.preprocessor) and state['byte_offset'] <= self._file_size():
+                self._truncate(state['num_rows'])
+                return state
+            logger.info(f"Source or preprocessor changed, rebuilding {self.state_dir}")
+        for name in self._row_bytes():
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        return self._fresh_state()
+
+    def _row_bytes(self):
+        return {'numeric.bin': 8 * self.num_numeric, 'features.bin': 4 * self.input_dim, 'labels.bin': 4}
+
+    def _truncate(self, num_rows):
+        """Drop rows an interrupted update() appended after the last saved state."""
+        for name, row_bytes in self._row_bytes().items():
+            size = num_rows * row_bytes
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > size:
+                logger.info(f"Discarding rows of {self._file(name)} past the saved state ({num_rows} rows)")
+                os.truncate(self._file(name), size)
+
+    def _save_state(self):
+        tmp_path = os.path.join(self.state_dir, f"{STATE_FILE}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.state_dir, STATE_FILE))
+
+    def _file(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def _file_size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def num_rows(self):
+        return self.state['num_rows']
+
+    def running_stats(self):
+        count = max(self.state['count'], 1)
+        mean = np.asarray(self.state['mean'])
+        std = np.sqrt(np.asarray(self.state['m2']) / count)
+        return mean, np.where(std == 0, 1.0, std)
+
+    # ----------------------------
+    # Updates
+    # ----------------------------
+    def _new_blocks(self):
+        """Yield (complete CSV lines, end offset) appended since the last update."""
+        offset = self.state['byte_offset']
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            carry = b''
+            while True:
+                data = f.read(BLOCK_SIZE)
+                if not data:
+                    break
+                data = carry + data
+                cut = data.rfind(b'\n') + 1  # A partially written last line waits for the next update
+                carry = data[cut:]
+                if cut:
+                    offset += cut
+                    yield data[:cut], offset
+
+    def encoder(self):
+        """Preprocessor with the statistics the stored rows are currently scaled with."""
+        return Preprocessor(self.preprocessor.vocabulary, self.state['applied_mean'], self.state['applied_scale'],
+                            self.preprocessor.numeric_columns, self.preprocessor.categorical_columns)
+
+    def update(self):
+        """
+        Encode rows appended since the last call and append them to the stored arrays.
+        Returns:
+            Number of new rows
+        """
+        new_rows = 0
+        for block, offset in self._new_blocks():
+            df = clean_frame(pd.read_csv(io.BytesIO(block), index_col=False, skipinitialspace=True,
+                                         header=None, names=HEADER))
+            numeric = df[self.preprocessor.numeric_columns].to_numpy(dtype=np.float64)
+            count, mean, m2 = merge_moments(self.state['count'], np.asarray(self.state['mean']),
+                                            np.asarray(self.state['m2']), numeric)
+            self.state.update(count=count, mean=mean.tolist(), m2=m2.tolist())
+            if self.state['applied_mean'] is None:
+                running_mean, running_std = self.running_stats()
+                self.state.update(applied_mean=running_mean.tolist(), applied_scale=running_std.tolist())
+            with open(self._file('numeric.bin'), 'ab') as f:
+                f.write(numeric.tobytes())
+            with open(self._file('features.bin'), 'ab') as f:
+                f.write(self.encoder().transform(df).tobytes())
+            with open(self._file('labels.bin'), 'ab') as f:
+                f.write(df['salary'].to_numpy(dtype=np.float32).tobytes())
+            self.state['num_rows'] += len(df)
+            self.state['byte_offset'] = offset
+            new_rows += len(df)
+        if new_rows:
+            self._maybe_restandardize()
+            self._save_state()
+            logger.info(f"Encoded {new_rows} new rows from {self.path} ({self.num_rows} total)")
+        return new_rows
+
+    def _maybe_restandardize(self, chunk_rows=1 << 20):
+        """Re-scale the numeric feature columns of all rows if the running statistics drifted."""
+        mean, std = self.running_stats()
+        applied_mean = np.asarray(self.state['applied_mean'])
+        applied_scale = np.asarray(self.state['applied_scale'])
+        drift = max(np.max(np.abs(mean - applied_mean) / applied_scale),
+                    np.max(np.abs(std / applied_scale - 1.0)))
+        if drift <= self.tolerance:
+            return False
+        numeric, features, _ = self.arrays(mode='r+')
+        for start in range(0, self.num_rows, chunk_rows):
+            stop = start + chunk_rows
+            features[start:stop, :self.num_numeric] = (numeric[start:stop] - mean) / std
+        features.flush()
+        del features
+        self.state.update(applied_mean=mean.tolist(), applied_scale=std.tolist())
+        logger.info(f"Statistics drifted by {drift:.3f} > {self.tolerance}, re-standardized {self.num_rows} rows")
+        return True
+
+    def arrays(self, mode='r'):
+        """Memory-mapped (numeric, features, labels) arrays of all encoded rows."""
+        n = self.num_rows
+        numeric = np.memmap(self._file('numeric.bin'), dtype=np.float64, mode='r', shape=(n, self.num_numeric))
+        features = np.memmap(self._file('features.bin'), dtype=np.float32, mode=mode, shape=(n, self.input_dim))
+        labels = np.memmap(self._file('labels.bin'), dtype=np.float32, mode='r', shape=(n,))
+        return numeric, features, labels
+
+
+def stable_test_mask(num_rows, seed=42, test_fraction=0.2):
+    """Train/test assignment that never changes for a row as more rows are appended."""
+    h = (np.arange(num_rows, dtype=np.uint64) + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    return (h >> np.uint64(40)).astype(np.float64) / float(1 << 24) < test_fraction
+
+
+def get_incremental_data_loaders(path="adults.csv", batch_size=32, seed=42, cache_dir=DEFAULT_CACHE_DIR,
+                                 preprocessor=None, shuffle_seed=None, drop_last=False, tolerance=0.01,
+                                 update=True, save_dir=None):
+    """
+    Update the incremental encoding of path and return loaders over all of its rows.
+    With update=False the stored rows are only mapped, for readers that share
+    the cache with a single writer (see parallel.DataParallelTrainer).
+    If save_dir is given, the encoder matching the stored rows is saved there as
+    preprocessor.json after an update, so inference scales features as training did.
+    Returns:
+        train_loader, test_loader (MemmapBatchLoader)
+    """
+    if preprocessor is None:
+        preprocessor = load_or_fit_preprocessor(path=path)
+    key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    dataset = IncrementalDataset(path, os.path.join(cache_dir, 'incremental', key), preprocessor, tolerance)
+    if update:
+        dataset.update()
+        if save_dir is not None and dataset.num_rows:
+            os.makedirs(save_dir, exist_ok=True)
+            dataset.encoder().save(os.path.join(save_dir, PREPROCESSOR_FILE))
+    _, X, y = dataset.arrays()
+    test_mask = stable_test_mask(len(y), seed)
+    train_loader = MemmapBatchLoader(X, y, np.flatnonzero(~test_mask), batch_size=batch_size, shuffle=True,
+                                     drop_last=drop_last, seed=shuffle_seed)
+    test_loader = MemmapBatchLoader(X, y, np.flatnonzero(test_mask), batch_size=batch_size, shuffle=False)
+    return train_loader, test_loader
@@ -1,18 +1,19 @@
 import logging
 from train import train_local
-from grpc_client import send_model
+from grpc_client import send_model_to_peers
 from fedavg import fed_avg
 import torch
 import time
 import yaml
 import socket
-from grpc_server import received_models, serve, set_current_round
+from grpc_server import received_models, serve, set_current_round, set_local_evaluator
 from tqdm import tqdm
 import argparse
 import threading
 import hashlib
 from datetime import datetime
-from train import evaluate
+from train import format_curves
+from solvers import SOLVERS
 from start_fl_node import test_connections
 
 # Configure logging
@@ -94,46 +95,21 @@ def state_dict_checksum(state_dict):
             m.update(v.cpu().numpy().tobytes())
     return m.hexdigest()[:12]
 
-def run_round(peer_addresses, own_address, max_retries=3, retry_delay=3, global_model=None, round_num=1):
+def run_round(peer_addresses, own_address, max_retries=3, retry_delay=3, global_model=None, round_num=1,
+              machine_id=0, total_machines=4, shard_dir=None, sparse=False, incremental=False, trainer=None,
+              epochs=3):
     try:
         tqdm.write("[ROUND] Starting local training round...")
+        if trainer is None:
+            from train import Trainer
+            trainer = Trainer(machine_id=machine_id, total_machines=total_machines, shard_dir=shard_dir,
+                              sparse=sparse, incremental=incremental)
         # Detailed per-epoch logging
-        def train_with_logging(*args, **kwargs):
-            set_seed = kwargs.get('set_seed', 42)
-            epochs = kwargs.get('epochs', 3)
-            batch_size = kwargs.get('batch_size', 64)
-            save_dir = kwargs.get('save_dir', "models")
-            machine_id = kwargs.get('machine_id', 0)
-            total_machines = kwargs.get('total_machines', 4)
-            from data import get_data_loaders
-            from model import SimpleBinaryClassifier, get_loss, get_optimizer
-            from train import evaluate
-            import os
-            os.makedirs(save_dir, exist_ok=True)
-            train_loader, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size)
-            input_dim = next(iter(train_loader))[0].shape[1]
-            model = SimpleBinaryClassifier(input_dim)
-            # Load global model weights if provided
-            if global_model is not None:
-                model.load_state_dict(global_model)
-            criterion = get_loss()
-            optimizer = get_optimizer(model)
-            for epoch in range(epochs):
-                model.train()
-                epoch_loss = 0.0
-                for xb, yb in train_loader:
-                    optimizer.zero_grad()
-                    outputs = model(xb)
-                    loss = criterion(outputs, yb)
-                    loss.backward()
-                    optimizer.step()
-                    epoch_loss += loss.item() * xb.size(0)
-                avg_loss = epoch_loss / len(train_loader.dataset)
-                acc, prec, rec, f1 = evaluate(model, test_loader)
-                tqdm.write(f"[TRAIN][Epoch {epoch+1}/{epochs}] Loss: {avg_loss:.4f} | Acc: {acc:.4f} | Prec: {prec:.4f} | Rec: {rec:.4f} | F1: {f1:.4f}")
-            return model.state_dict()
-        # Use the above for detailed per-epoch logging
-        local_weights = train_with_logging()
+        tqdm.write(f"[ROUND] Local config: epochs={epochs} batch_size={trainer.train_loader.batch_size} "
+                   f"threads={torch.get_num_threads()}")
+        train_start = time.perf_counter()
+        local_weights = trainer.fit(epochs=epochs, global_state=global_model, round_num=round_num)
+        tqdm.write(f"[ROUND] Local training took {time.perf_counter() - train_start:.2f}s")
         # Log summary stats of local weights
         stats = summarize_weights_full(local_weights)
         tqdm.write("[ROUND] Local model weights summary:")
@@ -142,41 +118,39 @@ def run_round(peer_addresses, own_address, max_retries=3, retry_delay=3, global_
         tqdm.write(f"  Checksum: {state_dict_checksum(local_weights)}")
         successful_peers = []
         failed_peers = []
-        # Send to all other peers, skip self
-        for addr in peer_addresses:
-            if addr == own_address:
-                tqdm.write(f"[SEND] Skipping send to self ({addr})")
-                continue
-            success = False
-            retries = 0
-            while not success and retries < max_retries:
-                if retries > 0:
-                    tqdm.write(f"[SEND] Retrying send to {addr} (attempt {retries + 1}/{max_retries})")
-                    time.sleep(retry_delay)
-                now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                model_size = sum(v.numel() for v in local_weights.values() if torch.is_tensor(v)) * 4 / 1024
-                checksum = state_dict_checksum(local_weights)
-                tqdm.write(f"[SEND][{now}] Sending model to {addr} | Size: {model_size:.2f} KB | Checksum: {checksum} | Node: {NODE_ID}")
-                if SAVE_MODEL_DEBUG:
-                    fname = f"sent_model_{NODE_ID}_to_{addr.replace(':', '_')}_round{round_num}.pt"
-                    torch.save(local_weights, fname)
-                    tqdm.write(f"[SEND][DEBUG] Saved sent model to {fname}")
-                success = send_model(
-                    local_weights, 
-                    addr,
-                    round_num=round_num,
-                    timeout=30,  # 30 second timeout
-                    use_ssl=False,  # Enable if SSL certificates are set up
-                    node_id=NODE_ID
-                )
-                retries += 1
-            if success:
+        # Send to all other peers at once, skip self
+        if own_address in peer_addresses:
+            tqdm.write(f"[SEND] Skipping send to self ({own_address})")
+        peers = [addr for addr in peer_addresses if addr != own_address]
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        model_size = sum(v.numel() for v in local_weights.values() if torch.is_tensor(v)) * 4 / 1024
+        checksum = state_dict_checksum(local_weights)
+        tqdm.write(f"[SEND][{now}] Sending model to {len(peers)} peers | Size: {model_size:.2f} KB | Checksum: {checksum} | Node: {NODE_ID}")
+        if SAVE_MODEL_DEBUG:
+            fname = f"sent_model_{NODE_ID}_round{round_num}.pt"
+            torch.save(local_weights, fname)
+            tqdm.write(f"[SEND][DEBUG] Saved sent model to {fname}")
+        send_start = time.perf_counter()
+        for outcome in send_model_to_peers(
+            local_weights,
+            peers,
+            round_num=round_num,
+            timeout=30,  # 30 second timeout per attempt
+            max_attempts=max_retries,
+            base_delay=retry_delay,  # Backoff before the first retry, doubled (with jitter) after that
+            use_ssl=False,  # Enable if SSL certificates are set up
+            node_id=NODE_ID
+        ):
+            addr = outcome['address']
+            attempts = f" after {outcome['attempts']} attempt(s)" if outcome['attempts'] else ""
+            if outcome['success']:
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                tqdm.write(f"[SEND][{now}] Model sent to {addr} successfully.")
+                tqdm.write(f"[SEND][{now}] Model sent to {addr} successfully{attempts} ({outcome['seconds']:.2f}s): {outcome['message']}")
                 successful_peers.append(addr)
             else:
-                tqdm.write(f"[SEND] Failed to send model to {addr} after {max_retries} attempts.")
+                tqdm.write(f"[SEND] Failed to send model to {addr}{attempts}: {outcome['error']}")
                 failed_peers.append(addr)
+        tqdm.write(f"[SEND] Send phase took {time.perf_counter() - send_start:.2f}s")
         if failed_peers:
             tqdm.write(f"[WARN] Failed to send model to peers: {failed_peers}")
         return local_weights, len(successful_peers)
@@ -219,22 +193,89 @@ def start_grpc_server_in_thread(port=50051):
     server_thread.start()
     return server_thread
 
-def evaluate_global_model(global_model_state_dict, machine_id=0, total_machines=4, batch_size=64):
-    from data import get_data_loaders
-    from model import SimpleBinaryClassifier
-    _, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size)
-    input_dim = next(iter(test_loader))[0].shape[1]
-    model = SimpleBinaryClassifier(input_dim)
-    model.load_state_dict(global_model_state_dict)
-    acc, prec, rec, f1 = evaluate(model, test_loader)
-    tqdm.write(f"[EVAL][Global Model] Accuracy: {acc:.4f} | Precision: {prec:.4f} | Recall: {rec:.4f} | F1: {f1:.4f}")
+# Test sets kept for the life of the process, one per data configuration
+_evaluators = {}
+
+def get_local_evaluator(machine_id=0, total_machines=4, batch_size=64, shard_dir=None, sparse=False,
+                        incremental=False):
+    from data import get_data_loaders, load_or_fit_preprocessor
+    from evaluation import LocalEvaluator
+    key = (machine_id, total_machines, shard_dir, sparse, incremental)
+    if key not in _evaluators or incremental:
+        preprocessor = load_or_fit_preprocessor("models", shard_dir=shard_dir)
+        _, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size, shard_dir=shard_dir, sparse=sparse, preprocessor=preprocessor, incremental=incremental, save_dir="models")
+        if key in _evaluators:
+            _evaluators[key].refresh(test_loader)
+        else:
+            _evaluators[key] = LocalEvaluator(test_loader, preprocessor.input_dim)
+    return _evaluators[key]
+
+def evaluate_global_model(global_model_state_dict, machine_id=0, total_machines=4, batch_size=64, shard_dir=None,
+                          sparse=False, incremental=False, curve_bins=None, evaluator=None):
+    from evaluation import model_checksum
+    if evaluator is None:
+        evaluator = get_local_evaluator(machine_id, total_machines, batch_size, shard_dir, sparse, incremental)
+    checksum = model_checksum(global_model_state_dict)
+    cached = " (cached)" if evaluator.cached(checksum) else ""
+    acc, prec, rec, f1 = evaluator.metrics(global_model_state_dict, checksum)
+    tqdm.write(f"[EVAL][Global Model] Accuracy: {acc:.4f} | Precision: {prec:.4f} | Recall: {rec:.4f} | F1: {f1:.4f}{cached}")
+    curves = evaluator.curves(global_model_state_dict, checksum, bins=curve_bins)
+    tqdm.write(f"[EVAL][Global Model] {format_curves(curves)}")
+    return curves
+
+def evaluate_federated(global_model_state_dict, peer_addresses, own_address, evaluator):
+    """Metrics of the global model over the test splits of all reachable peers, from their confusion counts."""
+    from evaluation import federated_counts
+    from model import metrics_from_counts
+    counts, per_node = federated_counts(evaluator, global_model_state_dict, peer_addresses, own_address, NODE_ID)
+    acc, prec, rec, f1 = metrics_from_counts(counts)
+    tqdm.write(f"[EVAL][Federated] {len(per_node)}/{len(set(peer_addresses) | {own_address})} nodes, "
+               f"{int(counts.sum())} test samples | Accuracy: {acc:.4f} | Precision: {prec:.4f} | Recall: {rec:.4f} | F1: {f1:.4f}")
+    return counts
 
 if __name__ == "__main__":
     try:
         parser = argparse.ArgumentParser()
         parser.add_argument("--rounds", type=int, default=10, help="Number of federated learning rounds")
+        parser.add_argument("--machine-id", type=int, default=0, help="Index of this node's data partition")
+        parser.add_argument("--total-machines", type=int, default=4, help="Number of data partitions")
+        parser.add_argument("--shard-dir", default=None, help="Directory of shards written by partition.py")
+        parser.add_argument("--sparse", action='store_true', help="Feed one-hot features to the model in sparse form")
+        parser.add_argument("--incremental", action='store_true',
+                            help="Treat the local CSV as an append-only feed and encode only new rows each round")
+        parser.add_argument("--federated-stats", action='store_true',
+                            help="Agree on normalization statistics with all peers before the first round")
+        parser.add_argument("--keep-optimizer-state", action='store_true',
+                            help="Carry Adam moment estimates across rounds instead of resetting them")
+        parser.add_argument("--solver", choices=SOLVERS, default='adam',
+                            help="Local solver: minibatch Adam epochs or full-batch L-BFGS / Newton (IRLS)")
+        parser.add_argument("--l2", type=float, default=0.0, help="L2 penalty on the local weights")
+        parser.add_argument("--prox", type=float, default=0.0,
+                            help="Proximal penalty pulling local training toward the global model (FedProx mu)")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Processes to split local training across on this host (torch.distributed, gloo)")
+        parser.add_argument("--dp-noise", type=float, default=None,
+                            help="Train with DP-SGD at this noise multiplier (default: non-private)")
+        parser.add_argument("--dp-clip", type=float, default=1.0, help="DP-SGD per-sample gradient clipping bound")
+        parser.add_argument("--dp-delta", type=float, default=1e-5, help="Delta of the reported DP guarantee")
+        parser.add_argument("--round-budget", type=float, default=None,
+                            help="Seconds of local training per round; batch size, threads and epochs are tuned to fit")
+        parser.add_argument("--federated-eval", action='store_true',
+                            help="Also score each global model on all peers' test splits (Evaluate RPC)")
+        parser.add_argument("--curve-bins", type=int, default=None,
+                            help="Histogram bins for the global model's ROC/PR sweep (default: exact sort-based sweep)")
         args = parser.parse_args()
+        if args.workers > 1 and args.solver != 'adam':
+            parser.error("--workers only applies to the minibatch 'adam' solver")
+        if args.dp_noise is not None and (args.solver != 'adam' or args.workers > 1):
+            parser.error("--dp-noise requires the 'adam' solver and a single worker")
+        if args.round_budget is not None and (args.solver != 'adam' or args.workers > 1):
+            parser.error("--round-budget tunes the minibatch 'adam' solver on a single worker")
+        if args.federated_stats and args.shard_dir:
+            parser.error("--federated-stats builds the preprocessor from raw rows; shards already carry one")
         num_rounds = args.rounds
+        data_args = dict(machine_id=args.machine_id, total_machines=args.total_machines, shard_dir=args.shard_dir,
+                         sparse=args.sparse, incremental=args.incremental)
 
         # Start gRPC server in a background thread (so received_models is shared)
         start_grpc_server_in_thread(port=50051)
@@ -247,6 +288,31 @@ if __name__ == "__main__":
         own_address = f"{own_ip}:{own_port}"
         tqdm.write(f"[INFO] Own address: {own_address}")
         tqdm.write(f"[INFO] All peers: {peer_addresses}")
+        if args.federated_stats:
+            from fedstats import run_stats_round
+            tqdm.write("[STATS] Exchanging feature statistics with peers...")
+            preprocessor = run_stats_round(peer_addresses, own_address, machine_id=args.machine_id,
+                                           total_machines=args.total_machines, node_id=NODE_ID)
+            tqdm.write(f"[STATS] Global preprocessor ready: {preprocessor.input_dim} features")
+        trainer_args = dict(keep_optimizer_state=args.keep_optimizer_state, solver=args.solver, l2=args.l2,
+                            prox=args.prox, dp_noise_multiplier=args.dp_noise, dp_max_grad_norm=args.dp_clip,
+                            dp_delta=args.dp_delta, **data_args)
+        if args.workers > 1:
+            from parallel import DataParallelTrainer
+            trainer = DataParallelTrainer(workers=args.workers, **trainer_args)
+        else:
+            from train import Trainer
+            trainer = Trainer(**trainer_args)
+        from evaluation import LocalEvaluator
+        evaluator = LocalEvaluator.from_trainer(trainer)
+        set_local_evaluator(evaluator)  # Serves peers' Evaluate requests
+        local_epochs = 3
+        if args.round_budget is not None:
+            from autotune import autotune, format_config
+            tqdm.write(f"[AUTOTUNE] Measuring local throughput for a {args.round_budget}s round budget...")
+            tuned = autotune(trainer, args.round_budget)
+            local_epochs = tuned['epochs']
+            tqdm.write(f"[AUTOTUNE] {format_config(tuned)}")
         global_model = None
         for round_num in range(1, num_rounds + 1):
             set_current_round(round_num)
@@ -255,9 +321,14 @@ if __name__ == "__main__":
             # Evaluate the latest global model before starting the next round (after round 1)
             if round_num > 1 and global_model is not None:
                 tqdm.write(f"[EVAL] Evaluating global model before round {round_num}...")
-                evaluate_global_model(global_model)
+                if args.incremental:
+                    evaluator.refresh(trainer.test_loader)
+                evaluate_global_model(global_model, curve_bins=args.curve_bins, evaluator=evaluator)
+                if args.federated_eval:
+                    evaluate_federated(global_model, peer_addresses, own_address, evaluator)
             # Run local training and send to peers, passing global_model and round_num
-            local_model, successful_sends = run_round(peer_addresses, own_address, global_model=global_model, round_num=round_num)
+            local_model, successful_sends = run_round(peer_addresses, own_address, global_model=global_model, round_num=round_num, trainer=trainer,
+                                                    epochs=local_epochs)
             # Calculate required peers (excluding self)
             total_peers = len(peer_addresses) - 1
             min_required_peers = max(1, total_peers // 2)  # At least 50% of peers
@@ -304,6 +375,8 @@ if __name__ == "__main__":
             time.sleep(5)  # Optional: wait before next round
             test_connections()
             # test_connection  # (appears to be a typo, remove or fix if needed)
+        if args.workers > 1:
+            trainer.close()
     except Exception as e:
         tqdm.write(f"[FATAL] Exception in main federated loop: {str(e)}")
 
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 import random
 
@@ -15,13 +16,72 @@ def set_seed(seed=42):
     torch.backends.cudnn.benchmark = False
 
 
+# ----------------------------
+# Sparse one-hot inputs
+# ----------------------------
+class OneHotFeatures:
+    """
+    Sparse form of a one-hot encoded feature matrix whose first columns are dense.
+    Args:
+        dense (torch.Tensor): Values of the leading dense columns (N, num_dense)
+        indices (torch.Tensor): Column index of the active one-hot entry of each
+            categorical field (N, num_fields), int64
+        num_features (int): Width of the equivalent dense matrix
+    Supports the slicing, index_select and size() calls the loaders and training
+    loops make on a dense feature tensor.
+    """
+    def __init__(self, dense, indices, num_features):
+        self.dense = dense
+        self.indices = indices
+        self.num_features = num_features
+
+    @property
+    def shape(self):
+        return torch.Size((self.dense.shape[0], self.num_features))
+
+    def size(self, dim=None):
+        return self.shape if dim is None else self.shape[dim]
+
+    def __len__(self):
+        return self.dense.shape[0]
+
+    def __getitem__(self, key):
+        return OneHotFeatures(self.dense[key], self.indices[key], self.num_features)
+
+    def index_select(self, dim, index):
+        return OneHotFeatures(self.dense.index_select(dim, index), self.indices.index_select(dim, index),
+                              self.num_features)
+
+    def to_dense(self):
+        X = torch.zeros(len(self), self.num_features, dtype=self.dense.dtype)
+        X[:, :self.dense.shape[1]] = self.dense
+        X.scatter_(1, self.indices, 1.0)
+        return X
+
+
+class OneHotLinear(nn.Linear):
+    """
+    nn.Linear that also accepts OneHotFeatures. The categorical part of the
+    product is an embedding-bag style sum of the weights of the active columns,
+    so a batch costs num_dense + num_fields operations per output instead of
+    num_features. Parameters and state_dict are those of nn.Linear.
+    """
+    def forward(self, x):
+        if not isinstance(x, OneHotFeatures):
+            return super().forward(x)
+        num_dense = x.dense.shape[1]
+        out = F.linear(x.dense, self.weight[:, :num_dense], self.bias)
+        # Gather + sum beats F.embedding_bag here: one output and few fields per row
+        return out + self.weight.t()[x.indices].sum(1)
+
+
 # ----------------------------
 # Binary Classifier Model
 # ----------------------------
 class SimpleBinaryClassifier(nn.Module):
     def __init__(self, input_dim):
         super(SimpleBinaryClassifier, self).__init__()
-        self.output_layer = nn.Linear(input_dim, 1)
+        self.output_layer = OneHotLinear(input_dim, 1)
 
     def forward(self, x):
         x = torch.sigmoid(self.output_layer(x))
@@ -31,26 +91,128 @@ class SimpleBinaryClassifier(nn.Module):
 # ----------------------------
 # Custom Metrics (F1, Precision, Recall)
 # ----------------------------
-def binary_metrics(y_true, y_pred, threshold=0.5):
+def confusion_counts(y_true, y_pred, threshold=0.5):
     """
     Args:
-        y_true (torch.Tensor): Ground truth labels (N,)
+        y_true (torch.Tensor): Ground truth labels (N,) or (N, 1)
         y_pred (torch.Tensor): Predicted probabilities (N, 1)
     Returns:
-        precision, recall, f1
+        torch.Tensor [true_positive, false_positive, false_negative, true_negative] (int64)
     """
-    y_pred_label = (y_pred > threshold).float()
-    y_true = y_true.view(-1, 1)
-    
-    true_positive = (y_pred_label * y_true).sum()
+    y_pred_label = y_pred.view(-1) > threshold
+    y_true = y_true.view(-1) > 0.5
+    true_positive = (y_pred_label & y_true).sum()
     predicted_positive = y_pred_label.sum()
     actual_positive = y_true.sum()
+    false_positive = predicted_positive - true_positive
+    false_negative = actual_positive - true_positive
+    true_negative = y_true.numel() - predicted_positive - false_negative
+    return torch.stack([true_positive, false_positive, false_negative, true_negative])
+
 
-    precision = true_positive / (predicted_positive + 1e-8)
-    recall = true_positive / (actual_positive + 1e-8)
+def metrics_from_counts(counts):
+    """
+    Args:
+        counts (torch.Tensor): Output of confusion_counts, possibly summed over batches
+    Returns:
+        accuracy, precision, recall, f1
+    """
+    true_positive, false_positive, false_negative, true_negative = counts.double()
+    precision = true_positive / (true_positive + false_positive + 1e-8)
+    recall = true_positive / (true_positive + false_negative + 1e-8)
     f1 = 2 * (precision * recall) / (precision + recall + 1e-8)
+    accuracy = (true_positive + true_negative) / counts.sum().clamp(min=1)
+    return accuracy.item(), precision.item(), recall.item(), f1.item()
+
+
+def binary_metrics(y_true, y_pred, threshold=0.5):
+    """
+    Args:
+        y_true (torch.Tensor): Ground truth labels (N,)
+        y_pred (torch.Tensor): Predicted probabilities (N, 1)
+    Returns:
+        precision, recall, f1
+    """
+    _, precision, recall, f1 = metrics_from_counts(confusion_counts(y_true, y_pred, threshold))
+    return precision, recall, f1
+
+
+# ----------------------------
+# Threshold Sweep (ROC / PR curves)
+# ----------------------------
+def _sweep_curves(thresholds, tps, fps, num_positive, num_negative):
+    """Curves and summary metrics from cumulative tp/fp counts at descending thresholds."""
+    zero = tps.new_zeros(1)
+    tps, fps = torch.cat([zero, tps]), torch.cat([zero, fps])
+    thresholds = torch.cat([thresholds.new_full((1,), float('inf')), thresholds])
+    tpr = tps / max(num_positive, 1)
+    fpr = fps / max(num_negative, 1)
+    precision = torch.where(tps + fps > 0, tps / (tps + fps).clamp(min=1), torch.ones_like(tps))
+    f1 = 2 * tps / (tps + fps + num_positive).clamp(min=1)
+    best = int(torch.argmax(f1))
+    defined = num_positive > 0 and num_negative > 0
+    return {
+        'thresholds': thresholds,
+        'fpr': fpr,
+        'tpr': tpr,
+        'precision': precision,
+        'recall': tpr,
+        'roc_auc': torch.trapezoid(tpr, fpr).item() if defined else float('nan'),
+        # Average precision: step-wise area under the PR curve, no interpolation
+        'pr_auc': ((tpr[1:] - tpr[:-1]) * precision[1:]).sum().item() if num_positive > 0 else float('nan'),
+        'best_threshold': thresholds[best].item(),
+        'best_f1': f1[best].item(),
+    }
+
+
+def threshold_sweep(y_true, y_prob):
+    """
+    Metrics at every threshold from one sort of the predicted probabilities (O(n log n)).
+    A sample counts as predicted positive when its probability is >= the threshold.
+    Args:
+        y_true (torch.Tensor): Ground truth labels (N,) or (N, 1)
+        y_prob (torch.Tensor): Predicted probabilities (N,) or (N, 1)
+    Returns:
+        dict with 'thresholds', 'fpr', 'tpr', 'precision', 'recall' curves (descending
+        thresholds) and 'roc_auc', 'pr_auc', 'best_threshold', 'best_f1'
+    """
+    y_prob = y_prob.reshape(-1).double()
+    y_true = (y_true.reshape(-1) > 0.5).double()
+    order = torch.argsort(y_prob, descending=True)
+    y_prob, y_true = y_prob[order], y_true[order]
+    tps = torch.cumsum(y_true, 0)
+    fps = torch.arange(1, len(y_true) + 1, dtype=torch.float64) - tps
+    # One point per distinct probability: the last sample of each run of ties
+    last = torch.ones_like(y_prob, dtype=torch.bool)
+    last[:-1] = y_prob[1:] != y_prob[:-1]
+    num_positive = int(y_true.sum())
+    return _sweep_curves(y_prob[last], tps[last], fps[last], num_positive, len(y_true) - num_positive)
+
+
+class ThresholdHistogram:
+    """
+    Streaming threshold sweep: per-class counts of predicted probabilities in
+    `bins` equal-width bins, updated batch by batch with bincount. Memory is
+    O(bins) whatever the test set size; thresholds are the bin edges, so the
+    AUCs are exact up to ties within a bin.
+    """
+    def __init__(self, bins=1000):
+        self.bins = bins
+        self.positive = torch.zeros(bins, dtype=torch.float64)
+        self.negative = torch.zeros(bins, dtype=torch.float64)
+
+    def update(self, y_true, y_prob):
+        idx = (y_prob.reshape(-1).double() * self.bins).long().clamp_(0, self.bins - 1)
+        is_positive = y_true.reshape(-1) > 0.5
+        self.positive += torch.bincount(idx[is_positive], minlength=self.bins)
+        self.negative += torch.bincount(idx[~is_positive], minlength=self.bins)
 
-    return precision.item(), recall.item(), f1.item()
+    def sweep(self):
+        """Same result layout as threshold_sweep."""
+        thresholds = torch.arange(self.bins - 1, -1, -1, dtype=torch.float64) / self.bins
+        tps = torch.cumsum(self.positive.flip(0), 0)
+        fps = torch.cumsum(self.negative.flip(0), 0)
+        return _sweep_curves(thresholds, tps, fps, int(self.positive.sum()), int(self.negative.sum()))
 
 
 # ----------------------------
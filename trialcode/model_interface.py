@@ -1,9 +1,15 @@
 import os
+import glob
+import time
 import torch
-from model import SimpleBinaryClassifier
-from data import get_data_loaders
+from tabulate import tabulate
+from model import SimpleBinaryClassifier, metrics_from_counts, threshold_sweep
+from data import get_data_loaders, load_and_preprocess_data, Preprocessor, PREPROCESSOR_FILE, HEADER
 from train import evaluate
 
+METRICS = ('f1', 'accuracy', 'precision', 'recall', 'roc_auc', 'pr_auc')
+BULK_CHUNK = 256  # Checkpoints scored per matmul; bounds the (test rows, checkpoints) probability matrix
+
 
 def list_saved_models(save_dir="models"):
     """List all saved model files."""
@@ -12,6 +18,12 @@ def list_saved_models(save_dir="models"):
     return [f for f in os.listdir(save_dir) if f.endswith('.pt')]
 
 
+def load_preprocessor(save_dir="models"):
+    """Load the preprocessor saved next to the checkpoints, or None if there is none."""
+    path = os.path.join(save_dir, PREPROCESSOR_FILE)
+    return Preprocessor.load(path) if os.path.exists(path) else None
+
+
 def load_model(model_path, input_dim):
     """Load a model from a .pt file."""
     model = SimpleBinaryClassifier(input_dim)
@@ -23,8 +35,10 @@ def load_model(model_path, input_dim):
 
 def evaluate_saved_model(model_path, machine_id=0, total_machines=4, batch_size=64):
     """Evaluate a saved model on the test set."""
-    train_loader, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size)
-    input_dim = next(iter(train_loader))[0].shape[1]
+    preprocessor = load_preprocessor(os.path.dirname(model_path))
+    train_loader, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size,
+                                                 preprocessor=preprocessor)
+    input_dim = preprocessor.input_dim if preprocessor else next(iter(train_loader))[0].shape[1]
     model = load_model(model_path, input_dim)
     acc, prec, rec, f1 = evaluate(model, test_loader)
     print(f"Evaluation for {model_path}:")
@@ -34,6 +48,91 @@ def evaluate_saved_model(model_path, machine_id=0, total_machines=4, batch_size=
     print(f"  F1-score:  {f1:.4f}")
 
 
+def find_checkpoints(save_dir="models", round_dir="."):
+    """Every .pt in save_dir plus the global_model_round_*.pt checkpoints written by main.py to round_dir."""
+    paths = [os.path.join(save_dir, f) for f in sorted(list_saved_models(save_dir))]
+    paths += sorted(glob.glob(os.path.join(round_dir, "global_model_round_*.pt")))
+    return list(dict.fromkeys(os.path.normpath(p) for p in paths))
+
+
+def _stacked_weights(state_dict, input_dim):
+    """A SimpleBinaryClassifier checkpoint as one (D + 1,) row, weight then bias."""
+    if set(state_dict) != {'output_layer.weight', 'output_layer.bias'}:
+        raise ValueError(f"unexpected keys {sorted(state_dict)}")
+    weight, bias = state_dict['output_layer.weight'], state_dict['output_layer.bias']
+    if weight.shape != (1, input_dim) or bias.shape != (1,):
+        raise ValueError(f"weight shape {tuple(weight.shape)} does not match input_dim {input_dim}")
+    return torch.cat([weight.view(-1), bias]).float()
+
+
+def evaluate_checkpoints(paths, save_dir="models", machine_id=0, total_machines=4, curves=True):
+    """
+    Score many checkpoints on one load of the test set. All checkpoints are
+    linear, so their weights are stacked into a (C, D + 1) matrix and every
+    model's probabilities come from one matmul per BULK_CHUNK checkpoints;
+    confusion counts are reduced over the test rows for all columns at once.
+    Args:
+        paths: Checkpoint files (see find_checkpoints)
+        save_dir: Directory holding the preprocessor the checkpoints were trained with
+        curves: Also compute ROC-AUC / PR-AUC (one sort per checkpoint)
+    Returns:
+        One dict per checkpoint with path, accuracy, precision, recall, f1,
+        roc_auc, pr_auc and error (None, or why it could not be scored)
+    """
+    preprocessor = load_preprocessor(save_dir)
+    _, _, X_test, y_test = load_and_preprocess_data(machine_id=machine_id, total_machines=total_machines,
+                                                    preprocessor=preprocessor)
+    X_test = torch.cat([X_test, torch.ones(len(X_test), 1)], dim=1)  # Constant column carries the bias
+    y_true = y_test.view(-1) > 0.5
+    input_dim = X_test.shape[1] - 1
+    results, rows, scored = [], [], []
+    for path in paths:
+        result = {'path': path, **{k: float('nan') for k in METRICS}, 'error': None}
+        try:
+            rows.append(_stacked_weights(torch.load(path, map_location='cpu'), input_dim))
+            scored.append(result)
+        except Exception as e:
+            result['error'] = str(e)
+        results.append(result)
+    for start in range(0, len(rows), BULK_CHUNK):
+        theta = torch.stack(rows[start:start + BULK_CHUNK])
+        with torch.no_grad():
+            probs = torch.sigmoid(X_test @ theta.t())  # (N, C)
+        predicted = probs > 0.5
+        true_positive = (predicted & y_true.unsqueeze(1)).sum(0)
+        predicted_positive, actual_positive = predicted.sum(0), y_true.sum()
+        counts = torch.stack([true_positive, predicted_positive - true_positive, actual_positive - true_positive,
+                              len(y_true) - predicted_positive - actual_positive + true_positive], dim=1)
+        for i, result in enumerate(scored[start:start + BULK_CHUNK]):
+            result['accuracy'], result['precision'], result['recall'], result['f1'] = metrics_from_counts(counts[i])
+            if curves:
+                sweep = threshold_sweep(y_test, probs[:, i])
+                result['roc_auc'], result['pr_auc'] = sweep['roc_auc'], sweep['pr_auc']
+    return results
+
+
+def bulk_evaluate(save_dir="models", round_dir=".", sort='f1', machine_id=0, total_machines=4, curves=True):
+    """Evaluate every checkpoint found by find_checkpoints and print them as a table, best first by sort."""
+    if sort not in METRICS:
+        raise ValueError(f"Unknown metric '{sort}', expected one of {METRICS}")
+    paths = find_checkpoints(save_dir, round_dir)
+    if not paths:
+        print("No checkpoints found.")
+        return []
+    start = time.perf_counter()
+    results = evaluate_checkpoints(paths, save_dir, machine_id, total_machines, curves)
+    seconds = time.perf_counter() - start
+    # Unscored checkpoints (NaN metrics) go last
+    results.sort(key=lambda r: (r['error'] is not None, -r[sort] if r['error'] is None else 0, r['path']))
+    rows = [[rank, r['path']] + ([f"{r[k]:.4f}" for k in METRICS] if r['error'] is None
+                                 else ['-'] * len(METRICS)) + [r['error'] or '']
+            for rank, r in enumerate(results, 1)]
+    print(tabulate(rows, headers=['Rank', 'Checkpoint', 'F1', 'Accuracy', 'Precision', 'Recall', 'ROC-AUC',
+                                  'PR-AUC', 'Error'], tablefmt='grid'))
+    print(f"Evaluated {sum(r['error'] is None for r in results)}/{len(results)} checkpoints in {seconds:.2f}s")
+    return results
+
+
 def predict(model_path, input_tensor):
     """Run inference on a single input tensor (1D torch tensor)."""
     input_dim = input_tensor.shape[0]
@@ -45,6 +144,23 @@ def predict(model_path, input_tensor):
     return pred, prob
 
 
+def predict_records(model_path, records, preprocessor=None):
+    """
+    Run inference on raw records (DataFrame, dicts, or rows in adults.csv column order).
+    Uses the preprocessor saved next to the model unless one is given.
+    Returns:
+        List of (prediction, probability) tuples
+    """
+    if preprocessor is None:
+        preprocessor = load_preprocessor(os.path.dirname(model_path))
+        if preprocessor is None:
+            raise FileNotFoundError(f"No {PREPROCESSOR_FILE} next to {model_path}; train a model first")
+    model = load_model(model_path, preprocessor.input_dim)
+    with torch.no_grad():
+        probs = model(torch.from_numpy(preprocessor.transform(records))).view(-1)
+    return [(int(p > 0.5), p) for p in probs.tolist()]
+
+
 def main_cli():
     print("\nModel Interface CLI")
     print("==================\n")
@@ -53,8 +169,9 @@ def main_cli():
         print("  1. List saved models")
         print("  2. Evaluate a saved model")
         print("  3. Predict with a saved model")
-        print("  4. Exit")
-        choice = input("Select an option (1-4): ").strip()
+        print("  4. Evaluate all saved and round checkpoints")
+        print("  5. Exit")
+        choice = input("Select an option (1-5): ").strip()
         if choice == '1':
             models = list_saved_models()
             if not models:
@@ -88,6 +205,19 @@ def main_cli():
             try:
                 idx = int(idx) - 1
                 model_path = os.path.join("models", models[idx])
+                preprocessor = load_preprocessor()
+                if preprocessor is not None:
+                    columns = [c for c in HEADER if c != 'salary']
+                    print(f"Enter a raw record as {len(columns)} comma-separated values ({', '.join(columns)}):")
+                    values = [v.strip() for v in input().strip().split(",")]
+                    if len(values) != len(columns):
+                        print(f"Expected {len(columns)} values, got {len(values)}.")
+                        continue
+                    record = {c: (float(v) if c not in preprocessor.categorical_columns else v)
+                              for c, v in zip(columns, values)}
+                    pred, prob = predict_records(model_path, [record], preprocessor)[0]
+                    print(f"Prediction: {pred} (probability: {prob:.4f})")
+                    continue
                 # Get input dimension
                 train_loader, _ = get_data_loaders()
                 input_dim = next(iter(train_loader))[0].shape[1]
@@ -103,10 +233,16 @@ def main_cli():
             except Exception as e:
                 print(f"Invalid input or selection: {e}")
         elif choice == '4':
+            sort = input(f"Sort by ({', '.join(METRICS)}) [f1]: ").strip() or 'f1'
+            try:
+                bulk_evaluate(sort=sort)
+            except Exception as e:
+                print(f"Bulk evaluation failed: {e}")
+        elif choice == '5':
             print("Exiting.")
             break
         else:
-            print("Invalid option. Please select 1-4.")
+            print("Invalid option. Please select 1-5.")
 
 if __name__ == "__main__":
     main_cli() 
\ No newline at end of file
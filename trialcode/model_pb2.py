@@ -24,17 +24,41 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bmodel.proto\x12\x02\x66l\"\x1f\n\x0cModelWeights\x12\x0f\n\x07weights\x18\x01 \x01(\x0c\"\x16\n\x03\x41\x63k\x12\x0f\n\x07message\x18\x01 \x01(\t20\n\x06\x46LPeer\x12&\n\tSendModel\x12\x10.fl.ModelWeights\x1a\x07.fl.Ackb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bmodel.proto\x12\x02\x66l\"Q\n\x0cModelWeights\x12\r\n\x05round\x18\x01 \x01(\x05\x12\x0f\n\x07weights\x18\x02 \x01(\x0c\x12!\n\x06\x66ormat\x18\x03 \x01(\x0e\x32\x11.fl.WeightsFormat\"\xb5\x01\n\nModelChunk\x12\x11\n\tupload_id\x18\x01 \x01(\t\x12\r\n\x05round\x18\x02 \x01(\x05\x12!\n\x06\x66ormat\x18\x03 \x01(\x0e\x32\x11.fl.WeightsFormat\x12\r\n\x05index\x18\x04 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x0e\n\x06sha256\x18\x06 \x01(\t\x12$\n\x08manifest\x18\x07 \x01(\x0b\x32\x12.fl.UploadManifest\x12\x0f\n\x07peer_id\x18\x08 \x01(\t\"I\n\x0eUploadManifest\x12\x12\n\nnum_chunks\x18\x01 \x01(\x03\x12\x13\n\x0btotal_bytes\x18\x02 \x01(\x03\x12\x0e\n\x06sha256\x18\x03 \x01(\t\"(\n\x13UploadStatusRequest\x12\x11\n\tupload_id\x18\x01 \x01(\t\"X\n\x0cUploadStatus\x12\x11\n\tupload_id\x18\x01 \x01(\t\x12\x12\n\nnext_chunk\x18\x02 \x01(\x03\x12\x10\n\x08\x63omplete\x18\x03 \x01(\x08\x12\x0f\n\x07message\x18\x04 \x01(\t\"\x16\n\x03\x41\x63k\x12\x0f\n\x07message\x18\x01 \x01(\t\"8\n\x12HealthCheckRequest\x12\x0f\n\x07peer_id\x18\x01 \x01(\t\x12\x11\n\ttimestamp\x18\x02 \x01(\t\"I\n\x13HealthCheckResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07peer_id\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\t\"\x1f\n\x0cStatsRequest\x12\x0f\n\x07peer_id\x18\x01 \x01(\t\"=\n\rCategoryCount\x12\x0e\n\x06\x63olumn\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\x12\r\n\x05\x63ount\x18\x03 \x01(\x03\"\x8b\x01\n\x0c\x46\x65\x61tureStats\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\r\n\x05\x63ount\x18\x02 \x01(\x03\x12\x17\n\x0fnumeric_columns\x18\x03 \x03(\t\x12\x0b\n\x03sum\x18\x04 \x03(\x01\x12\x0e\n\x06sum_sq\x18\x05 \x03(\x01\x12%\n\ncategories\x18\x06 \x03(\x0b\x32\x11.fl.CategoryCount\"h\n\x0f\x45valuateRequest\x12\x0f\n\x07peer_id\x18\x01 \x01(\t\x12\x10\n\x08\x63hecksum\x18\x02 \x01(\t\x12\x0f\n\x07weights\x18\x03 \x01(\x0c\x12!\n\x06\x66ormat\x18\x04 \x01(\x0e\x32\x11.fl.WeightsFormat\"\x93\x01\n\x10\x45valuateResponse\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x10\n\x08\x63hecksum\x18\x02 \x01(\t\x12\x15\n\rtrue_positive\x18\x03 \x01(\x03\x12\x16\n\x0e\x66\x61lse_positive\x18\x04 \x01(\x03\x12\x16\n\x0e\x66\x61lse_negative\x18\x05 \x01(\x03\x12\x15\n\rtrue_negative\x18\x06 \x01(\x03*+\n\rWeightsFormat\x12\n\n\x06PICKLE\x10\x00\x12\x0e\n\nTENSORS_V1\x10\x01\x32\xcc\x02\n\x06\x46LPeer\x12&\n\tSendModel\x12\x10.fl.ModelWeights\x1a\x07.fl.Ack\x12\x35\n\x0fSendModelStream\x12\x0e.fl.ModelChunk\x1a\x10.fl.UploadStatus(\x01\x12<\n\x0fGetUploadStatus\x12\x17.fl.UploadStatusRequest\x1a\x10.fl.UploadStatus\x12>\n\x0bHealthCheck\x12\x16.fl.HealthCheckRequest\x1a\x17.fl.HealthCheckResponse\x12.\n\x08GetStats\x12\x10.fl.StatsRequest\x1a\x10.fl.FeatureStats\x12\x35\n\x08\x45valuate\x12\x13.fl.EvaluateRequest\x1a\x14.fl.EvaluateResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'model_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_WEIGHTSFORMAT']._serialized_start=1144
+  _globals['_WEIGHTSFORMAT']._serialized_end=1187
   _globals['_MODELWEIGHTS']._serialized_start=19
-  _globals['_MODELWEIGHTS']._serialized_end=50
-  _globals['_ACK']._serialized_start=52
-  _globals['_ACK']._serialized_end=74
-  _globals['_FLPEER']._serialized_start=76
-  _globals['_FLPEER']._serialized_end=124
+  _globals['_MODELWEIGHTS']._serialized_end=100
+  _globals['_MODELCHUNK']._serialized_start=103
+  _globals['_MODELCHUNK']._serialized_end=284
+  _globals['_UPLOADMANIFEST']._serialized_start=286
+  _globals['_UPLOADMANIFEST']._serialized_end=359
+  _globals['_UPLOADSTATUSREQUEST']._serialized_start=361
+  _globals['_UPLOADSTATUSREQUEST']._serialized_end=401
+  _globals['_UPLOADSTATUS']._serialized_start=403
+  _globals['_UPLOADSTATUS']._serialized_end=491
+  _globals['_ACK']._serialized_start=493
+  _globals['_ACK']._serialized_end=515
+  _globals['_HEALTHCHECKREQUEST']._serialized_start=517
+  _globals['_HEALTHCHECKREQUEST']._serialized_end=573
+  _globals['_HEALTHCHECKRESPONSE']._serialized_start=575
+  _globals['_HEALTHCHECKRESPONSE']._serialized_end=648
+  _globals['_STATSREQUEST']._serialized_start=650
+  _globals['_STATSREQUEST']._serialized_end=681
+  _globals['_CATEGORYCOUNT']._serialized_start=683
+  _globals['_CATEGORYCOUNT']._serialized_end=744
+  _globals['_FEATURESTATS']._serialized_start=747
+  _globals['_FEATURESTATS']._serialized_end=886
+  _globals['_EVALUATEREQUEST']._serialized_start=888
+  _globals['_EVALUATEREQUEST']._serialized_end=992
+  _globals['_EVALUATERESPONSE']._serialized_start=995
+  _globals['_EVALUATERESPONSE']._serialized_end=1142
+  _globals['_FLPEER']._serialized_start=1190
+  _globals['_FLPEER']._serialized_end=1522
 # @@protoc_insertion_point(module_scope)
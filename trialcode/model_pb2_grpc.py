@@ -26,7 +26,7 @@ if _version_not_supported:
 
 
 class FLPeerStub(object):
-    """Service definition
+    """Service definition for Federated Learning peer communication
     """
 
     def __init__(self, channel):
@@ -40,14 +40,75 @@ class FLPeerStub(object):
                 request_serializer=model__pb2.ModelWeights.SerializeToString,
                 response_deserializer=model__pb2.Ack.FromString,
                 _registered_method=True)
+        self.SendModelStream = channel.stream_unary(
+                '/fl.FLPeer/SendModelStream',
+                request_serializer=model__pb2.ModelChunk.SerializeToString,
+                response_deserializer=model__pb2.UploadStatus.FromString,
+                _registered_method=True)
+        self.GetUploadStatus = channel.unary_unary(
+                '/fl.FLPeer/GetUploadStatus',
+                request_serializer=model__pb2.UploadStatusRequest.SerializeToString,
+                response_deserializer=model__pb2.UploadStatus.FromString,
+                _registered_method=True)
+        self.HealthCheck = channel.unary_unary(
+                '/fl.FLPeer/HealthCheck',
+                request_serializer=model__pb2.HealthCheckRequest.SerializeToString,
+                response_deserializer=model__pb2.HealthCheckResponse.FromString,
+                _registered_method=True)
+        self.GetStats = channel.unary_unary(
+                '/fl.FLPeer/GetStats',
+                request_serializer=model__pb2.StatsRequest.SerializeToString,
+                response_deserializer=model__pb2.FeatureStats.FromString,
+                _registered_method=True)
+        self.Evaluate = channel.unary_unary(
+                '/fl.FLPeer/Evaluate',
+                request_serializer=model__pb2.EvaluateRequest.SerializeToString,
+                response_deserializer=model__pb2.EvaluateResponse.FromString,
+                _registered_method=True)
 
 
 class FLPeerServicer(object):
-    """Service definition
+    """Service definition for Federated Learning peer communication
     """
 
     def SendModel(self, request, context):
-        """Missing associated documentation comment in .proto file."""
+        """SendModel: Transfer model weights between peers
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SendModelStream(self, request_iterator, context):
+        """SendModelStream: Transfer model weights as a stream of hashed chunks, resumable after interruption
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetUploadStatus(self, request, context):
+        """GetUploadStatus: How far an interrupted SendModelStream upload got
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def HealthCheck(self, request, context):
+        """HealthCheck: Monitor peer availability and network status
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStats(self, request, context):
+        """GetStats: Share this node's feature statistics for global normalization
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Evaluate(self, request, context):
+        """Evaluate: Score a model on this node's test split and return confusion counts
+        """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
@@ -60,6 +121,31 @@ def add_FLPeerServicer_to_server(servicer, server):
                     request_deserializer=model__pb2.ModelWeights.FromString,
                     response_serializer=model__pb2.Ack.SerializeToString,
             ),
+            'SendModelStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.SendModelStream,
+                    request_deserializer=model__pb2.ModelChunk.FromString,
+                    response_serializer=model__pb2.UploadStatus.SerializeToString,
+            ),
+            'GetUploadStatus': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetUploadStatus,
+                    request_deserializer=model__pb2.UploadStatusRequest.FromString,
+                    response_serializer=model__pb2.UploadStatus.SerializeToString,
+            ),
+            'HealthCheck': grpc.unary_unary_rpc_method_handler(
+                    servicer.HealthCheck,
+                    request_deserializer=model__pb2.HealthCheckRequest.FromString,
+                    response_serializer=model__pb2.HealthCheckResponse.SerializeToString,
+            ),
+            'GetStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStats,
+                    request_deserializer=model__pb2.StatsRequest.FromString,
+                    response_serializer=model__pb2.FeatureStats.SerializeToString,
+            ),
+            'Evaluate': grpc.unary_unary_rpc_method_handler(
+                    servicer.Evaluate,
+                    request_deserializer=model__pb2.EvaluateRequest.FromString,
+                    response_serializer=model__pb2.EvaluateResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'fl.FLPeer', rpc_method_handlers)
@@ -69,7 +155,7 @@ def add_FLPeerServicer_to_server(servicer, server):
 
  # This class is part of an EXPERIMENTAL API.
 class FLPeer(object):
-    """Service definition
+    """Service definition for Federated Learning peer communication
     """
 
     @staticmethod
@@ -98,3 +184,138 @@ class FLPeer(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def SendModelStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/fl.FLPeer/SendModelStream',
+            model__pb2.ModelChunk.SerializeToString,
+            model__pb2.UploadStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetUploadStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/fl.FLPeer/GetUploadStatus',
+            model__pb2.UploadStatusRequest.SerializeToString,
+            model__pb2.UploadStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def HealthCheck(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/fl.FLPeer/HealthCheck',
+            model__pb2.HealthCheckRequest.SerializeToString,
+            model__pb2.HealthCheckResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/fl.FLPeer/GetStats',
+            model__pb2.StatsRequest.SerializeToString,
+            model__pb2.FeatureStats.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Evaluate(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/fl.FLPeer/Evaluate',
+            model__pb2.EvaluateRequest.SerializeToString,
+            model__pb2.EvaluateResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
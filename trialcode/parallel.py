@@ -0,0 +1,142 @@
+import os
+import copy
+import socket
+import logging
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import TensorDataset
+from data import MemmapBatchLoader, get_data_loaders
+from train import Trainer
+
+logger = logging.getLogger(__name__)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def shard_loader(loader, rank, world_size):
+    """
+    This rank's strided share of a BatchLoader's rows. The rows are first truncated
+    to a multiple of world_size so every rank runs the same number of steps.
+    """
+    loader = copy.copy(loader)
+    n = len(loader.dataset) // world_size * world_size
+    if isinstance(loader, MemmapBatchLoader):
+        loader.rows = loader.rows[:n][rank::world_size]
+        loader.dataset = loader.rows
+    else:
+        loader.tensors = tuple(t[:n][rank::world_size] for t in loader.tensors)
+        loader.dataset = TensorDataset(*loader.tensors)
+    loader.batch_size = max(1, loader.batch_size // world_size)
+    return loader
+
+
+class DataParallelTrainer(Trainer):
+    """
+    Trainer that splits the node's training set across `workers` processes on
+    this host (torch.distributed, gloo backend). Rank 0 lives in the calling
+    process and drives the others, which are spawned once and kept for the
+    node's lifetime. Every step all-reduces the gradients, so all ranks hold
+    identical weights and rank 0 publishes a single state_dict. Each rank uses
+    batch_size // workers rows per step, keeping the effective batch size.
+    Args:
+        workers: Number of processes, including the calling one
+        threads: torch threads per process (default: cores / workers)
+        **kwargs: As for Trainer (solver must be 'adam')
+    """
+    def __init__(self, workers=2, threads=None, rank=0, port=None, **kwargs):
+        if kwargs.get('solver', 'adam') != 'adam':
+            raise ValueError("Data-parallel training only supports the 'adam' solver")
+        self.rank = rank
+        self.world_size = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        torch.set_num_threads(self.threads)
+        super().__init__(**kwargs)
+        self.processes = []
+        if rank == 0:
+            port = port or _free_port()
+            ctx = mp.get_context('spawn')
+            for worker_rank in range(1, workers):
+                process = ctx.Process(target=_worker_main, args=(worker_rank, workers, self.threads, port, kwargs),
+                                      daemon=True)
+                process.start()
+                self.processes.append(process)
+        dist.init_process_group('gloo', init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=workers)
+        self._shard()
+        if rank == 0:
+            logger.info(f"Data-parallel training on {workers} processes x {self.threads} threads")
+
+    def _load_data(self):
+        if not self.incremental:
+            return super()._load_data()
+        # Only rank 0 appends to the shared incremental cache; the other ranks map it once
+        # rank 0 is done. Workers are spawned after rank 0's initial load, so the barrier is
+        # only needed once the process group exists (every round).
+        if self.rank == 0:
+            loaders = super()._load_data()
+        if dist.is_initialized():
+            dist.barrier()
+        if self.rank != 0:
+            loaders = get_data_loaders(**self.loader_args, incremental_update=False)
+        return loaders
+
+    def _shard(self):
+        self.train_loader = shard_loader(self.train_loader, self.rank, self.world_size)
+
+    def _command(self, *command):
+        if self.rank == 0:
+            dist.broadcast_object_list([command], src=0)
+
+    def start_round(self, global_state=None, round_num=None):
+        self._command('round', global_state, round_num)
+        super().start_round(global_state, round_num)
+        if self.incremental:
+            self._shard()
+        if round_num is not None:
+            self.train_loader.set_seed(round_num * self.world_size + self.rank)
+
+    def train_epoch(self, desc=None):
+        self._command('epoch')
+        loss = super().train_epoch(desc if self.rank == 0 else None)
+        total = torch.tensor([loss * len(self.train_loader.dataset), len(self.train_loader.dataset)],
+                             dtype=torch.float64)
+        dist.all_reduce(total)
+        return (total[0] / total[1]).item()
+
+    def reduce_gradients(self):
+        params = [p for p in self.model.parameters() if p.grad is not None]
+        flat = torch.cat([p.grad.reshape(-1) for p in params])
+        dist.all_reduce(flat)
+        flat /= self.world_size
+        offset = 0
+        for p in params:
+            p.grad.copy_(flat[offset:offset + p.numel()].view_as(p.grad))
+            offset += p.numel()
+
+    def close(self):
+        """Stop the worker processes and tear down the process group."""
+        if not dist.is_initialized():
+            return
+        self._command('stop')
+        for process in self.processes:
+            process.join()
+        dist.destroy_process_group()
+
+
+def _worker_main(rank, world_size, threads, port, trainer_kwargs):
+    trainer = DataParallelTrainer(workers=world_size, threads=threads, rank=rank, port=port, **trainer_kwargs)
+    while True:
+        command = [None]
+        dist.broadcast_object_list(command, src=0)
+        name, *args = command[0]
+        if name == 'round':
+            trainer.start_round(*args)
+        elif name == 'epoch':
+            trainer.train_epoch()
+        elif name == 'stop':
+            break
+    dist.destroy_process_group()
@@ -0,0 +1,248 @@
+import os
+import json
+import argparse
+import logging
+import numpy as np
+from sklearn import preprocessing
+from data import (read_csv, clean_frame, _file_digest, Preprocessor, SHARD_MANIFEST,
+                  PREPROCESSOR_FILE, CATEGORICAL_COLUMNS, NORMALIZE_COLUMNS)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SCHEMES = ('contiguous', 'stratified', 'dirichlet')
+
+
+def contiguous_split(y, num_shards, rng=None):
+    """Consecutive row ranges, the last shard taking the remainder (same as load_and_preprocess_data)."""
+    per_shard = len(y) // num_shards
+    bounds = [i * per_shard for i in range(num_shards)] + [len(y)]
+    return [np.arange(bounds[i], bounds[i + 1]) for i in range(num_shards)]
+
+
+def stratified_split(y, num_shards, rng):
+    """Every shard gets (almost) the same number of rows of each class."""
+    parts = [[] for _ in range(num_shards)]
+    for label in np.unique(y):
+        idx = rng.permutation(np.flatnonzero(y == label))
+        for shard, chunk in enumerate(np.array_split(idx, num_shards)):
+            parts[shard].append(chunk)
+    return [np.sort(np.concatenate(p)) for p in parts]
+
+
+def dirichlet_split(y, num_shards, rng, alpha=0.5):
+    """Non-IID split: each class is spread over shards with Dirichlet(alpha) proportions."""
+    parts = [[] for _ in range(num_shards)]
+    for label in np.unique(y):
+        idx = rng.permutation(np.flatnonzero(y == label))
+        proportions = rng.dirichlet(np.full(num_shards, alpha))
+        cuts = (np.cumsum(proportions)[:-1] * len(idx)).astype(int)
+        for shard, chunk in enumerate(np.split(idx, cuts)):
+            parts[shard].append(chunk)
+    return [np.sort(np.concatenate(p)) for p in parts]
+
+
+def write_shards(X, y, shard_indices, out_dir, feature_names, metadata=None):
+    """
+    Write each shard as <name>_features.npy / <name>_labels.npy plus manifest.json.
+    Args:
+        X: Encoded feature matrix (float32)
+        y: Labels (float32)
+        shard_indices: List of row index arrays, one per shard
+        out_dir: Output directory
+        feature_names: Column names of X, in order
+        metadata: Extra manifest fields (source, scheme, ...)
+    Returns:
+        The manifest dictionary
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    shards = []
+    for machine_id, idx in enumerate(shard_indices):
+        entry = _shard_entry(machine_id, len(idx), y[idx].sum())
+        np.save(os.path.join(out_dir, entry['features']), X[idx])
+        np.save(os.path.join(out_dir, entry['labels']), y[idx])
+        shards.append(entry)
+    return _write_manifest(out_dir, shards, X.shape[1], feature_names, metadata)
+
+
+def _shard_entry(machine_id, num_samples, num_positive):
+    name = f"shard_{machine_id:04d}"
+    return {
+        'machine_id': machine_id,
+        'features': f"{name}_features.npy",
+        'labels': f"{name}_labels.npy",
+        'num_samples': int(num_samples),
+        'num_positive': int(num_positive),
+    }
+
+
+def _write_manifest(out_dir, shards, input_dim, feature_names, metadata=None):
+    manifest = dict(metadata or {})
+    manifest.update({
+        'num_shards': len(shards),
+        'input_dim': int(input_dim),
+        'feature_names': list(feature_names),
+        'shards': shards,
+    })
+    # Manifest goes last: its presence marks the shard set as complete
+    with open(os.path.join(out_dir, SHARD_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def scan_csv(path, chunksize=100000):
+    """
+    First streaming pass: count clean rows and fit the encoding without holding the file.
+    Returns:
+        num_rows, fitted Preprocessor
+    """
+    num_rows = 0
+    vocabulary = {col: set() for col in CATEGORICAL_COLUMNS}
+    scaler = preprocessing.StandardScaler()
+    for chunk in read_csv(path, chunksize=chunksize):
+        chunk = clean_frame(chunk)
+        if chunk.empty:
+            continue
+        num_rows += len(chunk)
+        for col in CATEGORICAL_COLUMNS:
+            vocabulary[col].update(chunk[col].unique())
+        scaler.partial_fit(chunk[NORMALIZE_COLUMNS])
+    vocabulary = {col: sorted(values) for col, values in vocabulary.items()}
+    return num_rows, Preprocessor.from_scaler(vocabulary, scaler)
+
+
+def stream_partition_dataset(path="adults.csv", out_dir="shards", num_shards=4, chunksize=100000):
+    """
+    Contiguous partitioning in two streaming passes, for CSVs larger than RAM.
+    Peak memory is a few chunks regardless of file size: the first pass fits
+    the one-hot vocabulary and scaler moments (StandardScaler.partial_fit),
+    the second encodes each chunk and writes it into preallocated .npy shards.
+    Args:
+        path: CSV file in the adults.csv format
+        out_dir: Output directory for shards and manifest
+        num_shards: Number of nodes
+        chunksize: Rows read per chunk
+    Returns:
+        The manifest dictionary
+    """
+    num_rows, preprocessor = scan_csv(path, chunksize)
+    if num_rows < num_shards:
+        raise ValueError(f"{path} has {num_rows} usable rows, too few for {num_shards} shards")
+    logger.info(f"Scanned {num_rows} rows from {path}")
+    os.makedirs(out_dir, exist_ok=True)
+    per_shard = num_rows // num_shards
+    sizes = [per_shard] * (num_shards - 1) + [num_rows - per_shard * (num_shards - 1)]
+    shards = [_shard_entry(i, size, 0) for i, size in enumerate(sizes)]
+
+    feature_names = preprocessor.feature_names
+    preprocessor.save(os.path.join(out_dir, PREPROCESSOR_FILE))
+    features = labels = None
+    shard_id, offset = -1, 0  # offset: rows already written to the open shard
+
+    def open_shard(i):
+        shard = shards[i]
+        X_out = np.lib.format.open_memmap(os.path.join(out_dir, shard['features']), mode='w+',
+                                          dtype=np.float32, shape=(shard['num_samples'], len(feature_names)))
+        y_out = np.lib.format.open_memmap(os.path.join(out_dir, shard['labels']), mode='w+',
+                                          dtype=np.float32, shape=(shard['num_samples'],))
+        return X_out, y_out
+
+    for chunk in read_csv(path, chunksize=chunksize):
+        chunk = clean_frame(chunk)
+        if chunk.empty:
+            continue
+        X, y = preprocessor.transform(chunk), chunk['salary'].values.astype(np.float32)
+        start = 0
+        while start < len(X):
+            if shard_id < 0 or offset == shards[shard_id]['num_samples']:
+                if features is not None:
+                    features.flush()
+                    labels.flush()
+                shard_id, offset = shard_id + 1, 0
+                features, labels = open_shard(shard_id)
+            n = min(len(X) - start, shards[shard_id]['num_samples'] - offset)
+            features[offset:offset + n] = X[start:start + n]
+            labels[offset:offset + n] = y[start:start + n]
+            shards[shard_id]['num_positive'] += int(y[start:start + n].sum())
+            offset += n
+            start += n
+    features.flush()
+    labels.flush()
+    del features, labels
+
+    metadata = {
+        'source': os.path.abspath(path),
+        'source_sha256': _file_digest(path),
+        'scheme': 'contiguous',
+        'alpha': None,
+        'seed': None,
+        'streamed': True,
+        'preprocessor': PREPROCESSOR_FILE,
+    }
+    return _write_manifest(out_dir, shards, len(feature_names), feature_names, metadata)
+
+
+def partition_dataset(path="adults.csv", out_dir="shards", num_shards=4, scheme='contiguous', alpha=0.5, seed=42):
+    """
+    Encode the dataset once and write one memory-mappable shard per node.
+    Args:
+        path: CSV file in the adults.csv format
+        out_dir: Output directory for shards and manifest
+        num_shards: Number of nodes
+        scheme: 'contiguous', 'stratified' or 'dirichlet'
+        alpha: Dirichlet concentration (smaller is more skewed), dirichlet scheme only
+        seed: Seed for the stratified/dirichlet assignment
+    Returns:
+        The manifest dictionary
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown partition scheme '{scheme}', expected one of {SCHEMES}")
+    df = clean_frame(read_csv(path))
+    preprocessor = Preprocessor.fit(df)
+    X, y, feature_names = preprocessor.transform(df), df['salary'].values.astype(np.float32), preprocessor.feature_names
+    del df
+    os.makedirs(out_dir, exist_ok=True)
+    preprocessor.save(os.path.join(out_dir, PREPROCESSOR_FILE))
+    rng = np.random.default_rng(seed)
+    if scheme == 'contiguous':
+        shard_indices = contiguous_split(y, num_shards)
+    elif scheme == 'stratified':
+        shard_indices = stratified_split(y, num_shards, rng)
+    else:
+        shard_indices = dirichlet_split(y, num_shards, rng, alpha=alpha)
+    metadata = {
+        'source': os.path.abspath(path),
+        'source_sha256': _file_digest(path),
+        'scheme': scheme,
+        'alpha': alpha if scheme == 'dirichlet' else None,
+        'seed': seed,
+        'preprocessor': PREPROCESSOR_FILE,
+    }
+    manifest = write_shards(X, y, shard_indices, out_dir, feature_names, metadata)
+    for shard in manifest['shards']:
+        logger.info(f"Shard {shard['machine_id']}: {shard['num_samples']} samples, "
+                    f"{shard['num_positive']} positive")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the dataset into per-node memory-mapped shards")
+    parser.add_argument("--path", default="adults.csv", help="Source CSV")
+    parser.add_argument("--out-dir", default="shards", help="Output directory")
+    parser.add_argument("--shards", type=int, default=4, help="Number of nodes")
+    parser.add_argument("--scheme", choices=SCHEMES, default='contiguous', help="Partitioning scheme")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet concentration for --scheme dirichlet")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--stream", action='store_true',
+                        help="Read the CSV in chunks (bounded memory, contiguous scheme only)")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows per chunk for --stream")
+    args = parser.parse_args()
+    if args.stream:
+        if args.scheme != 'contiguous':
+            parser.error("--stream only supports --scheme contiguous")
+        stream_partition_dataset(args.path, args.out_dir, args.shards, args.chunksize)
+    else:
+        partition_dataset(args.path, args.out_dir, args.shards, args.scheme, args.alpha, args.seed)
@@ -5,6 +5,7 @@ import datetime
 from tabulate import tabulate
 import model_pb2
 import model_pb2_grpc
+from grpc_client import channel_pool
 import yaml
 import os
 from concurrent.futures import ThreadPoolExecutor
@@ -38,20 +39,18 @@ class PeerStatusMonitor:
     def check_peer_health(self, peer_address):
         """Check health of a single peer"""
         try:
-            start_time = time.time()
-            channel = grpc.insecure_channel(peer_address)
-            stub = model_pb2_grpc.FLPeerStub(channel)
-            
-            request = model_pb2.HealthCheckRequest(
-                peer_id=self.own_address,
-                timestamp=datetime.datetime.now().isoformat()
-            )
-            
-            # Set a timeout of 2 seconds for the health check (reduced from 5)
-            response = stub.HealthCheck(request, timeout=2)
-            
-            # Calculate latency
-            latency = (time.time() - start_time) * 1000  # Convert to milliseconds
+            with channel_pool.stub(peer_address) as stub:
+                start_time = time.time()
+                request = model_pb2.HealthCheckRequest(
+                    peer_id=self.own_address,
+                    timestamp=datetime.datetime.now().isoformat()
+                )
+
+                # Set a timeout of 2 seconds for the health check (reduced from 5)
+                response = stub.HealthCheck(request, timeout=2)
+
+                # Calculate latency (the pooled channel is already connected after the first check)
+                latency = (time.time() - start_time) * 1000  # Convert to milliseconds
             
             with self.lock:
                 self.peers[peer_address].update({
@@ -67,8 +66,6 @@ class PeerStatusMonitor:
                     'last_seen': self.peers[peer_address]['last_seen'],
                     'latency': None
                 })
-        finally:
-            channel.close()
 
     def check_all_peers(self):
         """Check health of all peers concurrently"""
@@ -95,6 +92,7 @@ class PeerStatusMonitor:
         print(f"Update Interval: {self.check_interval}s\n")
 
         table_data = []
+        channel_states = channel_pool.states()
         with self.lock:
             for addr, info in self.peers.items():
                 last_seen = info['last_seen'].strftime('%H:%M:%S') if info['last_seen'] else 'Never'
@@ -105,12 +103,13 @@ class PeerStatusMonitor:
                     addr,
                     f"{status_symbol} {info['status']}",
                     last_seen,
-                    latency
+                    latency,
+                    channel_states[addr].name if addr in channel_states else 'None'
                 ])
 
         print(tabulate(
             table_data,
-            headers=['Peer Name', 'Address', 'Status', 'Last Seen', 'Latency'],
+            headers=['Peer Name', 'Address', 'Status', 'Last Seen', 'Latency', 'Channel'],
             tablefmt='grid'
         ))
         print("\nPress Ctrl+C to stop monitoring\n")
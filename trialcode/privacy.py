@@ -0,0 +1,138 @@
+import os
+import json
+import math
+import logging
+from functools import lru_cache
+import torch
+from model import OneHotFeatures
+
+logger = logging.getLogger(__name__)
+
+ACCOUNTANT_FILE = "privacy_accountant.json"
+RDP_ORDERS = tuple(range(2, 65)) + (80, 96, 128, 192, 256)
+
+
+@lru_cache(maxsize=None)
+def _step_rdp(sample_rate, noise_multiplier):
+    """
+    RDP of one step of the sampled Gaussian mechanism at every order in
+    RDP_ORDERS (Mironov, Talwar & Zhang 2019, integer orders). Cached: a
+    training run only ever uses a handful of (sample_rate, noise) pairs.
+    """
+    if sample_rate == 0:
+        return tuple(0.0 for _ in RDP_ORDERS)
+    if sample_rate == 1:
+        return tuple(alpha / (2 * noise_multiplier ** 2) for alpha in RDP_ORDERS)
+    log_q, log_1mq = math.log(sample_rate), math.log1p(-sample_rate)
+    rdp = []
+    for alpha in RDP_ORDERS:
+        log_a = -math.inf
+        for i in range(alpha + 1):
+            log_coef = (math.lgamma(alpha + 1) - math.lgamma(i + 1) - math.lgamma(alpha - i + 1)
+                        + i * log_q + (alpha - i) * log_1mq)
+            term = log_coef + (i * i - i) / (2 * noise_multiplier ** 2)
+            if log_a == -math.inf:
+                log_a = term
+            else:  # log(exp(log_a) + exp(term)) without overflow
+                log_a = max(log_a, term) + math.log1p(math.exp(-abs(log_a - term)))
+        rdp.append(log_a / (alpha - 1))
+    return tuple(rdp)
+
+
+class RDPAccountant:
+    """
+    Privacy spent by DP-SGD, kept as the number of steps taken at each
+    (sample_rate, noise_multiplier). The history is saved as JSON so the
+    budget accumulates across rounds and restarts of a node.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.history = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.history = {(entry['sample_rate'], entry['noise_multiplier']): entry['steps']
+                                for entry in json.load(f)['history']}
+
+    def step(self, sample_rate, noise_multiplier, num_steps=1):
+        key = (float(sample_rate), float(noise_multiplier))
+        self.history[key] = self.history.get(key, 0) + num_steps
+
+    @property
+    def steps(self):
+        return sum(self.history.values())
+
+    def epsilon(self, delta):
+        """Smallest epsilon over the RDP orders for which training is (epsilon, delta)-DP."""
+        if not self.history:
+            return 0.0
+        rdp = [0.0] * len(RDP_ORDERS)
+        for (sample_rate, noise_multiplier), steps in self.history.items():
+            rdp = [total + steps * r for total, r in zip(rdp, _step_rdp(sample_rate, noise_multiplier))]
+        return min(r + math.log(1 / delta) / (alpha - 1) for r, alpha in zip(rdp, RDP_ORDERS))
+
+    def save(self):
+        if not self.path:
+            return
+        history = [{'sample_rate': q, 'noise_multiplier': sigma, 'steps': steps}
+                   for (q, sigma), steps in self.history.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'history': history}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def per_sample_grad_norms(x, residual):
+    """
+    L2 norms of the per-sample gradients of BCE w.r.t. a linear layer's
+    (weight, bias), in closed form: grad_i = residual_i * [x_i, 1], so
+    ||grad_i|| = |residual_i| * sqrt(||x_i||^2 + 1). No per-sample tensors are built.
+    """
+    if isinstance(x, OneHotFeatures):
+        # One-hot entries are 1, so each contributes 1 to the squared norm
+        sq_norm = x.dense.pow(2).sum(1) + x.indices.shape[1]
+    else:
+        sq_norm = x.pow(2).sum(1)
+    return residual.abs() * (sq_norm + 1).sqrt()
+
+
+class DPSGD:
+    """
+    DP-SGD gradients for SimpleBinaryClassifier: per-sample gradients are
+    clipped to max_grad_norm and Gaussian noise of std noise_multiplier *
+    max_grad_norm is added to their sum. Clipping rescales each sample's
+    residual, so the clipped sum is one backward pass of a reweighted loss.
+    The sample rate for accounting is batch_size / dataset size (shuffled
+    fixed-size batches approximating Poisson sampling).
+    Args:
+        noise_multiplier: Noise std relative to max_grad_norm
+        max_grad_norm: Per-sample clipping bound
+        delta: Target delta for reported epsilon
+        accountant_path: JSON file the accountant is saved to / resumed from
+        seed: Seed for the noise, None to use the global torch RNG
+    """
+    def __init__(self, noise_multiplier=1.0, max_grad_norm=1.0, delta=1e-5, accountant_path=None, seed=None):
+        self.noise_multiplier = noise_multiplier
+        self.max_grad_norm = max_grad_norm
+        self.delta = delta
+        self.accountant = RDPAccountant(accountant_path)
+        self.generator = None if seed is None else torch.Generator().manual_seed(seed)
+
+    def backward(self, model, x, y, sample_rate):
+        """Set model's parameter .grad to the noisy clipped mean gradient of batch (x, y)."""
+        layer = model.output_layer
+        logits = layer(x).view(-1)
+        with torch.no_grad():
+            residual = torch.sigmoid(logits) - y.view(-1)  # d(BCE)/d(logit) per sample
+            norms = per_sample_grad_norms(x, residual)
+            scale = (self.max_grad_norm / (norms + 1e-6)).clamp(max=1.0)
+        # d/dtheta of sum_i (scale_i * residual_i) * logit_i = sum of clipped per-sample gradients
+        (logits * (scale * residual)).sum().backward()
+        batch_size = len(residual)
+        with torch.no_grad():
+            for p in (layer.weight, layer.bias):
+                noise = torch.randn(p.shape, generator=self.generator) * (self.noise_multiplier * self.max_grad_norm)
+                p.grad.add_(noise).div_(batch_size)
+        self.accountant.step(sample_rate, self.noise_multiplier)
+
+    def epsilon(self):
+        return self.accountant.epsilon(self.delta)
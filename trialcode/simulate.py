@@ -0,0 +1,147 @@
+import time
+import argparse
+import logging
+import numpy as np
+import torch
+from tabulate import tabulate
+from data import load_and_preprocess_data, BatchLoader
+from partition import SCHEMES, contiguous_split, stratified_split, dirichlet_split
+from model import SimpleBinaryClassifier
+from fedavg import fed_avg
+from train import evaluate
+from solvers import batched_adam_step
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+logging.getLogger('fedavg').setLevel(logging.WARNING)  # One line per aggregation is noise here
+
+
+class ClientBatch:
+    """
+    K virtual clients over one shared feature matrix. Each client's rows are a
+    row of a padded (K, max_rows) index matrix; its logistic-regression
+    parameters are a row of a (K, D + 1) tensor (weight and bias), so a local
+    minibatch step for all clients is one gather and two bmm calls.
+    Args:
+        X: Feature matrix of all clients' rows (N, D)
+        y: Labels (N, 1)
+        client_indices: One array of row indices per client
+    """
+    def __init__(self, X, y, client_indices):
+        self.X = torch.cat([X, torch.ones(len(X), 1)], dim=1)  # Constant column carries the bias
+        self.y = y.view(-1)
+        self.num_clients = len(client_indices)
+        self.sizes = torch.tensor([len(idx) for idx in client_indices])
+        self.max_rows = int(self.sizes.max())
+        self.rows = torch.zeros(self.num_clients, self.max_rows, dtype=torch.int64)
+        for k, idx in enumerate(client_indices):
+            self.rows[k, :len(idx)] = torch.as_tensor(idx, dtype=torch.int64)
+        self.valid = torch.arange(self.max_rows).unsqueeze(0) < self.sizes.unsqueeze(1)
+
+    def shuffled_rows(self, generator):
+        """A fresh permutation of every client's rows, padding kept at the end."""
+        keys = torch.rand(self.num_clients, self.max_rows, generator=generator)
+        keys[~self.valid] = float('inf')
+        order = torch.argsort(keys, dim=1)
+        return self.rows.gather(1, order), self.valid.gather(1, order)
+
+    def train(self, theta, epochs=3, batch_size=64, generator=None):
+        """
+        Minibatch Adam for every client at once, starting from theta (K, D + 1).
+        Each client sees the same batch sequence as a BatchLoader over its rows
+        would, and its Adam state only advances on steps where it has rows.
+        Returns:
+            Trained theta (K, D + 1)
+        """
+        theta = theta.clone()
+        m, v = torch.zeros_like(theta), torch.zeros_like(theta)
+        steps = torch.zeros(self.num_clients, 1)
+        for _ in range(epochs):
+            rows, valid = self.shuffled_rows(generator)
+            for start in range(0, self.max_rows, batch_size):
+                idx, mask = rows[:, start:start + batch_size], valid[:, start:start + batch_size].float()
+                count = mask.sum(1, keepdim=True)
+                active = count > 0
+                xb, yb = self.X[idx], self.y[idx]
+                logits = torch.bmm(xb, theta.unsqueeze(2)).squeeze(2)
+                # d(mean BCE)/d(logit) of each client's own batch
+                residual = (torch.sigmoid(logits) - yb) * mask / count.clamp(min=1)
+                grad = torch.bmm(xb.transpose(1, 2), residual.unsqueeze(2)).squeeze(2)
+                theta, m, v, steps = batched_adam_step(theta, grad, m, v, steps, active=active)
+        return theta
+
+
+def to_state_dicts(theta):
+    """Per-client state_dicts in SimpleBinaryClassifier's format."""
+    return [{'output_layer.weight': row[:-1].view(1, -1).clone(), 'output_layer.bias': row[-1:].clone()}
+            for row in theta]
+
+
+def split_clients(y, num_clients, scheme='contiguous', alpha=0.5, seed=42):
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown partition scheme '{scheme}', expected one of {SCHEMES}")
+    y = y.view(-1).numpy()
+    rng = np.random.default_rng(seed)
+    if scheme == 'contiguous':
+        return contiguous_split(y, num_clients)
+    if scheme == 'stratified':
+        return stratified_split(y, num_clients, rng)
+    return dirichlet_split(y, num_clients, rng, alpha=alpha)
+
+
+def simulate(num_clients=100, rounds=10, epochs=3, batch_size=64, scheme='contiguous', alpha=0.5, seed=42,
+             path="adults.csv"):
+    """
+    Federated rounds of num_clients virtual clients in one process: every
+    round all clients start from the global model, train locally in one
+    batched computation, and are combined with fed_avg. The global model is
+    evaluated on the held-out test split after each round.
+    Returns:
+        Final global state_dict and one summary row per round
+    """
+    X_train, y_train, X_test, y_test = load_and_preprocess_data(path, machine_id=0, total_machines=1, seed=seed)
+    client_indices = [idx for idx in split_clients(y_train, num_clients, scheme, alpha, seed) if len(idx)]
+    if len(client_indices) < num_clients:
+        logger.info(f"{num_clients - len(client_indices)} clients got no rows and are left out")
+    clients = ClientBatch(X_train, y_train, client_indices)
+    model = SimpleBinaryClassifier(X_train.shape[1])
+    test_loader = BatchLoader(X_test, y_test, batch_size=batch_size)
+    generator = torch.Generator().manual_seed(seed)
+    global_state = model.state_dict()
+    rows = []
+    for round_num in range(1, rounds + 1):
+        start = time.perf_counter()
+        theta = torch.cat([global_state['output_layer.weight'].view(-1), global_state['output_layer.bias']])
+        theta = clients.train(theta.expand(clients.num_clients, -1), epochs, batch_size, generator)
+        global_state = fed_avg(to_state_dicts(theta))
+        seconds = time.perf_counter() - start
+        model.load_state_dict(global_state)
+        acc, prec, rec, f1 = evaluate(model, test_loader)
+        logger.info(f"Round {round_num}: {clients.num_clients} clients in {seconds:.3f}s "
+                    f"({clients.num_clients / seconds:,.0f} clients/s) | Acc: {acc:.4f} | F1: {f1:.4f}")
+        rows.append([round_num, f"{seconds * 1000:,.1f}", f"{clients.num_clients / seconds:,.0f}",
+                     f"{acc:.4f}", f"{prec:.4f}", f"{rec:.4f}", f"{f1:.4f}"])
+    return global_state, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a federation of virtual clients in one process")
+    parser.add_argument("--clients", type=int, default=100, help="Number of virtual clients")
+    parser.add_argument("--rounds", type=int, default=10, help="Number of federated rounds")
+    parser.add_argument("--epochs", type=int, default=3, help="Local epochs per round")
+    parser.add_argument("--batch-size", type=int, default=64, help="Local batch size")
+    parser.add_argument("--scheme", choices=SCHEMES, default='contiguous', help="How rows are split across clients")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet concentration for --scheme dirichlet")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--path", default="adults.csv", help="Source CSV")
+    parser.add_argument("--save", default=None, help="Save the final global model to this path")
+    args = parser.parse_args()
+    global_state, rows = simulate(args.clients, args.rounds, args.epochs, args.batch_size, args.scheme, args.alpha,
+                                  args.seed, args.path)
+    print(tabulate(rows, headers=['Round', 'Time (ms)', 'Clients/s', 'Accuracy', 'Precision', 'Recall', 'F1'],
+                   tablefmt='grid'))
+    if args.save:
+        torch.save(global_state, args.save)
@@ -0,0 +1,135 @@
+import torch
+import torch.nn.functional as F
+from model import OneHotFeatures
+
+# Local solvers for SimpleBinaryClassifier (logistic regression). Each one fits
+# the model's parameters in place on the full local training set and returns
+# (final objective, iterations). The objective is
+#   BCE + l2/2 * ||w||^2 + prox/2 * ||theta - theta_global||^2
+# where the proximal term (FedProx) keeps the local solution near the global model.
+SOLVERS = ('adam', 'lbfgs', 'newton')
+
+
+def full_batch(loader):
+    """All (X, y) of a BatchLoader (or any loader) as one batch, in dataset order."""
+    if hasattr(loader, '_slice'):
+        return loader._slice(0, len(loader.dataset))
+    batches = list(loader)
+    return torch.cat([xb for xb, _ in batches]), torch.cat([yb for _, yb in batches])
+
+
+def _penalty(params, l2, prox, anchor):
+    weight, bias = params
+    total = 0.5 * l2 * weight.pow(2).sum()
+    if prox > 0 and anchor is not None:
+        total = total + 0.5 * prox * sum((p - a).pow(2).sum() for p, a in zip(params, anchor))
+    return total
+
+
+def penalty(model, l2=0.0, prox=0.0, global_state=None):
+    """L2 + proximal terms of the objective for model's current parameters (differentiable)."""
+    layer = model.output_layer
+    return _penalty([layer.weight, layer.bias], l2, prox, _anchor(model, global_state))
+
+
+def _anchor(model, global_state):
+    if global_state is None:
+        return None
+    layer = model.output_layer
+    return [global_state['output_layer.weight'].to(layer.weight.dtype),
+            global_state['output_layer.bias'].to(layer.bias.dtype)]
+
+
+def lbfgs_solve(model, X, y, l2=0.0, prox=0.0, global_state=None, max_iter=100, tol=1e-6):
+    """Full-batch L-BFGS with strong Wolfe line search."""
+    layer = model.output_layer
+    params = [layer.weight, layer.bias]
+    anchor = _anchor(model, global_state)
+    optimizer = torch.optim.LBFGS(params, lr=1, max_iter=max_iter, tolerance_grad=tol, tolerance_change=tol * 1e-3,
+                                  history_size=20, line_search_fn='strong_wolfe')
+    model.train()
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.binary_cross_entropy(model(X), y) + _penalty(params, l2, prox, anchor)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    with torch.no_grad():
+        loss = (F.binary_cross_entropy(model(X), y) + _penalty(params, l2, prox, anchor)).item()
+    return loss, optimizer.state[params[0]]['n_iter']
+
+
+def newton_solve(model, X, y, l2=0.0, prox=0.0, global_state=None, max_iter=25, tol=1e-6):
+    """
+    Newton's method / IRLS in float64. The Hessian is (D+1) x (D+1), so each
+    step is one weighted X^T X product and a small linear solve.
+    """
+    if isinstance(X, OneHotFeatures):
+        X = X.to_dense()
+    layer = model.output_layer
+    n, dim = X.shape
+    A = torch.cat([X.double(), torch.ones(n, 1, dtype=torch.float64)], dim=1)
+    y = y.reshape(-1).double()
+    theta = torch.cat([layer.weight.detach().reshape(-1), layer.bias.detach()]).double()
+    anchor = _anchor(model, global_state)
+    theta_global = None if anchor is None else torch.cat([anchor[0].reshape(-1), anchor[1]]).double()
+    ridge = torch.full((dim + 1,), float(l2), dtype=torch.float64)
+    ridge[-1] = 0.0  # The bias is not L2-penalized
+    if prox > 0 and theta_global is not None:
+        ridge += prox
+    ridge += 1e-10  # Keeps H invertible on separable data with no regularization
+
+    def objective(theta):
+        logits = A @ theta
+        loss = F.binary_cross_entropy_with_logits(logits, y) + 0.5 * l2 * theta[:-1].pow(2).sum()
+        if prox > 0 and theta_global is not None:
+            loss = loss + 0.5 * prox * (theta - theta_global).pow(2).sum()
+        return loss
+
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        p = torch.sigmoid(A @ theta)
+        grad = A.t() @ (p - y) / n + l2 * torch.cat([theta[:-1], theta.new_zeros(1)])
+        if prox > 0 and theta_global is not None:
+            grad = grad + prox * (theta - theta_global)
+        hessian = (A.t() * (p * (1 - p))) @ A / n + torch.diag(ridge)
+        step = torch.linalg.solve(hessian, grad)
+        # Backtracking keeps the iteration monotone far from the optimum
+        current, t = objective(theta), 1.0
+        while objective(theta - t * step) > current and t > 1e-4:
+            t *= 0.5
+        theta = theta - t * step
+        if step.abs().max() * t < tol:
+            break
+
+    with torch.no_grad():
+        layer.weight.copy_(theta[:-1].view_as(layer.weight))
+        layer.bias.copy_(theta[-1:].view_as(layer.bias))
+    return objective(theta).item(), iterations
+
+
+def batched_adam_step(theta, grad, m, v, steps, lr=0.001, active=None, betas=(0.9, 0.999), eps=1e-8):
+    """
+    One Adam update (same rule as torch.optim.Adam) for a stack of independent
+    parameter rows. lr may be a scalar or a (K, 1) column; `active` (K, 1) masks
+    rows that take no step, leaving their parameters and moments unchanged.
+    Returns:
+        theta, m, v, steps
+    """
+    beta1, beta2 = betas
+    if active is None:
+        active = torch.ones_like(steps, dtype=torch.bool)
+    steps = steps + active
+    m = torch.where(active, beta1 * m + (1 - beta1) * grad, m)
+    v = torch.where(active, beta2 * v + (1 - beta2) * grad * grad, v)
+    t = steps.clamp(min=1)
+    update = lr * (m / (1 - beta1 ** t)) / ((v / (1 - beta2 ** t)).sqrt() + eps)
+    return torch.where(active, theta - update, theta), m, v, steps
+
+
+SOLVER_FUNCTIONS = {
+    'lbfgs': lbfgs_solve,
+    'newton': newton_solve,
+}
@@ -0,0 +1,122 @@
+import os
+import csv
+import time
+import argparse
+import logging
+import itertools
+import torch
+from tabulate import tabulate
+from data import load_and_preprocess_data, load_or_fit_preprocessor, BatchLoader
+from model import SimpleBinaryClassifier, set_seed
+from train import evaluate, evaluate_curves
+from solvers import batched_adam_step
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+METRICS = ('f1', 'accuracy', 'precision', 'recall', 'roc_auc', 'pr_auc')
+
+
+def train_stacked(X, y, theta, lrs, epochs, batch_size, seed=42):
+    """
+    Minibatch Adam for C configurations at once that differ only in learning
+    rate. They share every batch (drawn by a BatchLoader with `seed`, so the
+    batch order equals a plain training run's): the forward pass for all
+    configs is one (B, D+1) x (D+1, C) matmul.
+    Args:
+        X, y: Training features (N, D) and labels (N, 1)
+        theta: Initial parameters (C, D + 1), weight then bias
+        lrs: Learning rates (C,)
+        epochs: Sorted epoch counts at which to snapshot the parameters
+        batch_size: Shared batch size
+    Returns:
+        {epoch: theta (C, D + 1)} for each requested epoch count
+    """
+    loader = BatchLoader(torch.cat([X, torch.ones(len(X), 1)], dim=1), y.view(-1), batch_size=batch_size,
+                         shuffle=True, seed=seed)
+    lr = torch.as_tensor(lrs, dtype=theta.dtype).view(-1, 1)
+    m, v = torch.zeros_like(theta), torch.zeros_like(theta)
+    steps = torch.zeros(len(theta), 1)
+    snapshots = {}
+    for epoch in range(1, max(epochs) + 1):
+        for xb, yb in loader:
+            residual = (torch.sigmoid(xb @ theta.t()) - yb.unsqueeze(1)) / len(yb)  # (B, C)
+            grad = residual.t() @ xb
+            theta, m, v, steps = batched_adam_step(theta, grad, m, v, steps, lr=lr)
+        if epoch in epochs:
+            snapshots[epoch] = theta.clone()
+    return snapshots
+
+
+def run_sweep(lrs=(1e-4, 3e-4, 1e-3, 3e-3, 1e-2), batch_sizes=(32, 64, 128, 256), epochs=(1, 3, 5),
+              machine_id=0, total_machines=4, save_dir="models", seed=42, metric='f1', out_path=None):
+    """
+    Train and evaluate every (lr, batch_size, epochs) combination on this node's data.
+    Configurations sharing a batch size are trained together (one pass over
+    the data per epoch for all learning rates), and every epoch count is a
+    snapshot of the same run, so the cost is one training run per batch size.
+    Every configuration starts from the same initial weights.
+    Returns:
+        Leaderboard rows (dicts), best first by `metric`
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+    set_seed(seed)
+    preprocessor = load_or_fit_preprocessor(save_dir)
+    X_train, y_train, X_test, y_test = load_and_preprocess_data(machine_id=machine_id, total_machines=total_machines,
+                                                                preprocessor=preprocessor)
+    model = SimpleBinaryClassifier(X_train.shape[1])
+    initial = torch.cat([model.output_layer.weight.detach().view(-1), model.output_layer.bias.detach()])
+    test_loader = BatchLoader(X_test, y_test, batch_size=max(batch_sizes))
+    epochs = sorted(set(epochs))
+    results = []
+    start = time.perf_counter()
+    for batch_size in batch_sizes:
+        group_start = time.perf_counter()
+        snapshots = train_stacked(X_train, y_train, initial.expand(len(lrs), -1).clone(), lrs, epochs,
+                                  batch_size, seed)
+        logger.info(f"Batch size {batch_size}: {len(lrs) * len(epochs)} configs trained in "
+                    f"{time.perf_counter() - group_start:.2f}s")
+        for (epoch, theta), (i, lr) in itertools.product(snapshots.items(), enumerate(lrs)):
+            with torch.no_grad():
+                model.output_layer.weight.copy_(theta[i, :-1].view_as(model.output_layer.weight))
+                model.output_layer.bias.copy_(theta[i, -1:])
+            acc, prec, rec, f1 = evaluate(model, test_loader)
+            curves = evaluate_curves(model, test_loader)
+            results.append({'lr': lr, 'batch_size': batch_size, 'epochs': epoch, 'accuracy': acc,
+                            'precision': prec, 'recall': rec, 'f1': f1, 'roc_auc': curves['roc_auc'],
+                            'pr_auc': curves['pr_auc'], 'best_threshold': curves['best_threshold']})
+    results.sort(key=lambda r: r[metric], reverse=True)
+    logger.info(f"Swept {len(results)} configurations in {time.perf_counter() - start:.2f}s")
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+        with open(out_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['rank'] + list(results[0]))
+            writer.writeheader()
+            for rank, row in enumerate(results, 1):
+                writer.writerow({'rank': rank, **row})
+        logger.info(f"Leaderboard written to {out_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep local training hyperparameters in one batched run")
+    parser.add_argument("--lrs", type=float, nargs='+', default=[1e-4, 3e-4, 1e-3, 3e-3, 1e-2], help="Learning rates")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[32, 64, 128, 256], help="Batch sizes")
+    parser.add_argument("--epochs", type=int, nargs='+', default=[1, 3, 5], help="Local epoch counts")
+    parser.add_argument("--machine-id", type=int, default=0, help="Index of this node's data partition")
+    parser.add_argument("--total-machines", type=int, default=4, help="Number of data partitions")
+    parser.add_argument("--metric", choices=METRICS, default='f1', help="Leaderboard ranking metric")
+    parser.add_argument("--top", type=int, default=10, help="Rows of the leaderboard to print")
+    parser.add_argument("--out", default=os.path.join("models", "sweep_leaderboard.csv"), help="Leaderboard CSV")
+    args = parser.parse_args()
+    results = run_sweep(args.lrs, args.batch_sizes, args.epochs, args.machine_id, args.total_machines,
+                        metric=args.metric, out_path=args.out)
+    headers = ['Rank', 'LR', 'Batch', 'Epochs', 'Accuracy', 'Precision', 'Recall', 'F1', 'ROC-AUC', 'PR-AUC']
+    rows = [[rank, r['lr'], r['batch_size'], r['epochs']] +
+            [f"{r[k]:.4f}" for k in ('accuracy', 'precision', 'recall', 'f1', 'roc_auc', 'pr_auc')]
+            for rank, r in enumerate(results[:args.top], 1)]
+    print(tabulate(rows, headers=headers, tablefmt='grid'))
@@ -1,6 +1,7 @@
 import grpc
 import model_pb2
 import model_pb2_grpc
+from grpc_client import channel_pool
 import yaml
 import time
 import logging
@@ -69,36 +70,26 @@ def test_peer_connection(peer_info):
     
     try:
         start_time = time.time()
-        channel = grpc.insecure_channel(address)
-        
-        # Try to create stub
-        try:
-            stub = model_pb2_grpc.FLPeerStub(channel)
+        with channel_pool.stub(address) as stub:
             results['grpc_available'] = True
-        except Exception as e:
-            results['error'] = f"gRPC stub creation failed: {str(e)}"
-            return results
         
-        # Try health check
-        try:
-            request = model_pb2.HealthCheckRequest(
-                peer_id="tester",
-                timestamp=str(time.time())
-            )
-            response = stub.HealthCheck(request, timeout=5)
-            results['health_check'] = True
-            results['latency'] = (time.time() - start_time) * 1000  # ms
-            
-        except grpc.RpcError as e:
-            results['error'] = f"RPC error: {e.code()}: {e.details()}"
-        except Exception as e:
-            results['error'] = f"Health check failed: {str(e)}"
+            # Try health check
+            try:
+                request = model_pb2.HealthCheckRequest(
+                    peer_id="tester",
+                    timestamp=str(time.time())
+                )
+                response = stub.HealthCheck(request, timeout=5)
+                results['health_check'] = True
+                results['latency'] = (time.time() - start_time) * 1000  # ms
+                
+            except grpc.RpcError as e:
+                results['error'] = f"RPC error: {e.code()}: {e.details()}"
+            except Exception as e:
+                results['error'] = f"Health check failed: {str(e)}"
             
     except Exception as e:
         results['error'] = f"Connection failed: {str(e)}"
-    finally:
-        if 'channel' in locals():
-            channel.close()
     
     return results
 
@@ -1,56 +1,242 @@
-from model import SimpleBinaryClassifier, set_seed, get_loss, get_optimizer
-from data import get_data_loaders
+from model import (SimpleBinaryClassifier, set_seed, get_loss, get_optimizer, confusion_counts, metrics_from_counts,
+                   threshold_sweep, ThresholdHistogram)
+from data import get_data_loaders, load_or_fit_preprocessor, BatchLoader
+from solvers import SOLVERS, SOLVER_FUNCTIONS, full_batch, penalty
+from privacy import DPSGD, ACCOUNTANT_FILE
 import torch
 import os
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import copy
+import time
 from tqdm import tqdm
 
-def evaluate(model, test_loader):
+EVAL_BATCH_SIZE = 8192  # Evaluation holds no activations for backward, so batches can be much larger
+
+def _eval_loader(test_loader):
+    """Re-batch BatchLoaders to EVAL_BATCH_SIZE rows so the test set takes a few forward passes."""
+    if isinstance(test_loader, BatchLoader) and test_loader.batch_size < EVAL_BATCH_SIZE:
+        test_loader = copy.copy(test_loader)
+        test_loader.batch_size = EVAL_BATCH_SIZE
+        test_loader.drop_last = False
+    return test_loader
+
+def confusion_matrix(model, test_loader, threshold=0.5):
+    """
+    [tp, fp, fn, tn] of model on test_loader at threshold, accumulated as a tensor batch by batch.
+    """
     model.eval()
-    all_preds = []
-    all_labels = []
+    counts = torch.zeros(4, dtype=torch.int64)
     with torch.no_grad():
-        for xb, yb in test_loader:
-            outputs = model(xb)
-            preds = (outputs > 0.5).float()
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(yb.cpu().numpy())
-    all_preds = [int(p[0]) for p in all_preds]
-    all_labels = [int(l[0]) for l in all_labels]
-    acc = accuracy_score(all_labels, all_preds)
-    prec = precision_score(all_labels, all_preds, zero_division=0)
-    rec = recall_score(all_labels, all_preds, zero_division=0)
-    f1 = f1_score(all_labels, all_preds, zero_division=0)
-    return acc, prec, rec, f1
-
-def train_local(epochs=3, batch_size=64, save_dir="models", machine_id=0, total_machines=4):
-    set_seed(42)
-    os.makedirs(save_dir, exist_ok=True)
-    train_loader, test_loader = get_data_loaders(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size)
-    input_dim = next(iter(train_loader))[0].shape[1]
-    model = SimpleBinaryClassifier(input_dim)
-    criterion = get_loss()
-    optimizer = get_optimizer(model)
+        for xb, yb in _eval_loader(test_loader):
+            counts += confusion_counts(yb, model(xb), threshold)
+    return counts
 
-    for epoch in range(epochs):
-        model.train()
+def evaluate(model, test_loader, threshold=0.5):
+    """
+    Accuracy, precision, recall and F1 of model on test_loader at threshold.
+    Returns:
+        acc, prec, rec, f1
+    """
+    return metrics_from_counts(confusion_matrix(model, test_loader, threshold))
+
+def predict_proba(model, test_loader):
+    """Predicted probabilities and labels for the whole test set, as (N,) tensors."""
+    model.eval()
+    probs, labels = [], []
+    with torch.no_grad():
+        for xb, yb in _eval_loader(test_loader):
+            probs.append(model(xb).view(-1))
+            labels.append(yb.view(-1))
+    return torch.cat(probs), torch.cat(labels)
+
+def evaluate_curves(model, test_loader, bins=None):
+    """
+    ROC/PR curves, ROC-AUC, PR-AUC and the best-F1 threshold from a single pass over test_loader.
+    Args:
+        bins: None for the exact sort-based sweep, or a number of histogram bins
+              to stream the test set in O(bins) memory (see model.ThresholdHistogram)
+    Returns:
+        dict as returned by model.threshold_sweep
+    """
+    if bins is None:
+        probs, labels = predict_proba(model, test_loader)
+        return threshold_sweep(labels, probs)
+    histogram = ThresholdHistogram(bins)
+    model.eval()
+    with torch.no_grad():
+        for xb, yb in _eval_loader(test_loader):
+            histogram.update(yb, model(xb))
+    return histogram.sweep()
+
+def format_curves(curves):
+    return (f"ROC-AUC: {curves['roc_auc']:.4f}  PR-AUC: {curves['pr_auc']:.4f}  "
+            f"Best F1: {curves['best_f1']:.4f} @ {curves['best_threshold']:.4f}")
+
+class Trainer:
+    """
+    Local trainer owned by a node for its whole lifetime.
+    Data loaders, the model and the optimizer are built once; each round only
+    loads the global weights into the existing parameters in place. The
+    optimizer's moment estimates are reset every round unless
+    keep_optimizer_state is set.
+    Args:
+        machine_id, total_machines, shard_dir, sparse, incremental: Local data, as for data.get_data_loaders
+        batch_size: Training batch size
+        save_dir: Directory holding the preprocessor and checkpoints
+        keep_optimizer_state: Carry Adam moments across rounds
+        lr: Learning rate
+        solver: 'adam' (minibatch epochs) or a full-batch solver from solvers.SOLVERS
+        l2: L2 penalty on the weights
+        prox: Proximal penalty toward the round's global model (FedProx mu)
+        dp_noise_multiplier: Train with DP-SGD at this noise multiplier (None: non-private)
+        dp_max_grad_norm: DP-SGD per-sample clipping bound
+        dp_delta: Delta of the reported (epsilon, delta) guarantee
+    """
+    def __init__(self, machine_id=0, total_machines=4, batch_size=64, save_dir="models", shard_dir=None,
+                 sparse=False, incremental=False, keep_optimizer_state=False, lr=0.001, solver='adam',
+                 l2=0.0, prox=0.0, dp_noise_multiplier=None, dp_max_grad_norm=1.0, dp_delta=1e-5):
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver '{solver}', expected one of {SOLVERS}")
+        if dp_noise_multiplier is not None and solver != 'adam':
+            raise ValueError("DP-SGD only applies to the minibatch 'adam' solver")
+        os.makedirs(save_dir, exist_ok=True)
+        self.machine_id = machine_id
+        self.save_dir = save_dir
+        self.incremental = incremental
+        self.keep_optimizer_state = keep_optimizer_state
+        self.solver = solver
+        self.l2 = l2
+        self.prox = prox
+        self.global_state = None
+        self._full_batch = None
+        self.dp = None
+        if dp_noise_multiplier is not None:
+            self.dp = DPSGD(dp_noise_multiplier, dp_max_grad_norm, dp_delta,
+                            accountant_path=os.path.join(save_dir, ACCOUNTANT_FILE))
+        self.preprocessor = load_or_fit_preprocessor(save_dir, shard_dir=shard_dir)
+        self.loader_args = dict(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size,
+                                shard_dir=shard_dir, sparse=sparse, preprocessor=self.preprocessor,
+                                incremental=incremental, save_dir=save_dir)
+        self.train_loader, self.test_loader = self._load_data()
+        self.input_dim = self.preprocessor.input_dim
+        self.model = SimpleBinaryClassifier(self.input_dim)
+        self.criterion = get_loss()
+        self.optimizer = get_optimizer(self.model, lr=lr)
+
+    def _load_data(self):
+        """(train_loader, test_loader) over the local data; called again every round when incremental."""
+        return get_data_loaders(**self.loader_args)
+
+    def configure(self, batch_size=None, threads=None):
+        """Change the training batch size and/or torch thread count (see autotune.py)."""
+        if batch_size is not None:
+            self.loader_args['batch_size'] = batch_size
+            self.train_loader.batch_size = batch_size
+        if threads is not None:
+            torch.set_num_threads(threads)
+
+    def load_global(self, state_dict):
+        """Copy global weights into the model's parameters (no new tensors or modules)."""
+        self.model.load_state_dict(state_dict)
+        if not self.keep_optimizer_state:
+            self.optimizer.state.clear()
+
+    def start_round(self, global_state=None, round_num=None):
+        """Prepare for a round: pick up appended rows (incremental), reseed shuffling, load the global model."""
+        if self.incremental:
+            self.train_loader, self.test_loader = self._load_data()
+            self._full_batch = None
+        if round_num is not None and hasattr(self.train_loader, 'set_seed'):
+            self.train_loader.set_seed(round_num)
+        if global_state is not None:
+            self.load_global(global_state)
+            self.global_state = {k: v.detach().clone() for k, v in global_state.items()}
+
+    def train_epoch(self, desc=None):
+        """One pass over the training data. Returns the mean training loss."""
+        self.model.train()
         epoch_loss = 0.0
-        progress_bar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{epochs}", leave=False, ncols=100)
-        for xb, yb in progress_bar:
-            optimizer.zero_grad()
-            outputs = model(xb)
-            loss = criterion(outputs, yb)
-            loss.backward()
-            optimizer.step()
+        batches = tqdm(self.train_loader, desc=desc, leave=False, ncols=100) if desc else self.train_loader
+        for xb, yb in batches:
+            self.optimizer.zero_grad()
+            outputs = self.model(xb)
+            loss = self.criterion(outputs, yb)
+            if self.dp is not None:
+                self.dp.backward(self.model, xb, yb, self.train_loader.batch_size / len(self.train_loader.dataset))
+                if self.l2 or self.prox:
+                    penalty(self.model, self.l2, self.prox, self.global_state).backward()
+            elif self.l2 or self.prox:
+                (loss + penalty(self.model, self.l2, self.prox, self.global_state)).backward()
+            else:
+                loss.backward()
+            self.reduce_gradients()
+            self.optimizer.step()
             epoch_loss += loss.item() * xb.size(0)
-            progress_bar.set_postfix({"Batch Loss": f"{loss.item():.4f}"})
-        avg_loss = epoch_loss / len(train_loader.dataset)
+            if desc:
+                batches.set_postfix({"Batch Loss": f"{loss.item():.4f}"})
+        if self.dp is not None:
+            self.dp.accountant.save()
+        return epoch_loss / len(self.train_loader.dataset)
+
+    def privacy_spent(self):
+        """Log line of the (epsilon, delta) spent so far by DP-SGD, across all rounds."""
+        return (f"[PRIVACY] epsilon: {self.dp.epsilon():.3f} at delta {self.dp.delta:g} after "
+                f"{self.dp.accountant.steps} DP-SGD steps (noise {self.dp.noise_multiplier}, clip {self.dp.max_grad_norm})")
+
+    def reduce_gradients(self):
+        """Hook between backward and the optimizer step (see parallel.DataParallelTrainer)."""
+
+    def solve(self, **kwargs):
+        """Fit the full training set with the configured full-batch solver. Returns (objective, iterations)."""
+        if self._full_batch is None:
+            self._full_batch = full_batch(self.train_loader)
+        X, y = self._full_batch
+        return SOLVER_FUNCTIONS[self.solver](self.model, X, y, l2=self.l2, prox=self.prox,
+                                            global_state=self.global_state, **kwargs)
+
+    def evaluate(self, threshold=0.5):
+        return evaluate(self.model, self.test_loader, threshold)
+
+    def evaluate_curves(self, bins=None):
+        return evaluate_curves(self.model, self.test_loader, bins)
+
+    def state_dict(self):
+        """Snapshot of the weights, safe to keep after the model trains on."""
+        return {k: v.detach().clone() for k, v in self.model.state_dict().items()}
+
+    def fit(self, epochs=3, global_state=None, round_num=None):
+        """Train one federated round with per-epoch logging. Returns the local state_dict."""
+        self.start_round(global_state, round_num)
+        if self.solver != 'adam':
+            start = time.perf_counter()
+            objective, iterations = self.solve()
+            acc, prec, rec, f1 = self.evaluate()
+            tqdm.write(f"[TRAIN][{self.solver}] Objective: {objective:.4f} | Iterations: {iterations} | "
+                       f"Time: {time.perf_counter() - start:.2f}s | Acc: {acc:.4f} | Prec: {prec:.4f} | Rec: {rec:.4f} | F1: {f1:.4f}")
+            return self.state_dict()
+        for epoch in range(epochs):
+            avg_loss = self.train_epoch()
+            acc, prec, rec, f1 = self.evaluate()
+            tqdm.write(f"[TRAIN][Epoch {epoch+1}/{epochs}] Loss: {avg_loss:.4f} | Acc: {acc:.4f} | Prec: {prec:.4f} | Rec: {rec:.4f} | F1: {f1:.4f}")
+        if self.dp is not None:
+            tqdm.write(self.privacy_spent())
+        return self.state_dict()
+
+def train_local(epochs=3, batch_size=64, save_dir="models", machine_id=0, total_machines=4, shard_dir=None,
+                sparse=False, dp_noise_multiplier=None, dp_max_grad_norm=1.0, dp_delta=1e-5):
+    set_seed(42)
+    trainer = Trainer(machine_id=machine_id, total_machines=total_machines, batch_size=batch_size,
+                      save_dir=save_dir, shard_dir=shard_dir, sparse=sparse, dp_noise_multiplier=dp_noise_multiplier,
+                      dp_max_grad_norm=dp_max_grad_norm, dp_delta=dp_delta)
+    for epoch in range(epochs):
+        avg_loss = trainer.train_epoch(desc=f"Epoch {epoch+1}/{epochs}")
         # Save model checkpoint
         checkpoint_path = os.path.join(save_dir, f"model_machine{machine_id}_epoch{epoch+1}.pt")
-        torch.save(model.state_dict(), checkpoint_path)
+        torch.save(trainer.model.state_dict(), checkpoint_path)
         # Evaluate
-        acc, prec, rec, f1 = evaluate(model, test_loader)
+        acc, prec, rec, f1 = trainer.evaluate()
         tqdm.write(f"[TRAIN] Epoch {epoch+1}/{epochs} - Loss: {avg_loss:.4f}")
         tqdm.write(f"[EVAL]  Accuracy: {acc:.4f}  Precision: {prec:.4f}  Recall: {rec:.4f}  F1: {f1:.4f}")
-    return model.state_dict()
-
+    tqdm.write(f"[EVAL]  {format_curves(trainer.evaluate_curves())}")
+    if trainer.dp is not None:
+        tqdm.write(trainer.privacy_spent())
+    return trainer.model.state_dict()
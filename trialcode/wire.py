@@ -0,0 +1,147 @@
+import json
+import struct
+import warnings
+import numpy as np
+import torch
+
+MAGIC = b"FLTW"
+VERSION = 1
+ALIGNMENT = 64  # Byte alignment of the payload and of every tensor in it
+MAX_HEADER_BYTES = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024  # Default piece size of encode_chunks
+
+# magic, version, header length
+_PREAMBLE = struct.Struct("<4sHI")
+
+# Tensor dtypes that can be sent, with their little-endian numpy equivalents
+DTYPES = {
+    torch.float64: '<f8',
+    torch.float32: '<f4',
+    torch.float16: '<f2',
+    torch.int64: '<i8',
+    torch.int32: '<i4',
+    torch.int16: '<i2',
+    torch.int8: 'i1',
+    torch.uint8: 'u1',
+    torch.bool: '?',
+}
+_NUMPY_DTYPES = set(DTYPES.values())
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def _segments(state_dict):
+    """The pieces of an encoded message in order: header, padding, and views of the tensor bytes."""
+    arrays, tensors, offset = [], [], 0
+    for name, value in state_dict.items():
+        if not torch.is_tensor(value):
+            raise TypeError(f"{name} is a {type(value).__name__}, only tensors can be encoded")
+        if value.dtype not in DTYPES:
+            raise TypeError(f"{name} has unsupported dtype {value.dtype}")
+        array = value.detach().cpu().contiguous().numpy().astype(DTYPES[value.dtype], copy=False)
+        offset = _align(offset)
+        tensors.append({'name': name, 'dtype': DTYPES[value.dtype], 'shape': list(array.shape),
+                        'offset': offset, 'nbytes': array.nbytes})
+        arrays.append(array)
+        offset += array.nbytes
+    header = json.dumps({'tensors': tensors, 'payload_bytes': offset}, separators=(',', ':')).encode()
+    head = _PREAMBLE.pack(MAGIC, VERSION, len(header)) + header
+    segments, position = [head, bytes(_align(len(head)) - len(head))], 0
+    for entry, array in zip(tensors, arrays):
+        segments += [bytes(entry['offset'] - position), array.reshape(-1).view(np.uint8).data]
+        position = entry['offset'] + entry['nbytes']
+    return segments
+
+
+def encode(state_dict):
+    """
+    Serialize a state_dict of tensors without pickle. Layout (version 1):
+    a preamble (MAGIC, uint16 version, uint32 header length), a UTF-8 JSON
+    header listing each tensor's name, dtype, shape and payload offset, then
+    one payload of raw little-endian tensor bytes. The payload and every
+    tensor in it start ALIGNMENT-aligned from the message start, so decode can view
+    the tensors in place. Each tensor is copied exactly once, into the output.
+    Returns:
+        bytes
+    """
+    return b''.join(_segments(state_dict))
+
+
+def encode_chunks(state_dict, chunk_size=CHUNK_SIZE):
+    """
+    The bytes of encode(state_dict) as chunk_size pieces (the last may be
+    shorter), produced lazily from the tensors: only the chunk being yielded
+    is held in memory, never the whole message.
+    """
+    parts, filled = [], 0
+    for segment in _segments(state_dict):
+        segment = memoryview(segment)
+        while len(segment):
+            take = min(chunk_size - filled, len(segment))
+            parts.append(segment[:take])
+            segment, filled = segment[take:], filled + take
+            if filled == chunk_size:
+                yield b''.join(parts)
+                parts, filled = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def is_encoded(data):
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def decode(data):
+    """
+    Deserialize the output of encode. Tensors are zero-copy views of data (no
+    code is run and nothing is copied on little-endian hosts), so they are
+    valid as long as data is and must be cloned before being modified in place.
+    Raises:
+        ValueError if data is not a well-formed version 1 message
+    """
+    view = memoryview(data)
+    if len(view) < _PREAMBLE.size:
+        raise ValueError("Message too short")
+    magic, version, header_bytes = _PREAMBLE.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a tensor wire message")
+    if version != VERSION:
+        raise ValueError(f"Unsupported tensor wire version {version}")
+    if header_bytes > min(MAX_HEADER_BYTES, len(view) - _PREAMBLE.size):
+        raise ValueError("Header length out of range")
+    try:
+        header = json.loads(bytes(view[_PREAMBLE.size:_PREAMBLE.size + header_bytes]))
+        tensors, payload_bytes = header['tensors'], int(header['payload_bytes'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed header: {e}")
+    payload_start = _align(_PREAMBLE.size + header_bytes)
+    if payload_start + payload_bytes != len(view):
+        raise ValueError(f"Expected {payload_start + payload_bytes} bytes, got {len(view)}")
+    state_dict = {}
+    for entry in tensors:
+        try:
+            name, dtype, shape = entry['name'], entry['dtype'], tuple(int(d) for d in entry['shape'])
+            offset, nbytes = int(entry['offset']), int(entry['nbytes'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Malformed tensor entry: {e}")
+        if dtype not in _NUMPY_DTYPES:
+            raise ValueError(f"{name} has unsupported dtype {dtype}")
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        if min(shape, default=0) < 0 or nbytes != count * dtype.itemsize or offset < 0 \
+                or offset + nbytes > payload_bytes:
+            raise ValueError(f"{name} does not fit in the payload")
+        array = np.frombuffer(view, dtype=dtype, count=count, offset=payload_start + offset)
+        if not array.dtype.isnative:
+            array = array.astype(array.dtype.newbyteorder('='))
+        state_dict[name] = _as_tensor(array.reshape(shape))
+    return state_dict
+
+
+def _as_tensor(array):
+    # torch has no read-only tensors and warns about views of immutable bytes; decode documents the caveat
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(array)